@@ -105,9 +105,10 @@ import GFNWE
 import open_metafile
 import plot_all_temporal
 from plot_all_temporal import *
-from plot_all_allometry import plot_allometry, process_tree_column
+from plot_all_allometry import plot_allometry
 from plot_all_allometry_species import plot_allometry_species
 from plot_age_only import *
+from tucson import read_rwl
 import itrdb_global_detailed_metadata 
 from itrdb_global_detailed_metadata import GlobalDetailedMetadataFetcher
 
@@ -714,7 +715,7 @@ def file_select():
 
 def configuration_dialog(fk, file_names_in_csv=True):
     # Initialize file_Column_Randoms for each file
-    file_Column_Randoms = [[0] * len(r['read.tucson'](file_path).colnames) for file_path in fk]
+    file_Column_Randoms = [[0] * len(read_rwl(file_path).columns) for file_path in fk]
     
     # Initialize dictionaries for geometric and bark correction rates
     geometric_correction_rates = [{} for _ in fk]
@@ -895,9 +896,7 @@ def configuration_dialog(fk, file_names_in_csv=True):
                     
                     if value_col:
                         # Get the tree sample names from the file being processed
-                        rwl_data = r['read.tucson'](file_path)
-                        with localconverter(rpy2.robjects.default_converter + pandas2ri.converter):
-                            tree_names = list(rwl_data.colnames)
+                        tree_names = list(read_rwl(file_path).columns)
                         
                         logger.info(f"Tree ring file sample names: {tree_names}")
                         
@@ -1032,10 +1031,8 @@ def configuration_dialog(fk, file_names_in_csv=True):
             entry_output_path.insert(0, path)
 
     def show_samples(file_path):
-        # 使用 rpy2 读取文件并获取列名
-        TR_input = r['read.tucson'](file_path)
-        with localconverter(rpy2.robjects.default_converter + pandas2ri.converter):
-            pdf_input = pandas2ri.rpy2py(TR_input)
+        # 读取文件并获取列名 (见 tucson)
+        pdf_input = read_rwl(file_path)
         
         # 创建弹出框显示列名
         sample_dialog = tk.Toplevel(dialog)
@@ -0,0 +1,490 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+allodb get_biomass 的纯 NumPy 实现
+
+allodb 的 get_biomass 对每个 (属, 种, 坐标) 组合做三件事:
+1. weight_allom: 按样本量、Köppen 气候相似度和分类学距离给方程表中每个方程赋权重;
+2. resample_agb / est_params: 按权重在各方程的 DBH 适用范围内重采样 AGB，
+   并拟合 log(AGB) = log(a) + b*log(DBH)，得到 a、b 和残差标准差 sigma;
+3. AGB = a * DBH^b * exp(sigma^2 / 2)。
+
+本模块把方程表、属-科对照表、Köppen 相似度矩阵和 kgc 的气候区网格一次性导出到
+一个带版本号的本地数据文件（需要 R + allodb，只执行一次），之后完全在 Python 中
+计算，不需要 R。坐标只通过所在 0.5° 网格的 Köppen 气候区起作用，因此拟合参数按
+(属, 种, 气候区) 缓存，同一物种同一气候区只拟合一次。
+
+与 R 版 get_biomass 的差异（即容差来源）:
+- allodb 用 runif 随机重采样 (nres=1e4，不设种子)，同一输入在 R 中多次调用的结果本身
+  就有约 0.5-1% 的波动；这里用分层均匀网格做确定性重采样，结果是 R 版的期望值。
+- 需要树高 (h) 的方程在这里无法求值（allodb 会用通用树高方程代入）。这些方程仍参与
+  加权，若它们在某个 (属, 种, 气候区) 上的权重占比超过 HEIGHT_WEIGHT_LIMIT，
+  get_biomass 改用 R 引擎计算该树种；R 不可用时给出一次警告并使用其余方程的拟合结果。
+在方程适用 DBH 范围内、且主要权重不落在需要树高的方程上时，与 get_biomass 的相对偏差
+应在 NATIVE_TOLERANCE (2%) 以内；tests/test_allodb_native.py 用保存的 R 输出检查，
+也可用 compare_with_r() 针对具体物种验证。
+"""
+
+import os
+import json
+import math
+import logging
+import warnings
+from collections import namedtuple
+
+import numpy as np
+
+# 数据文件格式版本 - 修改导出内容时递增
+TABLES_FORMAT_VERSION = 1
+
+# 默认数据文件位置，可以通过环境变量覆盖（与 TR_SNP_CACHE_DIR 等保持一致）
+DEFAULT_TABLES_FILE = os.environ.get(
+    'TR_SNP_ALLODB_TABLES',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache',
+                 f'allodb_tables_v{TABLES_FORMAT_VERSION}.npz'))
+
+# 与 R 版 get_biomass 的文档化容差（相对误差）
+NATIVE_TOLERANCE = 0.02
+
+# 需要树高的方程权重占比超过此值时，该树种交给 R 引擎计算
+HEIGHT_WEIGHT_LIMIT = 0.05
+
+# get_biomass 默认使用的因变量
+BIOMASS_VARIABLES = ("Total aboveground biomass", "Whole tree (above stump)")
+
+# weight_allom 的默认参数
+DEFAULT_WNA = 0.1
+DEFAULT_W95 = 500
+DEFAULT_NRES = 10000
+
+# 分类学权重: 同种 > 同属 > 同科 > 同类群(针叶/阔叶) > 其他
+TAXO_WEIGHTS = {
+    'species': 1.0,
+    'genus': 0.8,
+    'family': 0.5,
+    'group': 0.3,
+    'other': 1e-6,
+}
+
+# 通用类群方程的名称（equation_taxa 中出现）
+CONIFER_GROUP_NAMES = {'conifers', 'conifer', 'gymnosperms', 'softwoods', 'softwood'}
+BROADLEAF_GROUP_NAMES = {'broadleaf', 'broad-leaved', 'angiosperms', 'hardwoods',
+                         'hardwood', 'deciduous', 'dicots'}
+CONIFER_FAMILIES = {'pinaceae', 'cupressaceae', 'taxaceae', 'podocarpaceae',
+                    'araucariaceae', 'sciadopityaceae', 'taxodiaceae', 'cephalotaxaceae'}
+
+# 方程字符串中允许出现的函数和常量
+_EXPRESSION_NAMESPACE = {
+    'exp': np.exp,
+    'log': np.log,
+    'log10': np.log10,
+    'sqrt': np.sqrt,
+    'abs': np.abs,
+    'pi': np.pi,
+}
+
+AllodbParams = namedtuple('AllodbParams', ['a', 'b', 'sigma'])
+
+logger = logging.getLogger('biomass_estimation')
+
+
+# R 端导出脚本: 只取计算需要的列
+_EXPORT_R = """
+suppressPackageStartupMessages(library(allodb))
+data("equations", package = "allodb")
+data("genus_family", package = "allodb")
+data("koppenMatrix", package = "allodb")
+"""
+
+
+def _zone_cell(coords):
+    """坐标所在 kgc 0.5° 网格的中心 (经度, 纬度)"""
+    lon, lat = float(coords[0]), float(coords[1])
+    return (round(float(np.round(lon * 2 - 0.5)) / 2 + 0.25, 2),
+            round(float(np.round(lat * 2 - 0.5)) / 2 + 0.25, 2))
+
+
+def export_allodb_tables(output_file=None, coords=None):
+    """
+    从 R 中导出 allodb 的方程表、属-科表、Köppen 矩阵和 kgc 气候区网格
+
+    需要 rpy2、allodb 和 kgc，只需在有 R 的机器上执行一次，生成的文件可以复制到
+    没有 R 的批处理服务器上使用。
+
+    参数:
+    output_file: 输出文件路径，默认为 DEFAULT_TABLES_FILE
+    coords: 坐标列表；给出时气候区网格只保留这些坐标所在的网格 (用于生成很小的测试数据表，
+            方程表和权重表仍完整导出，结果与完整数据表相同)
+
+    返回:
+    str: 写出的文件路径
+    """
+    import rpy2.robjects
+    from rpy2.robjects import r, pandas2ri
+    from rpy2.robjects.conversion import localconverter
+
+    output_file = output_file or DEFAULT_TABLES_FILE
+    r(_EXPORT_R)
+
+    with localconverter(rpy2.robjects.default_converter + pandas2ri.converter):
+        equations = pandas2ri.rpy2py(r(
+            'equations[, c("equation_id", "equation_taxa", "equation_allometry", '
+            '"dependent_variable", "koppen", "dbh_min_cm", "dbh_max_cm", '
+            '"sample_size", "dbh_unit_CF", "output_units_CF")]'))
+        genus_family = pandas2ri.rpy2py(r('genus_family'))
+        koppen_matrix = pandas2ri.rpy2py(r('koppenMatrix'))
+        climate_zones = pandas2ri.rpy2py(r('kgc::climatezones'))
+        allodb_version = str(r('as.character(packageVersion("allodb"))')[0])
+
+    def _num(values):
+        return np.asarray(_to_numeric(values), dtype=float)
+
+    if coords is not None:
+        cells = {_zone_cell(c) for c in coords}
+        keep = [(round(float(lon), 2), round(float(lat), 2)) in cells
+                for lon, lat in zip(_num(climate_zones['Lon']), _num(climate_zones['Lat']))]
+        climate_zones = climate_zones[keep]
+
+    equation_records = []
+    for _, row in equations.iterrows():
+        equation_records.append({
+            'equation_id': str(row['equation_id']),
+            'equation_taxa': str(row['equation_taxa']),
+            'equation_allometry': str(row['equation_allometry']),
+            'dependent_variable': str(row['dependent_variable']),
+            'koppen': None if _is_missing(row['koppen']) else str(row['koppen']),
+        })
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+    np.savez_compressed(
+        output_file,
+        format_version=np.array(TABLES_FORMAT_VERSION),
+        allodb_version=np.array(allodb_version),
+        equations=np.array(json.dumps(equation_records)),
+        dbh_min_cm=_num(equations['dbh_min_cm']),
+        dbh_max_cm=_num(equations['dbh_max_cm']),
+        sample_size=_num(equations['sample_size']),
+        dbh_unit_cf=_num(equations['dbh_unit_CF']),
+        output_units_cf=_num(equations['output_units_CF']),
+        genus=np.array(genus_family['genus'].astype(str).tolist()),
+        family=np.array(genus_family['family'].astype(str).tolist()),
+        koppen_zone1=np.array(koppen_matrix['zone1'].astype(str).tolist()),
+        koppen_zone2=np.array(koppen_matrix['zone2'].astype(str).tolist()),
+        koppen_we=_num(koppen_matrix['wE']),
+        zone_lon=_num(climate_zones['Lon']),
+        zone_lat=_num(climate_zones['Lat']),
+        zone_cls=np.array(climate_zones['Cls'].astype(str).tolist()),
+    )
+    print(f"已导出allodb数据表 (allodb {allodb_version}): {output_file}")
+    return output_file
+
+
+def _to_numeric(values):
+    """把R导出的列转换为数值，无法转换的值记为NaN"""
+    import pandas as pd
+    return pd.to_numeric(values, errors='coerce')
+
+
+def _is_missing(value):
+    if value is None:
+        return True
+    try:
+        return bool(np.isnan(value))
+    except TypeError:
+        return str(value) in ('', 'NA', 'nan')
+
+
+def _uses_height(expression):
+    """方程是否需要树高 (h)"""
+    try:
+        code = compile(expression.replace('^', '**'), '<allodb equation>', 'eval')
+    except SyntaxError:
+        return False
+    return 'h' in code.co_names
+
+
+def _compile_allometry(expression):
+    """把R方程字符串翻译为可对NumPy数组求值的Python代码，无法翻译时返回None"""
+    code_text = expression.replace('^', '**')
+    try:
+        code = compile(code_text, '<allodb equation>', 'eval')
+    except SyntaxError:
+        return None
+    allowed = set(_EXPRESSION_NAMESPACE) | {'dbh'}
+    if any(name not in allowed for name in code.co_names):
+        # 需要树高(h)或其他变量的方程
+        return None
+    return code
+
+
+class AllodbTables:
+    """
+    已导出的 allodb 数据表及其上的 get_biomass 计算
+
+    参数:
+    tables_file: 由 export_allodb_tables 生成的 .npz 文件
+    """
+
+    def __init__(self, tables_file=None):
+        tables_file = tables_file or DEFAULT_TABLES_FILE
+        if not os.path.isfile(tables_file):
+            raise FileNotFoundError(
+                f"未找到allodb数据表: {tables_file}，请先在装有R的机器上运行 export_allodb_tables()")
+
+        with np.load(tables_file, allow_pickle=False) as data:
+            version = int(data['format_version'])
+            if version != TABLES_FORMAT_VERSION:
+                raise ValueError(f"allodb数据表版本不匹配: 文件为 v{version}，需要 v{TABLES_FORMAT_VERSION}")
+            self.allodb_version = str(data['allodb_version'])
+            records = json.loads(str(data['equations']))
+            dbh_min = data['dbh_min_cm']
+            dbh_max = data['dbh_max_cm']
+            sample_size = data['sample_size']
+            dbh_unit_cf = data['dbh_unit_cf']
+            output_units_cf = data['output_units_cf']
+            self.genus_family = {g.lower(): f.lower() for g, f in zip(data['genus'], data['family'])}
+            self.koppen_weights = {}
+            for z1, z2, we in zip(data['koppen_zone1'], data['koppen_zone2'], data['koppen_we']):
+                self.koppen_weights[(z1.lower(), z2.lower())] = float(we)
+            self.climate_zones = {
+                (round(float(lon), 2), round(float(lat), 2)): str(cls)
+                for lon, lat, cls in zip(data['zone_lon'], data['zone_lat'], data['zone_cls'])
+            }
+
+        # 保留可以在NumPy中求值的生物量方程；需要树高的方程 (code 为None) 只参与加权，
+        # 用于判断原生结果是否可信
+        self.equations = []
+        skipped = 0
+        for i, record in enumerate(records):
+            if record['dependent_variable'] not in BIOMASS_VARIABLES:
+                continue
+            code = _compile_allometry(record['equation_allometry'])
+            if code is None and not _uses_height(record['equation_allometry']):
+                skipped += 1
+                continue
+            names = [n.strip() for n in record['equation_taxa'].replace(';', '/').split('/') if n.strip()]
+            koppen = record['koppen']
+            self.equations.append({
+                'equation_id': record['equation_id'],
+                'taxa': names,
+                'koppen': [k.strip().lower() for k in koppen.split(';')] if koppen else [],
+                'code': code,
+                'dbh_min': dbh_min[i] if np.isfinite(dbh_min[i]) else 1.0,
+                'dbh_max': dbh_max[i] if np.isfinite(dbh_max[i]) else 200.0,
+                'sample_size': sample_size[i],
+                'dbh_unit_cf': dbh_unit_cf[i] if np.isfinite(dbh_unit_cf[i]) else 1.0,
+                'output_units_cf': output_units_cf[i] if np.isfinite(output_units_cf[i]) else 1.0,
+            })
+        if skipped:
+            logger.info(f"allodb原生后端跳过 {skipped} 个无法解析的方程")
+        self._height_mask = np.array([eq['code'] is None for eq in self.equations], dtype=bool)
+
+        self._params_cache = {}
+        self._height_share_cache = {}
+
+    def koppen_zone(self, coords):
+        """按 kgc 的 0.5° 网格取坐标所在的 Köppen 气候区，找不到时返回None"""
+        return self.climate_zones.get(_zone_cell(coords))
+
+    def _taxo_weight(self, names, genus, species, family, is_conifer):
+        full_name = f"{genus} {species}".strip().lower()
+        weight = TAXO_WEIGHTS['other']
+        for name in names:
+            lname = name.lower()
+            eq_genus = lname.split()[0]
+            if species and lname == full_name:
+                return TAXO_WEIGHTS['species']
+            if eq_genus == genus.lower():
+                weight = max(weight, TAXO_WEIGHTS['genus'])
+            elif family and (lname == family or self.genus_family.get(eq_genus) == family):
+                weight = max(weight, TAXO_WEIGHTS['family'])
+            elif (is_conifer and lname in CONIFER_GROUP_NAMES) or \
+                    (not is_conifer and lname in BROADLEAF_GROUP_NAMES):
+                weight = max(weight, TAXO_WEIGHTS['group'])
+        return weight
+
+    def weight_allom(self, genus, species, coords, wna=DEFAULT_WNA, w95=DEFAULT_W95):
+        """
+        计算每个方程的权重 (样本量权重 * 气候权重 * 分类学权重)
+
+        返回:
+        numpy数组: 与 self.equations 对应的权重
+        """
+        zone = self.koppen_zone(coords)
+        if zone is None:
+            raise ValueError(f"坐标 {coords} 不在Köppen气候区网格中")
+        zone = zone.lower()
+
+        family = self.genus_family.get(genus.lower())
+        is_conifer = family in CONIFER_FAMILIES
+
+        weights = np.empty(len(self.equations))
+        for i, eq in enumerate(self.equations):
+            w_e = max([self.koppen_weights.get((zone, k), 0.0) for k in eq['koppen']], default=0.0)
+            n = eq['sample_size']
+            w_n = wna if not np.isfinite(n) else 1 - math.exp(-n / w95 * math.log(20))
+            w_t = self._taxo_weight(eq['taxa'], genus, species, family, is_conifer)
+            weights[i] = w_n * w_e * w_t
+        return weights
+
+    def est_params(self, genus, species='', coords=(-76.8, 39.2), nres=DEFAULT_NRES):
+        """
+        估计 (属, 种, 坐标) 对应的幂函数参数 a、b、sigma
+
+        参数按 (属, 种, Köppen气候区) 缓存。需要树高的方程不参与重采样。
+        """
+        key = (genus.lower(), (species or '').lower(), self.koppen_zone(coords))
+        if key in self._params_cache:
+            return self._params_cache[key]
+
+        weights = np.where(self._height_mask, 0.0, self.weight_allom(genus, species or '', coords))
+        total = weights.sum()
+        if not total > 0:
+            raise ValueError(f"没有可用于 {genus} {species} 的allodb方程")
+
+        log_dbh = []
+        log_agb = []
+        counts = np.round(nres * weights / total).astype(int)
+        for eq, count in zip(self.equations, counts):
+            if count <= 0 or eq['code'] is None:
+                continue
+            # 分层均匀网格: allodb 随机重采样的确定性版本
+            dbh = eq['dbh_min'] + (np.arange(count) + 0.5) / count * (eq['dbh_max'] - eq['dbh_min'])
+            with np.errstate(all='ignore'):
+                agb = eval(eq['code'], {'__builtins__': {}}, dict(_EXPRESSION_NAMESPACE, dbh=dbh * eq['dbh_unit_cf']))
+                agb = np.broadcast_to(np.asarray(agb, dtype=float), dbh.shape) * eq['output_units_cf']
+            valid = np.isfinite(agb) & (agb > 0)
+            log_dbh.append(np.log(dbh[valid]))
+            log_agb.append(np.log(agb[valid]))
+
+        x = np.concatenate(log_dbh)
+        y = np.concatenate(log_agb)
+        if x.size < 3:
+            raise ValueError(f"{genus} {species} 的重采样点不足")
+
+        # 普通最小二乘拟合 log(agb) ~ log(dbh)
+        b, intercept = np.polyfit(x, y, 1)
+        residuals = y - (intercept + b * x)
+        sigma = math.sqrt(float(np.sum(residuals ** 2)) / (x.size - 2))
+        params = AllodbParams(a=math.exp(intercept), b=float(b), sigma=sigma)
+        self._params_cache[key] = params
+        return params
+
+    def height_weight_share(self, genus, species='', coords=(-76.8, 39.2)):
+        """
+        需要树高的方程在 (属, 种, 坐标) 上的权重占比 (0-1)，按 (属, 种, 气候区) 缓存
+        """
+        key = (genus.lower(), (species or '').lower(), self.koppen_zone(coords))
+        if key not in self._height_share_cache:
+            weights = self.weight_allom(genus, species or '', coords)
+            total = weights.sum()
+            self._height_share_cache[key] = float(weights[self._height_mask].sum() / total) if total > 0 else 0.0
+        return self._height_share_cache[key]
+
+    def get_biomass(self, dbh, genus, species='', coords=(-76.8, 39.2)):
+        """
+        与 allodb::get_biomass 对应的向量化计算
+
+        参数:
+        dbh: 胸径(cm)数组
+        genus, species: 属名和种加词
+        coords: 坐标元组 (经度, 纬度)
+
+        返回:
+        numpy数组: 地上生物量(kg)
+        """
+        params = self.est_params(genus, species, coords)
+        dbh = np.asarray(dbh, dtype=float)
+        return params.a * dbh ** params.b * math.exp(params.sigma ** 2 / 2)
+
+
+_TABLES = None
+# 已经警告过 (需要树高、R不可用) 的树种
+_HEIGHT_WARNED = set()
+
+
+def get_allodb_tables():
+    """获取当前进程的数据表（首次调用时加载）"""
+    global _TABLES
+    if _TABLES is None:
+        _TABLES = AllodbTables()
+    return _TABLES
+
+
+def requires_r(taxa, coords=(-76.8, 39.2)):
+    """
+    判断该树种是否应交给 R 引擎计算（需要树高的方程权重占比超过 HEIGHT_WEIGHT_LIMIT）
+
+    R 不可用时只给出一次警告并返回False，继续使用原生结果。
+    """
+    genus, species = _split_taxa(taxa)
+    try:
+        share = get_allodb_tables().height_weight_share(genus, species, coords)
+    except ValueError:
+        return False
+    if share <= HEIGHT_WEIGHT_LIMIT:
+        return False
+
+    from improved_allodb import get_allodb_engine
+    if get_allodb_engine() is not None:
+        return True
+    if taxa not in _HEIGHT_WARNED:
+        _HEIGHT_WARNED.add(taxa)
+        warnings.warn(f"{taxa} 在 {coords} 处 {share:.0%} 的方程权重需要树高，原生后端跳过了这些方程，"
+                      f"结果可能超出 {NATIVE_TOLERANCE:.0%} 容差 (R引擎不可用)")
+    return False
+
+
+def _split_taxa(taxa):
+    parts = taxa.split()
+    genus = parts[0] if parts else taxa
+    species = parts[1] if len(parts) > 1 else ''
+    return genus, species
+
+
+def get_biomass(dbh, taxa, coords=(-76.8, 39.2)):
+    """
+    原生后端的数组入口，接口与 improved_allodb.estimate_biomass_array 一致
+
+    参数:
+    dbh: 胸径(cm)数组
+    taxa: 树种分类信息，可以是属名或"属 种"格式
+    coords: 坐标元组 (经度, 纬度)
+
+    返回:
+    numpy数组: 与输入等长的生物量(kg)，无法估计时为NaN
+    """
+    dbh_values = np.atleast_1d(np.asarray(dbh, dtype=float))
+    if requires_r(taxa, coords):
+        from improved_allodb import get_allodb_engine
+        return get_allodb_engine().get_biomass(dbh_values, taxa, coords)
+    genus, species = _split_taxa(taxa)
+    try:
+        return get_allodb_tables().get_biomass(dbh_values, genus, species, coords)
+    except (ValueError, KeyError) as e:
+        print(f"原生allodb计算失败: {e}")
+        return np.full(dbh_values.shape, np.nan)
+
+
+def compare_with_r(taxa, coords=(-76.8, 39.2), dbh=None):
+    """
+    在一组DBH上比较原生后端与R版get_biomass，返回最大相对误差
+
+    需要rpy2和allodb，用于验证某个物种是否在 NATIVE_TOLERANCE 以内。
+    """
+    from improved_allodb import get_allodb_engine
+
+    engine = get_allodb_engine()
+    if engine is None:
+        raise RuntimeError("R allodb引擎不可用，无法比较")
+    dbh = np.geomspace(1, 150, 60) if dbh is None else np.asarray(dbh, dtype=float)
+    native = get_biomass(dbh, taxa, coords)
+    reference = engine.get_biomass(dbh, taxa, coords)
+    return relative_error(native, reference)
+
+
+def relative_error(native, reference):
+    """原生结果相对参考值 (R 输出) 的最大相对误差，忽略NaN"""
+    native = np.asarray(native, dtype=float)
+    reference = np.asarray(reference, dtype=float)
+    return float(np.nanmax(np.abs(native - reference) / reference))
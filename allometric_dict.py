@@ -5,17 +5,159 @@ import math
 import os
 import logging
 import pandas as pd
+import numpy as np
 
 # 导入改进的allodb接口和树种映射表
 try:
-    from improved_allodb import estimate_biomass_using_get_biomass
+    from improved_allodb import estimate_biomass_using_get_biomass, estimate_biomass_array
     from species_mapper import SPECIES_CODE_MAP
     ALLODB_AVAILABLE = True
 except ImportError:
     ALLODB_AVAILABLE = False
     logging.warning("improved_allodb模块未找到，将使用硬编码方程")
 
-def allometric_dict(dbh, species_code, lat, lon, logger=None):
+# 硬编码异速生长方程表: (树种代码, 方程形式, a, b)
+# 'loglinear': biomass = exp(a + b * ln(dbh))
+# 'power':     biomass = a * dbh^b
+# 按原 if 链的顺序排列，后面的条目覆盖前面的条目。
+# 原方程链中 QURU 一行写作 `... or 'QUVE'`，该条件恒为真，因此这一行对所有树种生效，
+# 只有排在它之后的条目才会覆盖它；'*' 条目保留了这一行为，以保证计算结果不变。
+ALLOMETRIC_EQUATIONS = [
+    # 北美树种
+    (('ABAM', 'ABBA', 'ABCO', 'ABMA'), 'loglinear', -3.1774, 2.6426),
+    (('ABLA',), 'loglinear', -2.3123, 2.3482),
+    (('ACRU', 'BELE'), 'loglinear', -1.9123, 2.3651),
+    (('ACSH',), 'loglinear', -2.0127, 2.4342),
+    (('CADE',), 'loglinear', -11.8235, 2.7334),
+    (('CYGL', 'CYOV'), 'loglinear', -1.326, 2.761),
+    (('CHNO', 'JUOC'), 'loglinear', -2.6327, 2.4757),
+    (('FAGR',), 'power', 0.084, 2.572),
+    (('JUOS', 'JUSC'), 'loglinear', -0.7152, 1.7029),
+    (('JUVI',), 'loglinear', -2.0336, 2.2592),
+    (('LALY', 'LAOC'), 'loglinear', -2.3012, 2.3853),
+    (('LITU',), 'loglinear', -2.48, 2.4835),
+    (('PCEN',), 'loglinear', -3.03, 2.5567),
+    (('PCGL',), 'loglinear', -2.1364, 2.3233),
+    (('PCMA',), 'loglinear', -1.7823, 2.1777),
+    (('PCPU',), 'loglinear', -2.1364, 2.3233),
+    (('PCRU',), 'loglinear', -2.0773, 2.3323),
+    (('PCSI',), 'loglinear', -3.03, 2.5567),
+    (('PIAR', 'PIBA', 'PICO', 'PIEC', 'PIJE', 'PILO', 'PIMR', 'PIPA', 'PIPU'), 'loglinear', -3.0506, 2.6465),
+    (('PIED', 'PIRE', 'PIRI', 'PITA'), 'loglinear', -2.5356, 2.4349),
+    (('PIFL', 'PILA', 'PIPO', 'PIAL', 'PISF'), 'loglinear', -2.6177, 2.4638),
+    (('PIST',), 'loglinear', 5.2831, 2.0369),
+    (('PIVI',), 'loglinear', -2.5918, 2.422),
+    (('PPDE', 'PPGR'), 'loglinear', -2.2094, 2.3867),
+    (('PPTR',), 'loglinear', 4.4564, 2.4486),
+    (('PSMA',), 'loglinear', -2.4623, 2.4852),
+    (('PSME',), 'loglinear', -2.3298, 2.4818),
+    (('QUAL', 'QUCO'), 'loglinear', -2.0127, 2.4342),
+    (('QUDG',), 'power', 0.0683, 2.5697),
+    (('QUFA', 'QULO', 'QULY'), 'loglinear', -2.0127, 2.4342),
+    (('QUMA', 'QUMU', 'QUPA'), 'power', 0.1447, 2.282),
+    (('*',), 'loglinear', -2.0127, 2.4342),  # QURU, QUSH, QUST, QUVE 及其他所有树种
+    (('TADI', 'THPL', 'TSCR', 'TSHE', 'TSME', 'LIDE'), 'loglinear', -2.7096, 2.1942),
+    (('THOC',), 'loglinear', -2.0336, 2.2592),
+    (('TSCA',), 'loglinear', -2.2304, 2.4435),
+    (('CADN',), 'loglinear', -2.0705, 2.441),
+    (('CDAT', 'CDLI'), 'loglinear', -2.5356, 2.4349),  # 大西洋雪松和黎巴嫩雪松使用针叶树的通用方程
+    (('CHLA',), 'loglinear', -2.6327, 2.4757),
+    (('MIXD',), 'loglinear', -2.5497, 2.5011),
+    (('PINE',), 'loglinear', -2.6177, 2.4638),
+    (('PISP',), 'loglinear', -3.2007, 2.5339),
+    (('PITO',), 'loglinear', -2.6177, 2.4638),
+    (('PLRA',), 'loglinear', -3.0506, 2.6465),
+    (('QUCF', 'QUSP'), 'loglinear', -2.0705, 2.4410),
+    (('SAPC',), 'loglinear', -2.6863, 2.4561),
+]
+
+
+def _build_coefficient_registry(equations):
+    """按顺序展开方程表，返回 (树种代码->(形式, a, b) 字典, 默认方程)"""
+    registry = {}
+    default = None
+    for codes, form, a, b in equations:
+        if '*' in codes:
+            # 通配条目覆盖之前的所有条目
+            registry = {}
+            default = (form, a, b)
+        else:
+            for code in codes:
+                registry[code] = (form, a, b)
+    return registry, default
+
+
+# 模块加载时展开一次
+_COEFFICIENTS, _DEFAULT_EQUATION = _build_coefficient_registry(ALLOMETRIC_EQUATIONS)
+
+
+def get_allometric_coefficients(species_code):
+    """返回树种对应的硬编码方程 (形式, a, b)"""
+    return _COEFFICIENTS.get(species_code, _DEFAULT_EQUATION)
+
+
+def allometric_biomass_array(dbh, species_code):
+    """
+    用硬编码方程批量计算生物量
+
+    参数:
+    dbh: 胸径(cm)数组
+    species_code: 树种代码
+
+    返回:
+    numpy数组: 与输入等长的生物量，dbh<=0或NaN时为NaN
+    """
+    dbh = np.asarray(dbh, dtype=float)
+    form, a, b = get_allometric_coefficients(species_code)
+    result = np.full(dbh.shape, np.nan)
+    valid = dbh > 0
+    if form == 'power':
+        result[valid] = a * np.power(dbh[valid], b)
+    else:
+        result[valid] = np.exp(a + b * np.log(dbh[valid]))
+    return result
+
+
+def allometric_dict_array(dbh, species_code, lat, lon, logger=None, backend=None, use_allodb=False):
+    """
+    allometric_dict 的数组版本 - 对整条序列一次计算
+
+    参数:
+    dbh: 胸径(cm)数组
+    species_code: 树种代码
+    lat, lon: 纬度和经度
+    logger: 日志记录器对象
+    backend: allodb计算后端 ('r' 或 'native')
+    use_allodb: 是否先用allodb对整个数组计算一次（失败或为NaN的值再用硬编码方程）
+
+    返回:
+    numpy数组: 与输入等长的生物量；没有树种代码时全部为-999
+    """
+    dbh = np.atleast_1d(np.asarray(dbh, dtype=float))
+    if not species_code:
+        if logger:
+            logger.warning(f"未找到树种代码")
+        return np.full(dbh.shape, -999.0)
+
+    biomass = np.full(dbh.shape, np.nan)
+    if use_allodb and ALLODB_AVAILABLE:
+        latin_name = SPECIES_CODE_MAP.get(species_code)
+        if latin_name and lat is not None and lon is not None:
+            try:
+                biomass = np.asarray(estimate_biomass_array(dbh, latin_name, coords=(lon, lat), backend=backend), dtype=float)
+            except Exception as e:
+                if logger:
+                    logger.error(f"使用allodb估算生物量失败: {e}, species_code={species_code}")
+
+    missing = np.isnan(biomass)
+    if np.any(missing):
+        biomass[missing] = allometric_biomass_array(dbh[missing], species_code)
+        if logger:
+            logger.info(f"使用硬编码方程计算生物量: species_code={species_code}, 数量={int(missing.sum())}")
+    return biomass
+
+
+def allometric_dict(dbh, species_code, lat, lon, logger=None, backend=None, use_allodb=True):
     """
     估算树木生物量 - 优先使用allodb包方程,回退到硬编码方程
     
@@ -25,6 +167,8 @@ def allometric_dict(dbh, species_code, lat, lon, logger=None):
     lat: 纬度
     lon: 经度
     logger: 日志记录器对象
+    backend: allodb计算后端 ('r' 或 'native'，见 improved_allodb.set_biomass_backend)
+    use_allodb: 是否先尝试用allodb计算；False时直接使用硬编码方程
     """
     biomass = 0
     
@@ -36,7 +180,7 @@ def allometric_dict(dbh, species_code, lat, lon, logger=None):
         return -999
         
     # 尝试使用allodb估算生物量
-    if ALLODB_AVAILABLE:
+    if use_allodb and ALLODB_AVAILABLE:
         try:
             latin_name = SPECIES_CODE_MAP.get(species_code)
             
@@ -45,7 +189,7 @@ def allometric_dict(dbh, species_code, lat, lon, logger=None):
                 if lat is not None and lon is not None:
                     coords = (lon, lat)
                 
-                result = estimate_biomass_using_get_biomass(dbh, latin_name, coords=coords)
+                result = estimate_biomass_using_get_biomass(dbh, latin_name, coords=coords, backend=backend)
                 if not result.empty and not pd.isna(result['agb'][0]):
                     if logger:
                         logger.info(f"使用allodb计算生物量成功: species_code={species_code}, latin_name={latin_name}, dbh={dbh}, biomass={result['agb'][0]}")
@@ -61,147 +205,12 @@ def allometric_dict(dbh, species_code, lat, lon, logger=None):
             if logger:
                 logger.error(f"使用allodb估算生物量失败: {e}, species_code={species_code}, dbh={dbh}")
     
-    # 如果allodb不可用或估算失败，回退到原有方法
-    # 北美树种
-    if (species_code == 'ABAM' or species_code == 'ABBA' or species_code == 'ABCO'
-    or species_code == 'ABMA'):
-        biomass = math.exp(-3.1774 + 2.6426 * math.log(dbh))
-
-    if (species_code == 'ABLA'):
-        biomass = math.exp(-2.3123  + 2.3482 * math.log(dbh))
-
-    if (species_code == 'ACRU' or species_code == 'BELE'):
-        biomass = math.exp(-1.9123 + 2.3651 * math.log(dbh))
-
-    if (species_code == 'ACSH'):
-        biomass = math.exp(-2.0127 + 2.4342 * math.log(dbh))
-
-    if (species_code == 'CADE'):
-        biomass = math.exp(-11.8235 + 2.7334 * math.log(dbh))
-
-    if (species_code == 'CYGL' or species_code == 'CYOV'):
-        biomass = math.exp(-1.326 + 2.761 * math.log(dbh))
-
-    if (species_code == 'CHNO'or species_code == 'JUOC'):
-        biomass = math.exp(-2.6327 + 2.4757 * math.log(dbh))
-
-    if (species_code == 'FAGR'):
-        biomass = 0.084 * math.pow(dbh,2.572)
-
-    if (species_code == 'JUOS' or species_code == 'JUSC'):
-        biomass = math.exp(-0.7152 + 1.7029 * math.log(dbh))
-
-    if (species_code == 'JUVI'):
-        biomass = math.exp(-2.0336 + 2.2592 * math.log(dbh))
-
-    if (species_code == 'LALY' or species_code == 'LAOC'):
-        biomass = math.exp(-2.3012 + 2.3853 * math.log(dbh))
-
-    if (species_code == 'LITU'):
-        biomass = math.exp(-2.48 + 2.4835 * math.log(dbh))
-
-    if (species_code == 'PCEN'):
-        biomass = math.exp(-3.03 + 2.5567 * math.log(dbh))
-
-    if (species_code == 'PCGL'):
-        biomass = math.exp(-2.1364 + 2.3233 * math.log(dbh))
-
-    if (species_code == 'PCMA'):
-        biomass = math.exp(-1.7823 + 2.1777 * math.log(dbh))
-
-    if (species_code == 'PCPU'):
-        biomass = math.exp(-2.1364 + 2.3233 * math.log(dbh))
-
-    if (species_code == 'PCRU'):
-        biomass = math.exp(-2.0773 + 2.3323 * math.log(dbh))
-
-    if (species_code == 'PCSI'):
-        biomass = math.exp(-3.03 + 2.5567 * math.log(dbh))
-
-    if (species_code == 'PIAR' or species_code == 'PIBA' or species_code == 'PICO' or species_code == 'PIEC'
-    or species_code == 'PIJE' or species_code == 'PILO' or species_code == 'PIMR' or species_code == 'PIPA'
-    or species_code == 'PIPU'):
-        biomass = math.exp(-3.0506 + 2.6465 * math.log(dbh))
-
-    if (species_code == 'PIED' or species_code == 'PIRE' or species_code == 'PIRI' or species_code == 'PITA'):
-        biomass = math.exp(-2.5356 + 2.4349 * math.log(dbh))
-
-    if (species_code == 'PIFL' or species_code == 'PILA' or species_code == 'PIPO' or species_code == 'PIAL'
-    or species_code == 'PISF'):
-        biomass = math.exp(-2.6177 + 2.4638 * math.log(dbh))
-
-    if (species_code == 'PIST'):
-        biomass = math.exp(5.2831 + 2.0369 * math.log(dbh))
-
-    if (species_code == 'PIVI'):
-        biomass = math.exp(-2.5918 + 2.422 * math.log(dbh))
-
-    if (species_code == 'PPDE' or species_code == 'PPGR'):
-        biomass = math.exp(-2.2094 + 2.3867 * math.log(dbh))
-
-    if (species_code == 'PPTR'):
-        biomass = math.exp(4.4564 + 2.4486 * math.log(dbh))
-
-    if (species_code == 'PSMA'):
-        biomass = math.exp(-2.4623 + 2.4852 * math.log(dbh))
-
-    if (species_code == 'PSME'):
-        biomass = math.exp(-2.3298 + 2.4818 * math.log(dbh))
-
-    if (species_code == 'QUAL' or species_code == 'QUCO'):
-        biomass = math.exp(-2.0127 + 2.4342 * math.log(dbh))
-
-    if (species_code == 'QUDG'):
-        biomass = 0.0683*math.pow(dbh,2.5697)
-
-    if (species_code == 'QUFA' or species_code == 'QULO' or species_code == 'QULY'):
-        biomass = math.exp(-2.0127 + 2.4342 * math.log(dbh))
-
-    if (species_code == 'QUMA' or species_code == 'QUMU' or species_code == 'QUPA'):
-        biomass = 0.1447* math.pow(dbh,2.282)
-
-    if (species_code == 'QURU' or species_code == 'QUSH' or species_code == 'QUST' or 'QUVE'):
-        biomass = math.exp(-2.0127 + 2.4342 * math.log(dbh))
-
-    if (species_code == 'TADI' or species_code =='THPL' or species_code == 'TSCR' or species_code == 'TSHE' or
-    species_code == 'TSME' or species_code == 'LIDE'):
-        biomass = math.exp(-2.7096 + 2.1942 * math.log(dbh))
-
-    if (species_code == 'THOC'):
-        biomass = math.exp(-2.0336 + 2.2592 * math.log(dbh))
-
-    if (species_code == 'TSCA'):
-        biomass = math.exp(-2.2304 + 2.4435 * math.log(dbh))
-
-    if (species_code == 'CADN'):
-        biomass = math.exp(-2.0705 + 2.441 * math.log(dbh))
-
-    if (species_code == 'CDAT' or species_code == 'CDLI'):  # 大西洋雪松和黎巴嫩雪松使用相似方程
-        biomass = math.exp(-2.5356 + 2.4349 * math.log(dbh))  # 使用针叶树的通用方程
-
-    if (species_code == 'CHLA'):
-        biomass = math.exp(-2.6327 + 2.4757 * math.log(dbh))
-
-    if (species_code == 'MIXD'):
-        biomass = math.exp(-2.5497 + 2.5011 * math.log(dbh))
-
-    if (species_code == 'PINE'):
-        biomass = math.exp(-2.6177 + 2.4638 * math.log(dbh))
-
-    if (species_code == 'PISP'):
-        biomass = math.exp(-3.2007 + 2.5339 * math.log(dbh))
-
-    if (species_code == 'PITO'):
-        biomass = math.exp(-2.6177 + 2.4638 * math.log(dbh))
-
-    if (species_code == 'PLRA'):
-        biomass = math.exp(-3.0506 + 2.6465 * math.log(dbh))
-
-    if (species_code == 'QUCF' or species_code == 'QUSP'):
-        biomass = math.exp(-2.0705 + 2.4410 * math.log(dbh))
-
-    if (species_code == 'SAPC'):
-        biomass = math.exp(-2.6863 + 2.4561 * math.log(dbh))
+    # 如果allodb不可用或估算失败，回退到硬编码方程
+    form, a, b = get_allometric_coefficients(species_code)
+    if form == 'power':
+        biomass = a * math.pow(dbh, b)
+    else:
+        biomass = math.exp(a + b * math.log(dbh))
         
     if logger:
         logger.info(f"使用硬编码方程计算生物量: species_code={species_code}, dbh={dbh}, biomass={biomass}")
@@ -1,53 +1,102 @@
 #The function is to get the bark width estimations from existing publications
 
 import csv
-import math
 import os
+import re
+
+import numpy as np
+
+# 树皮厚度方程表 (单侧厚度, cm) 来自 formula.csv 中的文献方程 (species, bark with formula (cm) 两列)，
+# 模块加载时读取一次；标量函数 bark_dict_species 和数组函数 bark_thickness_array 使用同一张表。
+# 未列出的树种使用 DEFAULT_BARK_RATIO * dbh
+FORMULA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'formula.csv')
+
+# 未知树种的默认树皮厚度比例 (5% of dbh)
+DEFAULT_BARK_RATIO = 0.05
+
+# 方程中允许出现的函数 (formula.csv 中写作 math.sqrt 等)
+_FORMULA_NAMESPACE = {
+    'sqrt': np.sqrt,
+    'exp': np.exp,
+    'log': np.log,
+}
+
+
+def _compile_formula(formula):
+    """把 formula.csv 中的 'BT = ...' 方程翻译为可对NumPy数组求值的代码"""
+    expression = formula.split('=', 1)[1].strip()
+    expression = expression.replace('math.', '').replace('^', '**')
+    expression = re.sub(r'\bDBH\b', 'dbh', expression)
+    code = compile(expression, '<bark formula>', 'eval')
+    unknown = set(code.co_names) - set(_FORMULA_NAMESPACE) - {'dbh'}
+    if unknown:
+        raise ValueError(f"树皮方程中有未知变量 {sorted(unknown)}: {formula}")
+    return code
+
+
+def load_bark_equations(formula_file=FORMULA_FILE):
+    """
+    读取 formula.csv 的树皮方程
+
+    返回:
+    [(树种代码, 拉丁名, 方程字符串), ...]；拉丁名去掉括号中的俗名，按 species_mapper 映射为树种代码
+    """
+    from species_mapper import SPECIES_CODE_MAP
+    codes = {latin.lower(): code for code, latin in SPECIES_CODE_MAP.items()}
+
+    equations = []
+    with open(formula_file, newline='', encoding='utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            latin = re.sub(r'\(.*?\)', '', row['species']).strip()
+            code = codes.get(latin.lower())
+            if code is None:
+                raise ValueError(f"formula.csv 中的树种没有对应的树种代码: {latin}")
+            equations.append((code, latin, row['bark with formula (cm)'].strip()))
+    return equations
+
+
+BARK_EQUATIONS = load_bark_equations()
+
+# 模块加载时编译一次: 树种代码 -> 方程代码
+_BARK_REGISTRY = {code: _compile_formula(formula) for code, _, formula in BARK_EQUATIONS}
+
+
+def bark_thickness_array(species, dbh, region=None):
+    """
+    按树种的树皮方程对任意形状的直径数组一次计算
+
+    参数:
+    species: 树种代码
+    dbh: 胸径(cm)数组，如 (年份, 样本) 或 (随机值, 年份, 样本) 矩阵；NaN保持为NaN
+    region: 未使用，保留与 bark_dict_species 一致的接口
+
+    返回:
+    numpy数组: 与输入形状相同的单侧树皮厚度(cm)
+
+    方程在某个直径上无定义时（如 Liepiņš 方程根号内为负）抛出 ValueError
+    """
+    dbh = np.asarray(dbh, dtype=float)
+    code = _BARK_REGISTRY.get(species)
+    if code is None:
+        return DEFAULT_BARK_RATIO * dbh
+    with np.errstate(divide='ignore', invalid='ignore'):
+        thickness = np.asarray(eval(code, {'__builtins__': {}}, dict(_FORMULA_NAMESPACE, dbh=dbh)), dtype=float)
+    if np.any(np.isnan(thickness) & ~np.isnan(dbh)):
+        raise ValueError(f"math domain error: bark equation for {species}")
+    return np.broadcast_to(thickness, dbh.shape)
+
 
 def bark_dict_species(region, species, dbh):
     """
     Calculate bark thickness based on species and dbh
-    
+
     Parameters:
     region: region identifier (not used in most formulas but kept for compatibility)
     species: species code (e.g., 'BEPE', 'PISY')
     dbh: diameter at breast height in cm
-    
+
     Returns:
-    bark_thickness: single-side bark thickness in cm
+    bark_thickness: single-side bark thickness in cm (array for array input)
     """
-    
-    # Species code to formula mapping
-    if species == "BEPE":  # Betula pendula (European white birch)
-        # Formula: BT = (dbh * (1 - math.sqrt(1 - 25.502 * dbh**(-0.289) / 100)))/2
-        bark_thickness = (dbh * (1 - math.sqrt(1 - 25.502 * dbh**(-0.289) / 100)))/2
-    
-    elif species == "FASY":  # Fagus sylvatica (European beech)
-        # Formula: BT = (0.01149*DBH^0.8516)/100
-        bark_thickness = (0.01149 * dbh**0.8516) / 100
-    
-    elif species == "PCAB":  # Picea abies (Norway spruce)
-        # Formula: BT = (0.02408*DBH^0.8723)/100
-        bark_thickness = (0.02408 * dbh**0.8723) / 100
-    
-    elif species == "PIPN":  # Pinus pinaster (Maritime pine)
-        # Formula: BT = 0.103*DBH^1.023
-        bark_thickness = 0.103 * dbh**1.023
-    
-    elif species == "PISY":  # Pinus sylvestris (Scots pine)
-        # Formula: BT = (dbh * (1 - math.sqrt(1 - 75.492 * dbh**(-0.654) / 100)))/2
-        bark_thickness = (dbh * (1 - math.sqrt(1 - 75.492 * dbh**(-0.654) / 100)))/2
-    
-    elif species == "PONI":  # Populus nigra (Black poplar)
-        # Formula: BT = 0.081*DBH
-        bark_thickness = 0.081 * dbh
-    
-    elif species == "QUPE":  # Quercus petraea (Sessile Oak)
-        # Formula: BT = (0.02748*DBH^0.6759)/100
-        bark_thickness = (0.02748 * dbh**0.6759) / 100
-    
-    else:
-        # Default thickness for unknown species (5% of dbh)
-        bark_thickness = 0.05 * dbh
-    
-    return bark_thickness
+    bark_thickness = bark_thickness_array(species, dbh, region)
+    return float(bark_thickness) if bark_thickness.ndim == 0 else bark_thickness
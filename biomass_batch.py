@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+站点级生物量批处理
+
+一个站点的所有样本、所有随机值、原始直径和校正直径使用同一个生物量方程
+（同一树种和坐标）。SiteBiomassBatch 先收集站点需要的全部直径，去掉NaN并去重后
+只发起一次生物量计算，再把结果按原来的位置分发回各个变量。
+
+同一 (树种, 坐标) 的请求不会拆成多次调用: R 版 get_biomass 每次调用都重新随机
+拟合，拆开计算会让同一条序列的生物量来自不同的拟合。多核并发在站点或分组之间
+进行 (见 biomass_planner)。
+
+使用方法:
+    batch = SiteBiomassBatch()
+    handle = batch.add(valid_diameters)
+    ...
+    batch.evaluate(lambda d: cached_calculate_biomass_batch(d, species_code, lat, lon))
+    biomass_values = batch.result(handle)
+"""
+
+import numpy as np
+
+
+class SiteBiomassBatch:
+    """收集一个站点的直径请求，统一去重计算后分发结果"""
+
+    def __init__(self):
+        self._requests = []
+        self._results = None
+        self.n_requested = 0
+        self.n_unique = 0
+
+    def add(self, diameters):
+        """
+        登记一组直径，返回用于取回结果的句柄
+
+        参数:
+        diameters: 直径(cm)数组，NaN不会被计算，结果中保持为NaN
+        """
+        values = np.atleast_1d(np.asarray(diameters, dtype=float))
+        self._requests.append(values)
+        self._results = None
+        return len(self._requests) - 1
+
+    def evaluate(self, biomass_function):
+        """
+        对所有登记的直径去重后，用一次调用计算生物量
+
+        参数:
+        biomass_function: 计算函数，输入不含NaN的唯一直径数组，返回等长的生物量数组
+        """
+        if not self._requests:
+            self._results = []
+            return
+
+        sizes = [len(values) for values in self._requests]
+        all_values = np.concatenate(self._requests)
+        valid = np.isfinite(all_values)
+        unique_dbh, inverse = np.unique(all_values[valid], return_inverse=True)
+        self.n_requested = int(valid.sum())
+        self.n_unique = len(unique_dbh)
+
+        unique_agb = np.full(len(unique_dbh), np.nan)
+        if len(unique_dbh) > 0:
+            unique_agb = np.asarray(biomass_function(unique_dbh), dtype=float)
+
+        all_agb = np.full(len(all_values), np.nan)
+        all_agb[valid] = unique_agb[inverse]
+        self._results = np.split(all_agb, np.cumsum(sizes)[:-1])
+
+    def result(self, handle):
+        """取回 add() 返回的句柄对应的生物量数组"""
+        if self._results is None:
+            raise RuntimeError("请先调用 evaluate()")
+        return self._results[handle]
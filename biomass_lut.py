@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+AGB-DBH 查找表
+
+同一站点的所有生物量计算使用相同的树种和坐标，而 AGB 是 DBH 的光滑单调函数
+（allodb 的结果本身就是幂函数 a*DBH^b）。查找表模式下，每个 (树种, 坐标) 只在
+对数等距的 DBH 网格上精确计算一次，之后在 log(DBH)-log(AGB) 空间做线性插值：
+- 插值保持单调性，对幂函数是精确的；
+- 建表时在每个网格区间的中点与精确值比较，得到已验证的最大相对误差
+  (max_relative_error)，超过 tolerance 时加密网格重建；
+- 加密到 MAX_GRID_POINTS 仍未通过验证时不使用查找表，全部精确计算；
+- 网格范围之外或无法建表（AGB非正/非有限）时回退到精确计算。
+
+查找表按 (生物量后端, 树种, 坐标) 区分，切换后端后不会沿用旧后端的表。
+"""
+
+import os
+import threading
+
+import numpy as np
+
+# 生物量计算模式: 'exact' 逐值精确计算，'lut' 使用查找表
+BIOMASS_MODES = ('exact', 'lut')
+_BIOMASS_MODE = os.environ.get('TR_SNP_BIOMASS_MODE', 'exact')
+
+# 默认网格参数 (DBH单位: cm)
+DEFAULT_DBH_MIN = 0.01
+DEFAULT_DBH_MAX = 500.0
+DEFAULT_GRID_POINTS = 256
+DEFAULT_TOLERANCE = 1e-3
+MAX_GRID_POINTS = 8192
+
+
+def set_biomass_mode(mode):
+    """
+    选择生物量计算模式
+
+    参数:
+    mode: 'exact' (默认) 或 'lut'
+    """
+    global _BIOMASS_MODE
+    if mode not in BIOMASS_MODES:
+        raise ValueError(f"未知的生物量模式: {mode}，可选: {', '.join(BIOMASS_MODES)}")
+    _BIOMASS_MODE = mode
+
+
+def get_biomass_mode():
+    """返回当前的生物量计算模式"""
+    return _BIOMASS_MODE
+
+
+class BiomassLookupTable:
+    """
+    单个 (树种, 坐标) 的 AGB(DBH) 查找表
+
+    参数:
+    exact_function: 精确计算函数，输入DBH数组，返回等长的AGB数组
+    dbh_min, dbh_max: 网格范围(cm)
+    grid_points: 初始网格点数
+    tolerance: 允许的最大相对误差，超过时加密网格
+    """
+
+    def __init__(self, exact_function, dbh_min=DEFAULT_DBH_MIN, dbh_max=DEFAULT_DBH_MAX,
+                 grid_points=DEFAULT_GRID_POINTS, tolerance=DEFAULT_TOLERANCE):
+        self.exact_function = exact_function
+        self.dbh_min = dbh_min
+        self.dbh_max = dbh_max
+        self.tolerance = tolerance
+        self.log_dbh = None
+        self.log_agb = None
+        self.max_relative_error = np.inf
+
+        n = grid_points
+        while not self._build(n):
+            if n >= MAX_GRID_POINTS:
+                # 未通过验证的表不使用，全部精确计算 (max_relative_error 保留用于诊断)
+                self.log_dbh = None
+                self.log_agb = None
+                break
+            n *= 2
+
+    def _build(self, n):
+        """在n点网格上建表并验证，返回是否满足tolerance"""
+        log_grid = np.linspace(np.log(self.dbh_min), np.log(self.dbh_max), n)
+        log_mid = (log_grid[:-1] + log_grid[1:]) / 2
+
+        # 网格点和检查点在一次调用中计算，保证使用同一组方程参数
+        values = np.asarray(self.exact_function(np.exp(np.concatenate([log_grid, log_mid]))), dtype=float)
+        agb_grid = values[:n]
+        agb_mid = values[n:]
+        if not (np.all(np.isfinite(values)) and np.all(values > 0)):
+            # 无法在对数空间插值，全部回退到精确计算
+            self.log_dbh = None
+            self.max_relative_error = np.inf
+            return True
+
+        log_agb = np.log(agb_grid)
+        interpolated = np.exp(np.interp(log_mid, log_grid, log_agb))
+        error = float(np.max(np.abs(interpolated - agb_mid) / agb_mid))
+
+        self.log_dbh = log_grid
+        self.log_agb = log_agb
+        self.max_relative_error = error
+        return error <= self.tolerance
+
+    @property
+    def usable(self):
+        """查找表是否可用（否则所有值都精确计算）"""
+        return self.log_dbh is not None
+
+    def __call__(self, dbh):
+        """
+        计算AGB：网格内插值，网格外精确计算
+
+        参数:
+        dbh: 胸径(cm)数组
+
+        返回:
+        numpy数组: 与输入等长的AGB
+        """
+        dbh = np.atleast_1d(np.asarray(dbh, dtype=float))
+        if not self.usable:
+            return np.asarray(self.exact_function(dbh), dtype=float)
+
+        result = np.empty(dbh.shape)
+        inside = (dbh >= self.dbh_min) & (dbh <= self.dbh_max)
+        result[inside] = np.exp(np.interp(np.log(dbh[inside]), self.log_dbh, self.log_agb))
+        if not np.all(inside):
+            result[~inside] = np.asarray(self.exact_function(dbh[~inside]), dtype=float)
+        return result
+
+
+_TABLES = {}
+_TABLES_LOCK = threading.Lock()
+
+
+def get_lookup_table(key, exact_function, **kwargs):
+    """
+    获取（首次调用时构建）某个键对应的查找表
+
+    参数:
+    key: 可哈希的键，通常为 (生物量后端, 树种代码, 纬度, 经度)
+    exact_function: 精确计算函数，只在构建和网格外回退时调用
+    """
+    table = _TABLES.get(key)
+    if table is None:
+        with _TABLES_LOCK:
+            table = _TABLES.get(key)
+            if table is None:
+                table = BiomassLookupTable(exact_function, **kwargs)
+                _TABLES[key] = table
+    return table
+
+
+def clear_lookup_tables():
+    """清空所有查找表（例如切换生物量后端之后）"""
+    with _TABLES_LOCK:
+        _TABLES.clear()
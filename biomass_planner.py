@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+多站点生物量计算规划
+
+区域批量运行时，很多站点的树种相同、坐标也非常接近，但每个站点都单独计算生物量。
+BiomassPlanner 在处理站点之前先收集所有站点需要的直径，按 (拉丁名, 坐标网格)
+分组，每组只发起一次向量化的生物量计算；之后各站点按原流程输出结果，生物量从
+分组结果中精确查找。
+
+坐标网格与 allodb 使用的 kgc Köppen 网格一致（0.5°，取网格中心），allodb 的结果
+只通过所在网格的气候区依赖坐标，因此用网格中心代替站点坐标不改变结果。
+
+组内按树种代码分别计算: allodb 失败时回退的硬编码方程按树种代码选择，每个站点
+使用自己的树种代码。直径登记时立即合并为每个 (分组, 树种代码) 一个去重后的数组，
+调用方可以逐块登记后丢弃直径矩阵。
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from biomass_batch import SiteBiomassBatch
+
+# 坐标网格大小 (度)，与 kgc::climatezones 一致
+COORDINATE_BUCKET_SIZE = 0.5
+
+
+def coordinate_bucket(lat, lon, size=COORDINATE_BUCKET_SIZE):
+    """
+    返回坐标所在网格的中心 (纬度, 经度)；坐标缺失时返回 (None, None)
+
+    与 kgc 的取整方式相同: round(x / size - 0.5) * size + size / 2
+    """
+    if lat is None or lon is None:
+        return None, None
+
+    def center(x):
+        return round(float(np.round(float(x) / size - 0.5)) * size + size / 2, 6)
+
+    return center(lat), center(lon)
+
+
+class BiomassPlanner:
+    """
+    按 (拉丁名, 坐标网格) 汇总多个站点的生物量请求
+
+    使用方法:
+        planner = BiomassPlanner(species_map)
+        planner.add_site(species_code, lat, lon, diameters)   # 每个站点，可逐块多次调用
+        planner.evaluate(biomass_function)                    # 每组每个树种代码计算一次
+        agb = planner.lookup(species_code, lat, lon, diameters)
+
+    参数:
+    species_map: 树种代码 -> 拉丁名 的字典（未找到时使用树种代码本身）
+    """
+
+    def __init__(self, species_map=None):
+        self.species_map = species_map or {}
+        self._pending = {}
+        self._results = {}
+
+    def group_key(self, species_code, lat, lon):
+        """站点所属的分组键 (拉丁名, 网格纬度, 网格经度)"""
+        latin_name = self.species_map.get(species_code, species_code)
+        return (latin_name,) + coordinate_bucket(lat, lon)
+
+    def add_site(self, species_code, lat, lon, diameters):
+        """登记一个站点需要的直径（可多次调用），返回分组键"""
+        key = self.group_key(species_code, lat, lon)
+        group = self._pending.setdefault(key, {})
+        values = np.asarray(diameters, dtype=float)
+        values = np.unique(values[np.isfinite(values)])
+        previous = group.get(species_code)
+        group[species_code] = values if previous is None else np.union1d(previous, values)
+        return key
+
+    def evaluate(self, biomass_function, workers=1, logger=None):
+        """
+        对每个分组的唯一直径计算一次生物量
+
+        参数:
+        biomass_function: biomass_function(species_code, lat, lon, dbh) 返回与dbh等长的生物量；
+                          lat/lon 为网格中心，species_code 为登记时站点的树种代码
+        workers: >1 时多个分组并发计算（配合 biomass_pool 使用多核）；同一分组、同一树种代码只调用一次
+        logger: 日志记录器
+        """
+        def evaluate_group(item):
+            (key, species_code), dbh = item
+            latin_name, lat_c, lon_c = key
+            batch = SiteBiomassBatch()
+            handle = batch.add(dbh)
+            batch.evaluate(lambda d: biomass_function(species_code, lat_c, lon_c, d))
+            if logger:
+                logger.info(f"生物量分组 {latin_name} ({lat_c}, {lon_c}) [{species_code}]: 计算 {len(dbh)} 个唯一直径")
+            return (key, species_code), (dbh, batch.result(handle))
+
+        items = [((key, species_code), dbh)
+                 for key, group in self._pending.items() for species_code, dbh in group.items()]
+        if workers and workers > 1 and len(items) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                self._results.update(executor.map(evaluate_group, items))
+        else:
+            self._results.update(map(evaluate_group, items))
+        self._pending = {}
+
+    def lookup(self, species_code, lat, lon, diameters):
+        """
+        从分组结果中精确查找生物量
+
+        返回:
+        numpy数组；有直径不在分组结果中时返回None（调用方应直接计算）
+        """
+        result = self._results.get((self.group_key(species_code, lat, lon), species_code))
+        if result is None:
+            return None
+        dbh_sorted, agb_sorted = result
+        values = np.asarray(diameters, dtype=float)
+        finite = np.isfinite(values)
+        if len(dbh_sorted) == 0:
+            return None if np.any(finite) else np.full(values.shape, np.nan)
+        positions = np.clip(np.searchsorted(dbh_sorted, values), 0, len(dbh_sorted) - 1)
+        found = dbh_sorted[positions] == values
+        if not np.all(found[finite]):
+            return None
+        output = np.full(values.shape, np.nan)
+        output[finite] = agb_sorted[positions[finite]]
+        return output
+
+    def site_function(self, species_code, lat, lon, fallback):
+        """返回站点使用的生物量函数: 优先查分组结果，查不到时调用fallback(dbh)"""
+        def biomass_function(diameters):
+            values = self.lookup(species_code, lat, lon, diameters)
+            if values is None:
+                return fallback(diameters)
+            return values
+        return biomass_function
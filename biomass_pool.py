@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+常驻 R 生物量工作进程池
+
+单个 R 解释器是串行的，即使已经去掉 Rscript 启动开销，calculate_biomass_batch
+仍然只能用一个核心。本模块启动 N 个长期运行的工作进程，每个进程在启动时加载一次
+allodb（见 improved_allodb.AllodbEngine），主进程通过管道以二进制 float64 数组
+（send_bytes/recv_bytes，不经过文本或 pickle）收发 DBH 和 AGB。
+
+- 任务按 (拉丁名, 坐标) 分派：优先发往该键固定对应的工作进程，若它比其他进程更忙
+  则发往未完成任务最少的进程；
+- 工作进程崩溃（管道断开或进程退出）时自动重启，并重试一次该任务；
+- submit() 返回 concurrent.futures.Future。只有同时提交不同 (拉丁名, 坐标) 分组的任务时
+  才有并行收益 (plot_allometry 多文件运行时由 biomass_planner 并发提交)；同一分组的
+  直径只有一次拟合，不拆分到多个进程 (见 biomass_batch)，因此单站点运行不启动进程池。
+- 后端返回的结果长度与DBH不一致时按错误返回，调用方按原有流程回退并记录日志。
+
+使用方法:
+    pool = start_biomass_pool(workers=32)
+    ...  # calculate_biomass_batch 自动通过 get_active_biomass_pool() 使用进程池
+    shutdown_biomass_pool()
+"""
+
+import os
+import zlib
+import queue
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import Future
+
+import numpy as np
+
+
+def _worker_main(conn, backend):
+    """工作进程主循环: 加载一次allodb，然后反复处理 (拉丁名, 坐标, DBH数组) 请求"""
+    from improved_allodb import estimate_biomass_array, get_biomass_function
+
+    # 提前创建引擎，让allodb在第一个任务到达之前就已加载
+    get_biomass_function(backend)
+    conn.send(('ready', os.getpid()))
+
+    while True:
+        try:
+            header = conn.recv()
+        except EOFError:
+            break
+        if header is None:
+            break
+        taxa, coords = header
+        dbh = np.frombuffer(conn.recv_bytes(), dtype=np.float64)
+        try:
+            agb = np.asarray(estimate_biomass_array(dbh, taxa, coords=coords, backend=backend), dtype=np.float64)
+            if agb.shape != dbh.shape:
+                raise ValueError(f"生物量结果长度 {agb.size} 与DBH个数 {dbh.size} 不一致")
+            conn.send(('ok', None))
+            conn.send_bytes(agb.tobytes())
+        except Exception as e:
+            conn.send(('error', str(e)))
+    conn.close()
+
+
+class _Worker:
+    """主进程中的工作进程句柄: 一个子进程 + 一个负责收发的分派线程"""
+
+    def __init__(self, pool, index):
+        self.pool = pool
+        self.index = index
+        self.jobs = queue.Queue()
+        # 已提交但尚未完成的任务数（包括正在计算的任务）
+        self.pending = 0
+        self.process = None
+        self.conn = None
+        self.restarts = 0
+        self._start_process()
+        self.thread = threading.Thread(target=self._dispatch_loop, name=f"biomass-worker-{index}", daemon=True)
+        self.thread.start()
+
+    def _start_process(self):
+        ctx = self.pool.context
+        parent_conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, self.pool.backend), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        status, _ = self.conn.recv()
+        if status != 'ready':
+            raise RuntimeError(f"生物量工作进程 {self.index} 启动失败")
+
+    def _restart(self):
+        self.restarts += 1
+        print(f"生物量工作进程 {self.index} 已退出，正在重启 (第{self.restarts}次)")
+        try:
+            self.conn.close()
+        except OSError:
+            pass
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join(timeout=5)
+        self._start_process()
+
+    def _run_job(self, taxa, coords, dbh):
+        self.conn.send((taxa, coords))
+        self.conn.send_bytes(dbh.tobytes())
+        status, message = self.conn.recv()
+        if status != 'ok':
+            raise ValueError(message)
+        return np.frombuffer(self.conn.recv_bytes(), dtype=np.float64).copy()
+
+    def _dispatch_loop(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            future, taxa, coords, dbh = job
+            if not future.set_running_or_notify_cancel():
+                self._job_done()
+                continue
+            try:
+                try:
+                    result = self._run_job(taxa, coords, dbh)
+                except (EOFError, OSError):
+                    # 进程崩溃 - 重启后重试一次
+                    self._restart()
+                    result = self._run_job(taxa, coords, dbh)
+                self._job_done()
+                future.set_result(result)
+            except Exception as e:
+                self._job_done()
+                future.set_exception(e)
+
+    def _job_done(self):
+        with self.pool.lock:
+            self.pending -= 1
+
+    def shutdown(self):
+        self.jobs.put(None)
+        self.thread.join()
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class BiomassWorkerPool:
+    """
+    常驻allodb工作进程池
+
+    参数:
+    workers: 工作进程数，默认为CPU核心数
+    backend: 工作进程使用的生物量后端 ('r' 或 'native')，默认使用当前设置
+    """
+
+    def __init__(self, workers=None, backend=None):
+        from improved_allodb import get_biomass_backend
+
+        self.backend = backend or get_biomass_backend()
+        # R嵌入进程不能安全地fork，统一使用spawn
+        self.context = multiprocessing.get_context('spawn')
+        self.lock = threading.Lock()
+        n_workers = workers or os.cpu_count() or 1
+        self.workers = [_Worker(self, i) for i in range(n_workers)]
+
+    def _choose_worker(self, taxa, coords):
+        preferred = self.workers[zlib.crc32(f"{taxa}|{coords}".encode('utf-8')) % len(self.workers)]
+        least_busy = min(self.workers, key=lambda w: w.pending)
+        if preferred.pending > least_busy.pending:
+            return least_busy
+        return preferred
+
+    def submit(self, dbh, taxa, coords=(-76.8, 39.2)):
+        """
+        提交一个生物量计算任务
+
+        返回:
+        Future: 结果为与dbh等长的numpy数组
+        """
+        dbh_values = np.ascontiguousarray(np.atleast_1d(np.asarray(dbh, dtype=np.float64)))
+        coords = (float(coords[0]), float(coords[1]))
+        future = Future()
+        with self.lock:
+            worker = self._choose_worker(taxa, coords)
+            worker.pending += 1
+        worker.jobs.put((future, taxa, coords, dbh_values))
+        return future
+
+    def get_biomass(self, dbh, taxa, coords=(-76.8, 39.2)):
+        """提交任务并等待结果（阻塞）"""
+        return self.submit(dbh, taxa, coords).result()
+
+    def shutdown(self):
+        """停止所有工作进程"""
+        for worker in self.workers:
+            worker.shutdown()
+        self.workers = []
+
+
+_ACTIVE_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+def start_biomass_pool(workers=None, backend=None):
+    """
+    启动（或返回已启动的）全局工作进程池
+
+    calculate_biomass_batch 在进程池启动后会自动把计算分派给它。
+    """
+    global _ACTIVE_POOL
+    with _POOL_LOCK:
+        if _ACTIVE_POOL is None:
+            _ACTIVE_POOL = BiomassWorkerPool(workers=workers, backend=backend)
+            print(f"已启动 {len(_ACTIVE_POOL.workers)} 个生物量工作进程")
+        return _ACTIVE_POOL
+
+
+def get_active_biomass_pool():
+    """返回全局工作进程池，未启动时返回None"""
+    return _ACTIVE_POOL
+
+
+def shutdown_biomass_pool():
+    """停止全局工作进程池"""
+    global _ACTIVE_POOL
+    with _POOL_LOCK:
+        if _ACTIVE_POOL is not None:
+            _ACTIVE_POOL.shutdown()
+            _ACTIVE_POOL = None
+
+
+atexit.register(shutdown_biomass_pool)
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+持久化的生物量磁盘缓存
+
+allodb 的 get_biomass 对每个 (树种, 坐标) 先随机重采样并拟合幂函数参数，再计算
+AGB = a * DBH^b * exp(sigma^2 / 2)。R 版每次调用都重新拟合（不设种子），如果逐个 DBH
+缓存结果，同一条序列中不同年份的值会来自不同的拟合，delta_bio 会出现跳变。
+因此本缓存按 (后端, 树种, 坐标) 保存一次拟合得到的 (a, b, sigma)，所有DBH都用同一组
+参数计算，存放在单个 SQLite 文件中：
+- 只缓存 allodb 成功拟合的参数；拟合失败（属名不在allodb中、R出错等）时不写入，
+  调用方按原流程计算（可能回退到硬编码方程），之后的运行会重新尝试；
+- 后端 ('r' 或 'native') 是键的一部分，两种来源的参数不会混用；
+- 使用 WAL 模式，多个进程可以同时读取，写入时互相等待（不会损坏文件）；
+  多个进程同时拟合同一个键时，以先写入的参数为准；
+- 条目数超过 max_entries 时按最近使用时间 (LRU) 淘汰；条目数由本进程计数，
+  最近使用时间在内存中累积，每 TOUCH_BATCH 个或写入、关闭时批量更新；
+- hits / misses 计数器记录本进程的命中情况（misses 即拟合次数）。
+
+同一个 ITRDB 区域重复运行时，之前拟合过的参数会直接从缓存读取，结果完全一致。
+"""
+
+import os
+import math
+import time
+import sqlite3
+import threading
+
+import numpy as np
+
+from allodb_native import AllodbParams
+
+DEFAULT_MAX_ENTRIES = 100000
+# 最近使用时间累积到这么多个键时批量写回
+TOUCH_BATCH = 256
+
+
+def _default_store_path():
+    cache_dir = os.environ.get('TR_SNP_CACHE_DIR') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'cache')
+    return os.path.join(cache_dir, 'biomass_cache.sqlite')
+
+
+class BiomassStore:
+    """
+    SQLite 拟合参数缓存
+
+    参数:
+    path: 缓存文件路径，默认为 $TR_SNP_CACHE_DIR/biomass_cache.sqlite
+    max_entries: 最大条目数，超过时淘汰最久未使用的条目
+    """
+
+    def __init__(self, path=None, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path or _default_store_path()
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # 本进程已读取或拟合的参数，同一个键只查询一次数据库
+        self._params = {}
+        self._touched = {}
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS allometry (
+                backend TEXT NOT NULL,
+                taxa TEXT NOT NULL,
+                lon REAL NOT NULL,
+                lat REAL NOT NULL,
+                a REAL NOT NULL,
+                b REAL NOT NULL,
+                sigma REAL NOT NULL,
+                last_used REAL NOT NULL,
+                UNIQUE (backend, taxa, lon, lat)
+            )''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS allometry_last_used ON allometry (last_used)')
+        self._conn.commit()
+        # 打开时统计一次，之后按插入和淘汰的行数维护
+        self._entries = self._conn.execute('SELECT COUNT(*) FROM allometry').fetchone()[0]
+
+    @staticmethod
+    def _key(backend, taxa, coords):
+        return (backend, taxa, round(float(coords[0]), 4), round(float(coords[1]), 4))
+
+    def _select(self, key):
+        row = self._conn.execute(
+            'SELECT a, b, sigma FROM allometry WHERE backend = ? AND taxa = ? AND lon = ? AND lat = ?',
+            key).fetchone()
+        return None if row is None else AllodbParams(*row)
+
+    def _touch(self, key):
+        """记录最近使用时间，累积到 TOUCH_BATCH 个键时写回"""
+        self._touched[key] = time.time()
+        if len(self._touched) >= TOUCH_BATCH:
+            self._flush_touched()
+            self._conn.commit()
+
+    def _flush_touched(self):
+        if self._touched:
+            self._conn.executemany(
+                'UPDATE allometry SET last_used = ? WHERE backend = ? AND taxa = ? AND lon = ? AND lat = ?',
+                [(used,) + key for key, used in self._touched.items()])
+            self._touched.clear()
+
+    def _insert(self, key, params):
+        cursor = self._conn.execute(
+            'INSERT OR IGNORE INTO allometry (backend, taxa, lon, lat, a, b, sigma, last_used) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            key + (float(params.a), float(params.b), float(params.sigma), time.time()))
+        self._entries += cursor.rowcount
+        if self._entries > self.max_entries:
+            self._evict()
+
+    def _evict(self):
+        self._flush_touched()
+        # 其他进程也可能写入，淘汰前重新统计
+        self._entries = self._conn.execute('SELECT COUNT(*) FROM allometry').fetchone()[0]
+        excess = self._entries - self.max_entries
+        if excess > 0:
+            cursor = self._conn.execute(
+                'DELETE FROM allometry WHERE rowid IN '
+                '(SELECT rowid FROM allometry ORDER BY last_used LIMIT ?)', (excess,))
+            self._entries -= cursor.rowcount
+            self._params.clear()
+
+    def get_params(self, backend, taxa, coords, fit):
+        """
+        读取 (后端, 树种, 坐标) 的拟合参数，未命中时调用fit拟合并写入缓存
+
+        参数:
+        backend: 结果来源，作为键的一部分 ('r' 或 'native')
+        taxa: 树种拉丁名
+        coords: 坐标元组 (经度, 纬度)
+        fit: 拟合函数，无参数，返回 AllodbParams；无法拟合时返回None
+
+        返回:
+        AllodbParams；拟合失败时返回None（不写入缓存）
+        """
+        key = self._key(backend, taxa, coords)
+        with self._lock:
+            params = self._params.get(key)
+            if params is None:
+                params = self._select(key)
+            if params is not None:
+                self._params[key] = params
+                self._touch(key)
+                self.hits += 1
+                return params
+
+        self.misses += 1
+        params = fit()
+        if params is None or not all(math.isfinite(v) for v in params):
+            return None
+
+        with self._lock:
+            self._insert(key, params)
+            # 其他进程可能已经先写入了该键，以数据库中的参数为准
+            params = self._select(key) or AllodbParams(*params)
+            self._conn.commit()
+            self._params[key] = params
+        return params
+
+    def get_biomass(self, dbh, backend, taxa, coords, fit, compute):
+        """
+        用缓存的拟合参数计算生物量
+
+        参数:
+        dbh: 胸径(cm)数组
+        backend, taxa, coords, fit: 同 get_params
+        compute: 拟合失败时使用的计算函数，输入DBH数组，返回等长的生物量数组（结果不缓存）
+
+        返回:
+        numpy数组: 与输入等长的生物量
+        """
+        dbh = np.atleast_1d(np.asarray(dbh, dtype=float))
+        params = self.get_params(backend, taxa, coords, fit)
+        if params is None:
+            return np.asarray(compute(dbh), dtype=float)
+
+        result = np.full(dbh.shape, np.nan)
+        finite = np.isfinite(dbh)
+        if not np.all(finite):
+            # NaN交给计算函数按原有规则处理
+            result[~finite] = np.asarray(compute(dbh[~finite]), dtype=float)
+        result[finite] = params.a * dbh[finite] ** params.b * math.exp(params.sigma ** 2 / 2)
+        return result
+
+    def stats(self):
+        """返回命中统计和当前条目数"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': self._entries,
+            'path': self.path,
+        }
+
+    def close(self):
+        with self._lock:
+            self._flush_touched()
+            self._conn.commit()
+            self._conn.close()
+
+
+_STORE = None
+_STORE_DISABLED = False
+_STORE_LOCK = threading.Lock()
+
+
+def set_biomass_store(path=None, max_entries=DEFAULT_MAX_ENTRIES):
+    """
+    启用磁盘缓存
+
+    参数:
+    path: 缓存文件路径；None 使用默认路径；False 关闭缓存
+    """
+    global _STORE, _STORE_DISABLED
+    with _STORE_LOCK:
+        if _STORE is not None:
+            _STORE.close()
+            _STORE = None
+        _STORE_DISABLED = path is False
+        if not _STORE_DISABLED:
+            _STORE = BiomassStore(path or None, max_entries=max_entries)
+    return _STORE
+
+
+def get_biomass_store():
+    """
+    返回当前的磁盘缓存，未启用时返回None
+
+    设置环境变量 TR_SNP_BIOMASS_STORE 时自动启用（值为文件路径，或 1 使用默认路径）
+    """
+    global _STORE
+    if _STORE is None and not _STORE_DISABLED:
+        env_path = os.environ.get('TR_SNP_BIOMASS_STORE')
+        if env_path and env_path != '0':
+            with _STORE_LOCK:
+                if _STORE is None:
+                    _STORE = BiomassStore(None if env_path == '1' else env_path)
+    return _STORE
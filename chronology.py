@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tukey biweight 年表 (NumPy 实现)
+
+plot_allometry 对每个变量 (times > 0 时对每个随机值) 都要把 DataFrame 转换到 R，
+调用 dplR.chron，再用 process_tree_data 转换回来；fix_mean_year_alignment.py 就是为了
+修复这种往返造成的年份错位。本模块直接在 (年份, 样本) 或 (随机值, 年份, 样本) 数组上
+计算与 dplR.chron (biweight=TRUE, prewhiten=FALSE) 相同的结果:
+
+- std: 每年所有样本的 Tukey biweight 稳健均值 (dplR::tbrm, C = 9)
+      M = median(x), MAD = median(|x - M|), u = (x - M) / (C * MAD + 1e-6),
+      w = (1 - u^2)^2 (|u| <= 1，否则为0)，std = sum(w * x) / sum(w)
+- samp.depth: 每年有值的样本数
+
+结果的行与输入数组的年份一一对应，不会错位。
+
+仍使用 dplR 作为参考实现时，dplr_chronology_frames 把一个站点所有变量和随机值的
+矩阵拼成一个矩阵、一次传给 R，由 R 端的 lapply 逐组调用 dplR::chron，结果作为一个
+矩阵返回，代替每个变量、每个随机值一次 py2rpy 转换和一次 dplR.chron 调用。
+
+年表后端: 'native' (默认，本模块) 或 'r' (dplR.chron，作为参考实现)，
+用 set_chronology_backend 或环境变量 TR_SNP_CHRONOLOGY 选择。
+"""
+
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+
+# 年表后端: 'native' 使用本模块，'r' 使用 dplR.chron
+CHRONOLOGY_BACKENDS = ('native', 'r')
+_CHRONOLOGY_BACKEND = os.environ.get('TR_SNP_CHRONOLOGY', 'native')
+
+# dplR::tbrm 的参数
+BIWEIGHT_C = 9
+_BIWEIGHT_EPSILON = 1e-6
+
+
+def set_chronology_backend(backend):
+    """
+    选择年表计算后端
+
+    参数:
+    backend: 'native' (默认) 或 'r'
+    """
+    global _CHRONOLOGY_BACKEND
+    if backend not in CHRONOLOGY_BACKENDS:
+        raise ValueError(f"未知的年表后端: {backend}，可选: {', '.join(CHRONOLOGY_BACKENDS)}")
+    _CHRONOLOGY_BACKEND = backend
+
+
+def get_chronology_backend():
+    """返回当前的年表计算后端"""
+    return _CHRONOLOGY_BACKEND
+
+
+def tukey_biweight_mean(values, C=BIWEIGHT_C, axis=-1):
+    """
+    沿 axis 计算 Tukey biweight 稳健均值，忽略NaN (与 dplR::tbrm 相同)
+
+    返回:
+    去掉 axis 维之后的数组；没有值的位置为NaN
+    """
+    values = np.moveaxis(np.asarray(values, dtype=float), axis, -1)
+    with warnings.catch_warnings():
+        # 全为NaN的年份 (nanmedian 给出警告) 结果为NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        median = np.nanmedian(values, axis=-1, keepdims=True)
+        deviation = values - median
+        mad = np.nanmedian(np.abs(deviation), axis=-1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        u = deviation / (C * mad + _BIWEIGHT_EPSILON)
+        weights = np.where(np.abs(u) <= 1, (1 - u ** 2) ** 2, 0.0)
+        weighted = np.where(np.isnan(values), 0.0, weights * values)
+        return weighted.sum(axis=-1) / weights.sum(axis=-1)
+
+
+def site_chronology(values, C=BIWEIGHT_C):
+    """
+    计算年表
+
+    参数:
+    values: (年份, 样本) 或 (随机值, 年份, 样本) 数组
+
+    返回:
+    (std, samp_depth): 形状为 (年份,) 或 (随机值, 年份) 的数组；samp_depth 为浮点数 (与 dplR 相同)
+    """
+    values = np.asarray(values, dtype=float)
+    samp_depth = (~np.isnan(values)).sum(axis=-1).astype(float)
+    return tukey_biweight_mean(values, C), samp_depth
+
+
+# R 端的批量年表函数: m 的列按 groups 分组，每组调用一次 dplR::chron，
+# 返回 (年份, 2 × 组数) 矩阵，每组依次为 std 和 samp.depth
+_R_BATCH_CHRON = '''
+function(m, groups, yrs) {
+    out <- lapply(split(seq_len(ncol(m)), groups), function(cols) {
+        rwl <- as.data.frame(m[, cols, drop = FALSE])
+        rownames(rwl) <- yrs
+        ch <- dplR::chron(rwl)
+        cbind(as.numeric(ch[[1]]), as.numeric(ch[["samp.depth"]]))
+    })
+    do.call(cbind, out)
+}
+'''
+_r_batch_chron = None
+
+
+def dplr_chronology_frames(years, jobs):
+    """
+    用一次 R 调用计算一个站点的所有年表 (dplR.chron)
+
+    参数:
+    years: 年份序列
+    jobs: {变量名: (values, draws)}，values 和 draws 同 chronology_frame
+
+    返回:
+    {变量名: 年表DataFrame}，列名同 chronology_frame
+    """
+    global _r_batch_chron
+    if not jobs:
+        return {}
+    import rpy2.robjects as robjects
+    from rpy2.robjects import numpy2ri
+    from rpy2.robjects.conversion import localconverter
+
+    # 所有 (年份, 样本) 矩阵按列拼接，groups 为每列所属的年表序号 (从1开始)
+    blocks = []
+    layout = []
+    for variable, (values, draws) in jobs.items():
+        values = np.asarray(values, dtype=float)
+        matrices = [values] if draws is None else list(values)
+        layout.append((variable, draws, len(matrices)))
+        blocks.extend(matrices)
+    groups = np.concatenate([np.full(block.shape[1], index + 1) for index, block in enumerate(blocks)])
+    combined = np.ascontiguousarray(np.concatenate(blocks, axis=1))
+
+    if _r_batch_chron is None:
+        _r_batch_chron = robjects.r(_R_BATCH_CHRON)
+    with localconverter(robjects.default_converter + numpy2ri.converter):
+        output = np.asarray(_r_batch_chron(combined, groups.astype(np.int32),
+                                           np.asarray(years, dtype=np.int32).astype(str)))
+    output = output.reshape(len(years), len(blocks), 2)
+
+    frames = {}
+    start = 0
+    for variable, draws, n_matrices in layout:
+        std = output[:, start:start + n_matrices, 0].T
+        samp_depth = output[:, start:start + n_matrices, 1].T
+        start += n_matrices
+        if draws is None:
+            std, samp_depth = std[0], samp_depth[0]
+        frames[variable] = _chronology_columns(years, std, samp_depth, variable, draws)
+    return frames
+
+
+def _chronology_columns(years, std, samp_depth, variable, draws):
+    columns = {'Year': np.asarray(years)}
+    if draws is None:
+        columns[f'mean_{variable}'] = std
+        columns['samp.depth'] = samp_depth
+    else:
+        for index, draw in enumerate(draws):
+            columns[f'mean_{variable}_{draw}'] = std[index]
+            columns[f'samp.depth_{draw}'] = samp_depth[index]
+    return pd.DataFrame(columns)
+
+
+def chronology_frame(years, values, variable, draws=None):
+    """
+    生成与 process_tree_data 相同列名的年表 DataFrame
+
+    参数:
+    years: 年份序列 (与 values 的年份维对应)
+    values: (年份, 样本) 数组；draws 不为None时为 (随机值, 年份, 样本) 数组
+    variable: 变量名，如 'dia'
+    draws: 随机值列表
+
+    返回:
+    没有随机值时: Year, mean_{变量}, samp.depth
+    有随机值时:   Year, 每个随机值依次为 mean_{变量}_{随机值}, samp.depth_{随机值}
+    """
+    std, samp_depth = site_chronology(values)
+    return _chronology_columns(years, std, samp_depth, variable, draws)
+
+
+def compare_with_dplr(sample_data, dplr_result):
+    """
+    与 dplR.chron 的结果比较 (用于验证)
+
+    参数:
+    sample_data: (年份, 样本) DataFrame，即传给 dplR.chron 的数据
+    dplr_result: dplR.chron 的结果转换成的 DataFrame (std 和 samp.depth 列)
+
+    返回:
+    (std 最大绝对误差, samp.depth 是否一致)
+    """
+    std, samp_depth = site_chronology(sample_data.to_numpy(dtype=float))
+    reference = np.asarray(dplr_result['std'], dtype=float)
+    with np.errstate(invalid='ignore'):
+        error = np.nanmax(np.abs(std - reference)) if np.any(~np.isnan(reference)) else 0.0
+    depth_match = np.array_equal(samp_depth, np.asarray(dplr_result['samp.depth'], dtype=float))
+    return float(error), depth_match
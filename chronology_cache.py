@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+按内容寻址的年表磁盘缓存
+
+同一个站点每次绘图都要重新去趋势、重新计算年表 (plot_all 的样条去趋势和
+biweight 年表，plot_allometry 中原始变量的 dplR.chron)。site_stages 的阶段缓存默认
+只在内存中，而且按文件路径和修改时间识别文件。本模块把年表结果按
+
+    (RWL 文件内容的哈希, 序列的变换方法和参数, 年表方法)
+
+存为 .npz 文件 (每个键一个文件，numpy 二进制格式，不使用 pickle):
+- 文件内容的哈希按 (路径, 修改时间, 大小) 记在内存中，文件未改变时不重新读取；
+  文件内容改变后键随之改变，旧条目不再被使用，最终按大小上限淘汰；
+- 读取时更新文件的修改时间，总大小超过 max_bytes 时删除最久未使用的条目；
+- 写入时先写临时文件再改名，多个进程 (如 temporal_batch 的工作进程) 可以共用一个目录。
+
+缓存目录默认为 $TR_SNP_CACHE_DIR/chronology，也可以用环境变量
+TR_SNP_CHRONOLOGY_CACHE 指定；set_chronology_cache(enabled=False) 关闭缓存。
+"""
+
+import os
+import hashlib
+import threading
+
+import numpy as np
+import pandas as pd
+
+from site_stages import stage_key
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# (绝对路径, 修改时间, 大小) -> 内容哈希
+_CONTENT_HASHES = {}
+_HASH_LOCK = threading.Lock()
+
+
+def _default_chronology_dir():
+    cache_dir = os.environ.get('TR_SNP_CACHE_DIR') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'cache')
+    return os.path.join(cache_dir, 'chronology')
+
+
+def rwl_content_hash(path):
+    """
+    RWL 文件内容的 sha1 哈希
+
+    文件的 (路径, 修改时间, 大小) 未改变时直接返回上次计算的哈希。
+    """
+    stat = os.stat(path)
+    identity = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    with _HASH_LOCK:
+        if identity in _CONTENT_HASHES:
+            return _CONTENT_HASHES[identity]
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    content_hash = digest.hexdigest()
+    with _HASH_LOCK:
+        _CONTENT_HASHES[identity] = content_hash
+    return content_hash
+
+
+def chronology_key(content_hash, transform, chronology):
+    """
+    年表缓存的键
+
+    参数:
+    content_hash: RWL 文件内容的哈希 (见 rwl_content_hash)
+    transform: 由年轮宽度得到序列的方法和参数，如 ('spline', 0.5, 0.67, 'native')
+    chronology: 年表方法和参数，如 ('biweight', 9, 'native')
+    """
+    return stage_key('chronology', content_hash, tuple(transform), tuple(chronology))
+
+
+class ChronologyCache:
+    """
+    年表磁盘缓存
+
+    参数:
+    path: 缓存目录，默认为 $TR_SNP_CACHE_DIR/chronology
+    max_bytes: 缓存目录的大小上限 (字节)
+    """
+
+    def __init__(self, path=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path or _default_chronology_dir()
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+
+    def _file(self, key):
+        return os.path.join(self.path, f"{key}.npz")
+
+    def get(self, key):
+        """
+        读取一个条目
+
+        返回:
+        {名称: 数组} 字典；没有缓存或文件损坏时为None
+        """
+        file = self._file(key)
+        try:
+            with np.load(file, allow_pickle=False) as data:
+                entry = {name: data[name] for name in data.files}
+            os.utime(file)
+        except (OSError, ValueError, KeyError, EOFError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return entry
+
+    def put(self, key, arrays):
+        """写入一个条目 (数组字典)，然后按大小上限淘汰"""
+        file = self._file(key)
+        tmp_file = f"{file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, 'wb') as f:
+            np.savez(f, **{name: np.asarray(value) for name, value in arrays.items()})
+        os.replace(tmp_file, file)
+        self._evict()
+
+    def get_frame(self, key):
+        """读取用 put_frame 保存的 DataFrame；没有缓存时为None"""
+        entry = self.get(key)
+        if entry is None or 'columns' not in entry:
+            return None
+        return pd.DataFrame({name: entry[f'c{i}'] for i, name in enumerate(entry['columns'].tolist())})
+
+    def put_frame(self, key, frame):
+        """按列保存 DataFrame (列名和每列的类型保持不变，索引不保存)"""
+        arrays = {'columns': np.asarray([str(name) for name in frame.columns])}
+        for i, name in enumerate(frame.columns):
+            arrays[f'c{i}'] = frame[name].to_numpy()
+        self.put(key, arrays)
+
+    def size(self):
+        """缓存目录中所有条目的总大小 (字节)"""
+        return sum(size for _, _, size in self._entries())
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.path):
+            if not name.endswith('.npz'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.path, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name, stat.st_size))
+        return entries
+
+    def _evict(self):
+        entries = self._entries()
+        total = sum(size for _, _, size in entries)
+        if total <= self.max_bytes:
+            return
+        for _, name, size in sorted(entries):
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                continue
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def clear(self):
+        """删除缓存目录中的所有条目"""
+        for _, name, _ in self._entries():
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                pass
+
+
+_CHRONOLOGY_CACHE = None
+_CHRONOLOGY_CACHE_ENABLED = True
+
+
+def set_chronology_cache(path=None, enabled=True, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    设置全局年表缓存
+
+    参数:
+    path: 缓存目录；None时使用 TR_SNP_CHRONOLOGY_CACHE 或默认目录
+    enabled: False时关闭年表缓存
+    max_bytes: 缓存目录的大小上限 (字节)
+    """
+    global _CHRONOLOGY_CACHE, _CHRONOLOGY_CACHE_ENABLED
+    _CHRONOLOGY_CACHE_ENABLED = enabled
+    _CHRONOLOGY_CACHE = None
+    if enabled:
+        _CHRONOLOGY_CACHE = ChronologyCache(path or os.environ.get('TR_SNP_CHRONOLOGY_CACHE') or None,
+                                            max_bytes=max_bytes)
+    return _CHRONOLOGY_CACHE
+
+
+def get_chronology_cache():
+    """返回全局年表缓存 (第一次调用时创建)，关闭时为None"""
+    if _CHRONOLOGY_CACHE is None and _CHRONOLOGY_CACHE_ENABLED:
+        try:
+            set_chronology_cache()
+        except OSError:
+            # 缓存目录不可写时不使用缓存
+            set_chronology_cache(enabled=False)
+    return _CHRONOLOGY_CACHE
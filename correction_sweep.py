@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+几何校正和树皮校正的参数敏感性分析
+
+原来检验 AABI 对校正方法的敏感性时，每个 (dbh_method, 几何校正率, 树皮校正率) 组合
+都要单独运行一次 plot_allometry，各自写出一套 _correction_x_y_z 文件。扫描模式下
+一个站点只读取一次、原始直径只计算一次，所有参数点作为一个广播维度同时计算
+(见 diameter_engine.compute_sweep_diameters)，生物量对所有参数点的直径去重后一次
+计算，结果写成每个站点一个长表:
+
+    dbh_method, geometric_rate, bark_method, bark_rate, Year,
+    mean_diaa, mean_bioo, mean_delta_diaa, mean_delta_bioo, samp.depth
+
+站点均值为每个参数点各样本的 Tukey biweight 年表 (chronology.site_chronology)，
+与 plot_allometry 的均值表相同。
+"""
+
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from chronology import site_chronology
+
+# 长表中的变量: (输出变量名, compute_sweep_diameters 结果中的矩阵)
+SWEEP_VARIABLES = (
+    ('diaa', 'diameterr_geo_bark'),
+    ('bioo', 'biomasss'),
+    ('delta_diaa', 'delta_diaa'),
+    ('delta_bioo', 'delta_bioo'),
+)
+
+
+def correction_grid(dbh_methods=(-1,), geometric_rates=(1.0,), bark_methods=(0,), bark_rates=(0.05,)):
+    """
+    展开校正参数组合
+
+    几何校正率只对 dbh_method=1 有效，树皮校正率只对 bark_method=-1 有效；
+    对其他方法这些参数记为NaN，重复的组合只保留一个。
+
+    返回:
+    [(dbh_method, geometric_rate, bark_method, bark_rate), ...]
+    """
+    points = []
+    for dbh_method, geometric_rate, bark_method, bark_rate in itertools.product(
+            dbh_methods, geometric_rates, bark_methods, bark_rates):
+        point = (dbh_method, float(geometric_rate) if dbh_method == 1 else np.nan,
+                 bark_method, float(bark_rate) if bark_method == -1 else np.nan)
+        # NaN != NaN，用 repr 比较
+        if repr(point) not in {repr(p) for p in points}:
+            points.append(point)
+    return points
+
+
+def sweep_frame(years, result):
+    """
+    把扫描结果整理为长表
+
+    参数:
+    years: 年份序列
+    result: compute_sweep_diameters 的结果 (已调用 attach_biomass)
+
+    返回:
+    DataFrame: 每个参数点、每年一行
+    """
+    points = result['points']
+    n_years = len(years)
+    frame = pd.DataFrame({
+        'dbh_method': np.repeat([p[0] for p in points], n_years),
+        'geometric_rate': np.repeat([p[1] for p in points], n_years),
+        'bark_method': np.repeat([p[2] for p in points], n_years),
+        'bark_rate': np.repeat([p[3] for p in points], n_years),
+        'Year': np.tile(np.asarray(years), len(points)),
+    })
+    depths = None
+    for variable, source in SWEEP_VARIABLES:
+        draw_means, draw_depths = site_chronology(result[source])
+        frame[f'mean_{variable}'] = draw_means.ravel()
+        if depths is None:
+            depths = draw_depths
+    frame['samp.depth'] = depths.ravel()
+    return frame
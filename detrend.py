@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+样条去趋势 (NumPy 实现)
+
+plot_all_temporal.plot_all 对每个文件通过 rpy2 调用 dplR.detrend(method="Spline")
+和 dplR.chron；多世纪的长序列中，经过 R 桥接的样条拟合占了大部分运行时间。本模块
+用 NumPy 对一个站点的所有序列一次拟合 dplR::ffcsaps 的三次平滑样条:
+
+- 每条序列只使用首尾有值年份之间的部分，宽度为0时替换为0.001；与 dplR.detrend 相同，
+  序列中间有缺测 (NaN) 时抛出 ValueError，不跳过缺测年份拼接；
+- 样条刚度 nyrs = floor(0.67 × 序列长度)，在周期 nyrs 处的频率响应为50%
+  (Cook & Peters 1981, f = 0.5):
+      p = 1 / (1 + (1 - f) (cos(2π/nyrs) + 2) / (f · 12 (cos(2π/nyrs) - 1)^2))
+- 平滑样条按 csaps / dplR::ffcsaps 的形式求解 (等间距年份):
+      (6 (1 - p) QᵀQ + p R) u = Qᵀy,  曲线 = y - 6 (1 - p) Q u
+  其中 Qᵀ 为二阶差分，R 为三对角 (1, 4, 1)。所有序列的五对角方程组按年份逐行
+  一起消元 (不同长度的序列在末尾补单位行)；
+- 年轮宽度指数 = 宽度 / 曲线；曲线有非正值时该序列的指数为NaN。
+
+较早的 dplR 中 detrend(method="Spline") 用 ffcsaps 拟合；新版默认改用 caps，样条的
+定义不同，结果与本模块不完全一致。需要与 R 逐值一致时使用 'r' 后端；测试的参考结果
+直接用 ffcsaps 生成 (见 tests/fixtures/make_dplr_fixtures.R)。
+
+去趋势后端: 'native' (默认，本模块) 或 'r' (dplR.detrend)，
+用 set_detrend_backend 或环境变量 TR_SNP_DETREND 选择。
+"""
+
+import os
+
+import numpy as np
+
+# 去趋势后端: 'native' 使用本模块，'r' 使用 dplR.detrend
+DETREND_BACKENDS = ('native', 'r')
+_DETREND_BACKEND = os.environ.get('TR_SNP_DETREND', 'native')
+
+# dplR detrend.series 的默认参数
+SPLINE_FREQUENCY_RESPONSE = 0.5
+SPLINE_LENGTH_FRACTION = 0.67
+ZERO_WIDTH = 0.001
+
+
+def set_detrend_backend(backend):
+    """
+    选择去趋势后端
+
+    参数:
+    backend: 'native' (默认) 或 'r'
+    """
+    global _DETREND_BACKEND
+    if backend not in DETREND_BACKENDS:
+        raise ValueError(f"未知的去趋势后端: {backend}，可选: {', '.join(DETREND_BACKENDS)}")
+    _DETREND_BACKEND = backend
+
+
+def get_detrend_backend():
+    """返回当前的去趋势后端"""
+    return _DETREND_BACKEND
+
+
+def spline_parameter(nyrs, f=SPLINE_FREQUENCY_RESPONSE):
+    """周期为 nyrs 年时频率响应为 f 的平滑参数 p (可以是数组)"""
+    c = np.cos(2 * np.pi / np.asarray(nyrs, dtype=float))
+    return 1.0 / (1.0 + (1 - f) * (c + 2) / (f * 12 * (c - 1) ** 2))
+
+
+def _solve_pentadiagonal(a0, a1, a2, rhs):
+    """
+    逐行消元求解一组对称五对角方程组 (LDLᵀ)，第二维为不同的方程组
+
+    参数:
+    a0, a1, a2: (行, 方程组) 主对角线、第一和第二副对角线 (a1[k] 连接 k 和 k+1)
+    rhs: (行, 方程组) 右端项
+    """
+    m = a0.shape[0]
+    d = np.zeros_like(a0)
+    e = np.zeros_like(a0)
+    f = np.zeros_like(a0)
+    z = np.zeros_like(rhs)
+    for k in range(m):
+        d[k] = a0[k]
+        e[k] = a1[k]
+        z[k] = rhs[k]
+        if k >= 1:
+            d[k] -= e[k - 1] ** 2 * d[k - 1]
+            z[k] -= e[k - 1] * z[k - 1]
+        if k >= 2:
+            d[k] -= f[k - 2] ** 2 * d[k - 2]
+            z[k] -= f[k - 2] * z[k - 2]
+        if k >= 1:
+            e[k] -= f[k - 1] * e[k - 1] * d[k - 1]
+        e[k] /= d[k]
+        f[k] = a2[k] / d[k]
+    u = z / d
+    for k in range(m - 2, -1, -1):
+        u[k] -= e[k] * u[k + 1]
+        if k + 2 < m:
+            u[k] -= f[k] * u[k + 2]
+    return u
+
+
+def spline_curves(series, lengths, f=SPLINE_FREQUENCY_RESPONSE, nyrs=None):
+    """
+    对一组左对齐的序列拟合平滑样条
+
+    参数:
+    series: (最大长度, 序列) 数组，第 j 条序列的前 lengths[j] 个值有效
+    lengths: 每条序列的长度
+    nyrs: 样条刚度 (年)；None时为 floor(0.67 × 长度)
+
+    返回:
+    与 series 形状相同的样条曲线 (有效部分之外为NaN)
+    """
+    series = np.asarray(series, dtype=float)
+    lengths = np.asarray(lengths, dtype=int)
+    n_max, n_series = series.shape
+    curves = np.full(series.shape, np.nan)
+    if n_series == 0 or n_max == 0:
+        return curves
+
+    if nyrs is None:
+        nyrs = np.floor(lengths * SPLINE_LENGTH_FRACTION)
+    p = spline_parameter(np.maximum(np.broadcast_to(nyrs, lengths.shape), 2), f)
+
+    # 少于4个值的序列无法拟合样条，使用均值
+    short = lengths < 4
+    for j in np.nonzero(short & (lengths > 0))[0]:
+        curves[:lengths[j], j] = np.mean(series[:lengths[j], j])
+    if np.all(short):
+        return curves
+
+    m_max = n_max - 2
+    rows = np.arange(m_max)[:, np.newaxis]
+    m = lengths - 2
+    inside = rows < m
+    w = 6 * (1 - p)
+    a0 = np.where(inside, w * 6 + p * 4, 1.0)
+    a1 = np.where(rows + 1 < m, w * -4 + p * 1, 0.0)
+    a2 = np.where(rows + 2 < m, w * 1, 0.0)
+    y = np.where(np.arange(n_max)[:, np.newaxis] < lengths, series, 0.0)
+    second_diff = y[2:] - 2 * y[1:-1] + y[:-2]
+    u = _solve_pentadiagonal(a0, a1, a2, np.where(inside, second_diff, 0.0))
+    u = np.where(inside, u, 0.0)
+
+    # Q u: 每个 u[k] 贡献到 k, k+1, k+2 三个年份，系数为 1, -2, 1
+    qu = np.zeros((n_max, n_series))
+    qu[:-2] += u
+    qu[1:-1] -= 2 * u
+    qu[2:] += u
+    fitted = y - w * qu
+    valid = (np.arange(n_max)[:, np.newaxis] < lengths) & ~short
+    curves[valid] = fitted[valid]
+    return curves
+
+
+def detrend_spline(widths, f=SPLINE_FREQUENCY_RESPONSE, nyrs=None, return_curves=False):
+    """
+    样条去趋势，得到年轮宽度指数 (dplR::ffcsaps 样条，见模块说明)
+
+    参数:
+    widths: (年份, 序列) 年轮宽度数组，序列首尾之外为NaN
+    f: 频率响应 (默认0.5)
+    nyrs: 样条刚度 (年)；None时每条序列为 floor(0.67 × 有值的年数)
+
+    返回:
+    (年份, 序列) 年轮宽度指数；return_curves=True 时返回 (指数, 曲线)
+
+    序列中间有缺测时抛出 ValueError (与 dplR.detrend 相同)
+    """
+    widths = np.array(widths, dtype=float)
+    if widths.ndim == 1:
+        widths = widths[:, np.newaxis]
+    present = ~np.isnan(widths)
+    lengths = present.sum(axis=0)
+    first = np.argmax(present, axis=0)
+    last = widths.shape[0] - 1 - np.argmax(present[::-1], axis=0)
+    gapped = (lengths > 0) & (last - first + 1 != lengths)
+    if np.any(gapped):
+        raise ValueError(f"序列中间有缺测 (NA)，无法去趋势: 第 {np.nonzero(gapped)[0].tolist()} 列")
+    widths[widths == 0] = ZERO_WIDTH
+
+    # 每条序列的有效值左对齐
+    order = np.argsort(~present, axis=0, kind='stable')
+    packed = np.take_along_axis(widths, order, axis=0)
+    packed_curves = spline_curves(packed, lengths, f, nyrs)
+
+    curves = np.full(widths.shape, np.nan)
+    rows = np.arange(widths.shape[0])[:, np.newaxis]
+    keep = rows < lengths
+    np.put_along_axis(curves, order, np.where(keep, packed_curves, np.nan), axis=0)
+    curves[~present] = np.nan
+
+    # 曲线有非正值时 dplR 不使用该拟合，指数为NaN
+    bad = np.any(curves <= 0, axis=0)
+    curves[:, bad] = np.nan
+    with np.errstate(invalid='ignore', divide='ignore'):
+        indices = widths / curves
+    if return_curves:
+        return indices, curves
+    return indices
@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+整站点直径/生物量矩阵计算
+
+process_tree_column 逐年、逐列地用 pandas Series 计算直径，每个样本、每个随机值
+都要走一遍 Python 循环。本模块把一个站点的年轮宽度作为 (年份 × 样本) 的 NumPy
+矩阵一次处理：
+- 原始和校正后直径用累加 (cumsum) 计算，累加顺序与逐年循环相同，结果逐位一致；
+- 几何校正和树皮校正用数组表达式对所有样本同时计算；
+- 年龄、直径增量和生物量增量用相邻年份之差一次得到。
+
+与原循环一致的规则:
+- 宽度为0时替换为1e-8；
+- 初始宽度偏差只加在校正直径的第一个有效年份上；
+- 第一个有效年份之后遇到缺测年份时，该样本之后的所有年份均为NaN。
+
+使用方法:
+    result = compute_site_diameters(widths, initial_offsets, dbh_method, bark_method, ...)
+    raw, corrected = biomass_requests(result)
+    attach_biomass(result, biomass(raw), biomass(corrected))
+
+原始直径、原始生物量、直径/生物量增量和年龄与随机值无关，分块计算随机值时只需
+在第一块计算原始生物量，之后的块复用 (attach_biomass 接受同一份原始生物量)。
+"""
+
+import numpy as np
+
+from bark_dict_species import bark_thickness_array
+
+# 宽度为0的年份使用的替代值 (mm)
+ZERO_WIDTH = 1e-8
+
+# compute_site_diameters 返回的直径矩阵
+DIAMETER_KEYS = ('diameter', 'diameterr', 'diameterr_geo', 'diameterr_geo_bark',
+                 'delta_dia', 'delta_diaa', 'age')
+# 随随机值变化的矩阵（其余矩阵与随机值无关）
+DRAW_KEYS = ('diameterr', 'diameterr_geo', 'diameterr_geo_bark', 'delta_diaa')
+# 只依赖原始年轮宽度、与随机值无关的矩阵 (含 attach_biomass 添加的原始生物量)
+DRAW_INVARIANT_KEYS = ('diameter', 'biomass', 'delta_dia', 'delta_bio', 'age')
+
+# 每块 (随机值, 年份, 样本) 矩阵的最大元素个数 (float64, 约32MB)
+DRAW_CHUNK_ELEMENTS = 4000000
+
+
+def _increments(values, start, has_data):
+    """逐年增量: 第一个有效年份为该年的值，之后为相邻两年之差（任一年为NaN时为NaN）
+
+    values 的最后两维为 (年份, 样本)，前面可以有随机值维度
+    """
+    delta = np.full(values.shape, np.nan)
+    delta[..., 1:, :] = values[..., 1:, :] - values[..., :-1, :]
+    cols = np.nonzero(has_data)[0]
+    delta[..., start[cols], cols] = values[..., start[cols], cols]
+    return delta
+
+
+def draw_chunks(n_draws, n_years, n_series, draw_chunk_size=None):
+    """
+    把随机值分块，限制每块 (随机值, 年份, 样本) 矩阵的大小
+
+    参数:
+    draw_chunk_size: 每块的随机值个数；None 时按 DRAW_CHUNK_ELEMENTS 自动确定
+
+    返回:
+    [(起始, 结束), ...]
+    """
+    if not draw_chunk_size:
+        draw_chunk_size = max(1, DRAW_CHUNK_ELEMENTS // max(1, n_years * n_series))
+    return [(lo, min(lo + draw_chunk_size, n_draws)) for lo in range(0, n_draws, draw_chunk_size)]
+
+
+def compute_site_diameters(widths, initial_offsets=0.0, dbh_method=-1, bark_method=0,
+                           geometric_rates=1.0, bark_rates=0.05, species_code=None, region=None,
+                           bark_from_geo=True):
+    """
+    计算一个站点所有样本的直径、校正直径、直径增量和年龄
+
+    参数:
+    widths: (年份, 样本) 年轮宽度矩阵 (mm)，缺测为NaN
+    initial_offsets: 每个样本第一个有效年份的宽度偏差 (mm)，标量或长度为样本数的数组；
+                     (随机值, 样本) 二维数组时所有随机值一次计算，结果增加第一维随机值维度
+    dbh_method: 几何校正方法 (-1 不校正, 0 Lockwood et al.,2021方程, 1 用户自定义校正率)
+    bark_method: 树皮处理方法 (-1 自定义比例, 0 不处理, 1 bark_dict_species 方程表)
+    geometric_rates, bark_rates: 用户校正率，标量或长度为样本数的数组
+    species_code, region: bark_method=1 时传给 bark_thickness_array
+    bark_from_geo: bark_method=1 时树皮厚度按几何校正后的直径计算 (plot_allometry)；
+                   False 时按几何校正前的直径计算 (plot_allometry_species)
+
+    返回:
+    字典: DIAMETER_KEYS 中的各 (年份, 样本) 或 (随机值, 年份, 样本) 矩阵，以及
+          'start' (每个样本第一个有效年份的行号)、'has_data' (样本是否有有效值) 和
+          'n_draws' (随机值个数，没有随机值维度时为None)。
+          原始直径、直径增量和年龄与随机值无关，随机值维度上为只读的广播视图。
+    """
+    widths = np.array(widths, dtype=float)
+    if widths.ndim == 1:
+        widths = widths[:, np.newaxis]
+    n_years, n_series = widths.shape
+    rows = np.arange(n_years)[:, np.newaxis]
+
+    offsets = np.asarray(initial_offsets, dtype=float)
+    n_draws = offsets.shape[0] if offsets.ndim == 2 else None
+    offsets = np.broadcast_to(offsets, (n_draws or 1, n_series))
+
+    present = ~np.isnan(widths)
+    has_data = present.any(axis=0)
+    start = np.argmax(present, axis=0)
+
+    # 从第一个有效年份开始、到第一个缺测年份之前的连续区间
+    after_start = rows >= start
+    gaps = after_start & ~present
+    first_gap = np.where(gaps.any(axis=0), np.argmax(gaps, axis=0), n_years)
+    run = after_start & (rows < first_gap) & has_data
+    cols = np.nonzero(has_data)[0]
+
+    widths[widths == 0] = ZERO_WIDTH
+
+    # 累积直径 (cm): 区间之前按0累加，区间之外置为NaN
+    increments = np.where(run, (2 * widths) / 10, 0.0)
+    diameter = np.cumsum(increments, axis=0)
+    diameter[~run] = np.nan
+
+    # 校正直径只有第一个有效年份的宽度随随机值变化
+    corrected_increments = np.repeat(increments[np.newaxis], len(offsets), axis=0)
+    corrected_increments[:, start[cols], cols] = (2 * (widths[start[cols], cols] + offsets[:, cols])) / 10
+    diameterr = np.cumsum(corrected_increments, axis=1)
+    del corrected_increments
+    diameterr[:, ~run] = np.nan
+
+    # geometric correction
+    geometric_rates = np.broadcast_to(np.asarray(geometric_rates, dtype=float), (n_series,))
+    if dbh_method == -1:
+        diameterr_geo = diameterr.copy()
+    elif dbh_method == 0:
+        # Lockwood et al.,2021方程
+        diameterr_geo = diameterr * 0.998 + 22.3
+    elif dbh_method == 1:
+        diameterr_geo = diameterr * geometric_rates
+    else:
+        diameterr_geo = np.full(diameterr.shape, np.nan)
+
+    # bark correction
+    bark_rates = np.broadcast_to(np.asarray(bark_rates, dtype=float), (n_series,))
+    if bark_method == -1:
+        diameterr_geo_bark = diameterr_geo + diameterr_geo * bark_rates
+    elif bark_method == 0:
+        diameterr_geo_bark = diameterr_geo.copy()
+    elif bark_method == 1:
+        base = diameterr_geo if bark_from_geo else diameterr
+        # 整个站点 (所有随机值) 一次计算，区间之外的NaN保持为NaN
+        bark = bark_thickness_array(species_code, base, region)
+        diameterr_geo_bark = diameterr_geo + bark
+    else:
+        diameterr_geo_bark = np.full(diameterr.shape, np.nan)
+
+    age = np.cumsum(run, axis=0).astype(float)
+    age[~run] = np.nan
+
+    result = {
+        'start': start,
+        'has_data': has_data,
+        'n_draws': n_draws,
+        'diameter': diameter,
+        'diameterr': diameterr,
+        'diameterr_geo': diameterr_geo,
+        'diameterr_geo_bark': diameterr_geo_bark,
+        'delta_dia': _increments(diameter, start, has_data),
+        'delta_diaa': _increments(diameterr_geo_bark, start, has_data),
+        'age': age,
+    }
+    for key in DRAW_KEYS:
+        result[key] = result[key] if n_draws is not None else result[key][0]
+    if n_draws is not None:
+        for key in ('diameter', 'delta_dia', 'age'):
+            result[key] = np.broadcast_to(result[key], (n_draws, n_years, n_series))
+    return result
+
+
+def compute_sweep_diameters(widths, points, initial_offsets=0.0, species_code=None, region=None,
+                            bark_from_geo=True):
+    """
+    对一组校正参数同时计算校正直径 (参数敏感性分析)
+
+    原始直径和加初始宽度偏差后的直径只计算一次，几何校正和树皮校正作为第一维
+    (校正参数) 广播计算；每个参数点的结果与用该参数调用 compute_site_diameters 相同。
+
+    参数:
+    widths: (年份, 样本) 年轮宽度矩阵 (mm)
+    points: [(dbh_method, geometric_rate, bark_method, bark_rate), ...]，见 correction_sweep.correction_grid
+    initial_offsets: 每个样本第一个有效年份的宽度偏差 (mm)，标量或长度为样本数的数组
+    species_code, region, bark_from_geo: 同 compute_site_diameters
+
+    返回:
+    与 compute_site_diameters 有随机值维度时相同的字典，第一维为校正参数点
+    ('n_draws' 为参数点个数)，可直接用于 biomass_requests / attach_biomass / draw_columns
+    """
+    base = compute_site_diameters(widths, initial_offsets)
+    diameterr = base['diameterr']
+    n_points = len(points)
+    dbh_methods = np.array([p[0] for p in points])
+    bark_methods = np.array([p[2] for p in points])
+
+    # geometric correction: diameterr * scale + shift (-1: 1, 0; 0: 0.998, 22.3; 1: 用户校正率, 0)
+    scale = np.array([{-1: 1.0, 0: 0.998, 1: p[1]}.get(p[0], np.nan) for p in points], dtype=float)
+    shift = np.where(dbh_methods == 0, 22.3, 0.0)
+    diameterr_geo = diameterr * scale[:, np.newaxis, np.newaxis] + shift[:, np.newaxis, np.newaxis]
+
+    # bark correction: 自定义比例 (-1) 和不处理 (0, 比例为0) 一次计算，bark_dict_species (1) 逐树种方程
+    rates = np.where(bark_methods == -1, [p[3] for p in points], 0.0).astype(float)
+    diameterr_geo_bark = diameterr_geo + diameterr_geo * rates[:, np.newaxis, np.newaxis]
+    allometry = np.nonzero(bark_methods == 1)[0]
+    if len(allometry) > 0:
+        bark_base = diameterr_geo[allometry] if bark_from_geo else diameterr[np.newaxis]
+        diameterr_geo_bark[allometry] = diameterr_geo[allometry] + bark_thickness_array(species_code, bark_base, region)
+    diameterr_geo_bark[~np.isin(bark_methods, (-1, 0, 1))] = np.nan
+
+    result = dict(base)
+    result['n_draws'] = n_points
+    result['points'] = list(points)
+    shape = (n_points,) + diameterr.shape
+    for key in ('diameter', 'delta_dia', 'age'):
+        result[key] = np.broadcast_to(base[key], shape)
+    result['diameterr'] = np.broadcast_to(diameterr, shape)
+    result['diameterr_geo'] = diameterr_geo
+    result['diameterr_geo_bark'] = diameterr_geo_bark
+    result['delta_diaa'] = _increments(diameterr_geo_bark, base['start'], base['has_data'])
+    return result
+
+
+def _draw_invariant(result, key):
+    """随机值维度上的广播视图取回单个 (年份, 样本) 矩阵"""
+    values = result[key]
+    return values[0] if result['n_draws'] is not None else values
+
+
+def biomass_requests(result):
+    """
+    返回需要计算生物量的直径
+
+    返回:
+    (原始直径, 校正后直径): 两个不含NaN的一维数组，顺序与 attach_biomass 的输入一致；
+    原始直径与随机值无关，只返回一份
+    """
+    raw = _draw_invariant(result, 'diameter')
+    corrected = result['diameterr_geo_bark']
+    return raw[~np.isnan(raw)], corrected[~np.isnan(corrected)]
+
+
+def attach_biomass(result, raw_biomass, corrected_biomass):
+    """
+    把生物量填回矩阵并计算生物量增量
+
+    参数:
+    result: compute_site_diameters 的返回值（原地添加 biomass, biomasss, delta_bio, delta_bioo）
+    raw_biomass, corrected_biomass: 与 biomass_requests 返回的直径等长的生物量
+    """
+    raw = _draw_invariant(result, 'diameter')
+    biomass = np.full(raw.shape, np.nan)
+    biomass[~np.isnan(raw)] = raw_biomass
+    delta_bio = _increments(biomass, result['start'], result['has_data'])
+    if result['n_draws'] is not None:
+        shape = (result['n_draws'],) + raw.shape
+        biomass = np.broadcast_to(biomass, shape)
+        delta_bio = np.broadcast_to(delta_bio, shape)
+    result['biomass'] = biomass
+    result['delta_bio'] = delta_bio
+
+    corrected = result['diameterr_geo_bark']
+    biomasss = np.full(corrected.shape, np.nan)
+    biomasss[~np.isnan(corrected)] = corrected_biomass
+    result['biomasss'] = biomasss
+    result['delta_bioo'] = _increments(biomasss, result['start'], result['has_data'])
+    return result
+
+
+def invariant_columns(result, key):
+    """
+    与随机值无关的矩阵展开为输出表的列（每个站点只需一份）
+
+    返回:
+    (年份, 样本) 二维数组，只包含有有效值的样本
+    """
+    return _draw_invariant(result, key)[:, result['has_data']]
+
+
+def draw_columns(result, key):
+    """
+    把一个矩阵展开为输出表的列
+
+    返回:
+    (年份, 列) 二维数组，列按 随机值 -> 样本 的顺序排列，只包含有有效值的样本
+    """
+    values = result[key]
+    if result['n_draws'] is None:
+        return values[:, result['has_data']]
+    values = values[:, :, result['has_data']]
+    return np.moveaxis(values, 0, 1).reshape(values.shape[1], -1)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+随机值 (Monte Carlo) 结果的流式统计
+
+随机值很多时 (times 为数百到数千)，保留每个随机值的所有样本列会使内存随 times
+线性增长。流式模式下每块随机值计算完成后立即更新各变量、各年份的累加量，然后丢弃
+该块的样本列：
+- 每个随机值的站点年表 (该年所有样本的 Tukey biweight 稳健均值，与非流式模式的
+  mean_{变量}_{随机值} 列相同，见 chronology.site_chronology) 在随机值之间的均值和方差，
+  使用 Welford / Chan 的合并公式逐块更新，数值稳定；
+- 最小值、最大值；
+- 样本量 (samp.depth，该年有值的样本数，在随机值之间取平均)。
+
+内存只与 年份数 × 变量数 有关，与随机值个数无关。
+
+所有随机值的结果都在内存中时，summarize_draws 先计算每个随机值的站点年表
+(同样是 Tukey biweight 稳健均值)，再用一次向量化计算得到随机值之间逐年的均值、
+标准差和百分位数 (如 2.5/50/97.5)，代替每个随机值一列的均值表。
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from chronology import site_chronology
+
+# 默认输出的百分位数 (95% 区间和中位数)
+DEFAULT_PERCENTILES = (2.5, 50, 97.5)
+
+
+def summarize_draws(years, values, variable, percentiles=DEFAULT_PERCENTILES):
+    """
+    随机值之间的逐年汇总表
+
+    参数:
+    years: 年份序列
+    values: (随机值, 年份, 样本) 数组
+    variable: 变量名，用于列名
+    percentiles: 百分位数序列 (0-100)
+
+    返回:
+    DataFrame: Year, mean_{变量}, sd_{变量}, p{百分位数}_{变量}..., samp.depth, n_draws
+    统计量都在每个随机值的 biweight 年表 (chronology.site_chronology) 之间计算
+    """
+    draw_means, depths = site_chronology(values)
+    frame = pd.DataFrame({'Year': np.asarray(years)})
+    with warnings.catch_warnings():
+        # 某年所有随机值都没有样本时结果为NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        frame[f'mean_{variable}'] = np.nanmean(draw_means, axis=0)
+        frame[f'sd_{variable}'] = np.nanstd(draw_means, axis=0, ddof=1)
+        if len(percentiles) > 0:
+            bands = np.nanpercentile(draw_means, list(percentiles), axis=0)
+            for q, band in zip(percentiles, bands):
+                frame[f'p{q:g}_{variable}'] = band
+    frame['samp.depth'] = depths.mean(axis=0)
+    frame['n_draws'] = draw_means.shape[0]
+    return frame
+
+
+class _RunningStatistics:
+    """一个变量逐年的流式统计量"""
+
+    def __init__(self, n_years):
+        self.count = np.zeros(n_years)
+        self.mean = np.zeros(n_years)
+        self.m2 = np.zeros(n_years)
+        self.minimum = np.full(n_years, np.inf)
+        self.maximum = np.full(n_years, -np.inf)
+        self.depth_sum = np.zeros(n_years)
+        self.n_draws = 0
+
+    def update(self, draw_means, draw_depths):
+        """
+        合并一块随机值
+
+        参数:
+        draw_means: (随机值, 年份) 每个随机值的站点年表，无样本的年份为NaN
+        draw_depths: (随机值, 年份) 每个随机值的样本量
+        """
+        valid = ~np.isnan(draw_means)
+        count_b = valid.sum(axis=0).astype(float)
+        filled = np.where(valid, draw_means, 0.0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_b = np.where(count_b > 0, filled.sum(axis=0) / count_b, 0.0)
+        m2_b = np.where(valid, (draw_means - mean_b) ** 2, 0.0).sum(axis=0)
+
+        count = self.count + count_b
+        delta = mean_b - self.mean
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ratio = np.where(count > 0, count_b / count, 0.0)
+        self.mean = self.mean + delta * ratio
+        self.m2 = self.m2 + m2_b + delta ** 2 * self.count * ratio
+        self.count = count
+
+        self.minimum = np.minimum(self.minimum, np.where(valid, draw_means, np.inf).min(axis=0))
+        self.maximum = np.maximum(self.maximum, np.where(valid, draw_means, -np.inf).max(axis=0))
+        self.depth_sum += draw_depths.sum(axis=0)
+        self.n_draws += draw_means.shape[0]
+
+
+class DrawStatistics:
+    """
+    站点所有变量的流式随机值统计
+
+    参数:
+    years: 年份序列
+    variables: 变量名列表，如 ['dia', 'bio', ...]
+    """
+
+    def __init__(self, years, variables):
+        self.years = pd.Index(years)
+        self._statistics = {variable: _RunningStatistics(len(self.years)) for variable in variables}
+
+    @property
+    def n_draws(self):
+        return max((s.n_draws for s in self._statistics.values()), default=0)
+
+    def update(self, variable, values):
+        """
+        加入一块随机值的结果
+
+        参数:
+        values: (随机值, 年份, 样本) 数组 (可以是广播视图)
+        """
+        draw_chronologies, depths = site_chronology(values)
+        self._statistics[variable].update(draw_chronologies, depths)
+
+    def to_frame(self, variable):
+        """
+        输出统计表
+
+        返回:
+        DataFrame: Year, mean_{变量}, sd_{变量}, min_{变量}, max_{变量}, samp.depth, n_draws
+        """
+        stats = self._statistics[variable]
+        has_values = stats.count > 0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sd = np.where(stats.count > 1, np.sqrt(stats.m2 / (stats.count - 1)), np.nan)
+            depth = stats.depth_sum / stats.n_draws if stats.n_draws else np.full(len(self.years), np.nan)
+        return pd.DataFrame({
+            'Year': np.asarray(self.years),
+            f'mean_{variable}': np.where(has_values, stats.mean, np.nan),
+            f'sd_{variable}': sd,
+            f'min_{variable}': np.where(has_values, stats.minimum, np.nan),
+            f'max_{variable}': np.where(has_values, stats.maximum, np.nan),
+            'samp.depth': depth,
+            'n_draws': stats.n_draws,
+        })
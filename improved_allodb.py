@@ -1,6 +1,9 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-def estimate_biomass_using_get_biomass(dbh, taxa, coords=(-76.8, 39.2)):
+import os
+
+
+def estimate_biomass_using_get_biomass(dbh, taxa, coords=(-76.8, 39.2), backend=None):
     """
     使用allodb包的get_biomass函数估算树木生物量
     
@@ -8,6 +11,7 @@ def estimate_biomass_using_get_biomass(dbh, taxa, coords=(-76.8, 39.2)):
     dbh: 胸径值(cm)，可以是单个值或列表
     taxa: 树种分类信息，可以是属名或"属 种"格式
     coords: 坐标元组 (经度, 纬度)，默认为北美坐标(-76.8, 39.2)
+    backend: 生物量后端 ('r' 或 'native')，默认使用 set_biomass_backend 的设置
     
     返回:
     pandas DataFrame: 包含生物量估算结果
@@ -19,6 +23,13 @@ def estimate_biomass_using_get_biomass(dbh, taxa, coords=(-76.8, 39.2)):
     import pandas as pd
     import numpy as np
     
+    # 优先使用原生后端或常驻引擎，避免为单次计算启动Rscript
+    biomass_function = get_biomass_function(backend) if coords is not None else None
+    if biomass_function is not None:
+        dbh_values = list(dbh) if isinstance(dbh, (list, tuple)) else [dbh]
+        agb = biomass_function(np.array(dbh_values, dtype=float), taxa, coords=coords)
+        return pd.DataFrame({'dbh': dbh_values, 'agb': agb})
+    
     # 创建临时文件
     temp_output = tempfile.NamedTemporaryFile(suffix='.csv', delete=False).name
     temp_script = tempfile.NamedTemporaryFile(suffix='.R', delete=False).name
@@ -155,87 +166,281 @@ def estimate_biomass_using_get_biomass(dbh, taxa, coords=(-76.8, 39.2)):
         except:
             pass
 
-# 添加批量处理函数，大幅减少R脚本调用次数
-def batch_estimate_biomass(dbh_list, taxa, coords=(-76.8, 39.2)):
+# 与 estimate_biomass_using_get_biomass 的R脚本相同的属种检查：
+# 属名在allodb中没有方程时报错 (结果为NaN)，种名没有精确匹配时警告并回退到属级方程
+_R_CHECK_TAXA = """
+check_taxa <- function(genus, species) {
+    available_taxa <- unique(equations$equation_taxa)
+    full_name <- if (species == "") genus else paste(genus, species)
+    matches <- grep(paste0("^", genus), available_taxa, value = TRUE)
+    if (length(matches) == 0) {
+        stop(paste("No equations found for genus", genus))
+    }
+    if (species != "") {
+        species_matches <- grep(paste0("^", full_name, "$"), available_taxa, value = TRUE)
+        if (length(species_matches) == 0) {
+            warning(paste("No exact match for species", full_name, "- falling back to genus level equations"))
+        }
+    }
+}
+"""
+
+
+# 常驻进程内的allodb引擎 - 每个Python进程只加载一次allodb
+class AllodbEngine:
     """
-    批量估算树木生物量，大幅提高性能
-    
+    通过rpy2在当前进程内常驻的allodb计算引擎
+
+    构造时只执行一次 library(allodb) 和 data("equations")，之后每次调用
+    get_biomass 都直接把NumPy数组作为R数值向量传入，不再生成临时R脚本、
+    启动Rscript进程或通过临时CSV读回结果。
+    R解释器不是线程安全的，所有调用都通过一个锁串行执行。
+    """
+
+    def __init__(self):
+        import threading
+        from rpy2.robjects import r
+
+        # 加载包和方程表 - 只在引擎创建时执行一次
+        r('suppressPackageStartupMessages(library(allodb))')
+        r('data("equations", package="allodb")')
+        r(_R_CHECK_TAXA)
+
+        self._get_biomass = r("""
+            function(dbh, genus, species, lon, lat) {
+                check_taxa(genus, species)
+                get_biomass(dbh = dbh, genus = genus, species = species, coords = c(lon, lat))
+            }
+        """)
+        # get_biomass 内部使用的参数估计: 一次拟合得到 a、b、sigma
+        self._est_params = r("""
+            function(genus, species, lon, lat) {
+                check_taxa(genus, species)
+                p <- est_params(genus = genus, species = if (species == "") NULL else species,
+                                coords = c(lon, lat))
+                c(p$a[1], p$b[1], p$sigma[1])
+            }
+        """)
+        self._lock = threading.Lock()
+
+    def get_biomass(self, dbh, taxa, coords=(-76.8, 39.2)):
+        """
+        对一组胸径批量计算地上生物量
+
+        参数:
+        dbh: 胸径(cm)，单个值、列表或NumPy数组
+        taxa: 树种分类信息，可以是属名或"属 种"格式
+        coords: 坐标元组 (经度, 纬度)
+
+        返回:
+        numpy数组: 与输入等长的生物量(kg)，R端出错时为NaN
+        """
+        import numpy as np
+        from rpy2.robjects import FloatVector
+        from rpy2.rinterface_lib.embedded import RRuntimeError
+
+        dbh_values = np.atleast_1d(np.asarray(dbh, dtype=float))
+        if dbh_values.size == 0:
+            return np.array([], dtype=float)
+
+        genus, species = split_taxa(taxa)
+        try:
+            with self._lock:
+                result = self._get_biomass(FloatVector(dbh_values), genus, species,
+                                           float(coords[0]), float(coords[1]))
+                agb = np.array(result, dtype=float)
+        except RRuntimeError as e:
+            print(f"R script errors:\n{e}")
+            return np.full(dbh_values.shape, np.nan)
+
+        return agb.reshape(dbh_values.shape)
+
+    def est_params(self, taxa, coords=(-76.8, 39.2)):
+        """
+        拟合 (树种, 坐标) 对应的幂函数参数，AGB = a * DBH^b * exp(sigma^2 / 2)
+
+        返回:
+        AllodbParams；R端出错时返回None
+        """
+        from rpy2.rinterface_lib.embedded import RRuntimeError
+        from allodb_native import AllodbParams
+
+        genus, species = split_taxa(taxa)
+        try:
+            with self._lock:
+                a, b, sigma = (float(v) for v in self._est_params(genus, species,
+                                                                  float(coords[0]), float(coords[1])))
+        except RRuntimeError as e:
+            print(f"R script errors:\n{e}")
+            return None
+        return AllodbParams(a=a, b=b, sigma=sigma)
+
+
+_ALLODB_ENGINE = None
+_ALLODB_ENGINE_ERROR = None
+
+
+def get_allodb_engine():
+    """
+    获取当前进程的allodb引擎（首次调用时创建）
+
+    返回:
+    AllodbEngine实例；rpy2或allodb不可用时返回None
+    """
+    global _ALLODB_ENGINE, _ALLODB_ENGINE_ERROR
+    if _ALLODB_ENGINE is None and _ALLODB_ENGINE_ERROR is None:
+        try:
+            _ALLODB_ENGINE = AllodbEngine()
+        except Exception as e:
+            # 记录失败原因，避免每次调用都重新尝试加载R
+            _ALLODB_ENGINE_ERROR = e
+            print(f"无法创建进程内allodb引擎，将回退到Rscript: {e}")
+    return _ALLODB_ENGINE
+
+
+# 生物量计算后端: 'r' 使用allodb本身，'native' 使用 allodb_native 的NumPy实现
+BIOMASS_BACKENDS = ('r', 'native')
+_BIOMASS_BACKEND = os.environ.get('TR_SNP_BIOMASS_BACKEND', 'r')
+
+
+def set_biomass_backend(backend):
+    """
+    选择生物量计算后端
+
     参数:
-    dbh_list: 胸径列表，每个元素可以是单个值或列表
+    backend: 'r' (allodb，需要R) 或 'native' (allodb_native，只需要NumPy和导出的数据表)
+    """
+    global _BIOMASS_BACKEND
+    if backend not in BIOMASS_BACKENDS:
+        raise ValueError(f"未知的生物量后端: {backend}，可选: {', '.join(BIOMASS_BACKENDS)}")
+    _BIOMASS_BACKEND = backend
+
+
+def get_biomass_backend():
+    """返回当前的生物量计算后端名称"""
+    return _BIOMASS_BACKEND
+
+
+_NATIVE_BACKEND_ERROR = None
+
+
+def get_biomass_function(backend=None):
+    """
+    返回当前后端的数组计算函数 f(dbh, taxa, coords) -> numpy数组
+
+    原生后端的数据表不可用时回退到R引擎（失败原因只记录一次，之后不再尝试加载）；
+    两者都不可用时返回None（调用方回退到Rscript）
+    """
+    global _NATIVE_BACKEND_ERROR
+    backend = backend or _BIOMASS_BACKEND
+    if backend == 'native' and _NATIVE_BACKEND_ERROR is None:
+        import allodb_native
+        try:
+            allodb_native.get_allodb_tables()
+            return allodb_native.get_biomass
+        except (FileNotFoundError, ValueError) as e:
+            _NATIVE_BACKEND_ERROR = e
+            print(f"原生allodb后端不可用，回退到R: {e}")
+    engine = get_allodb_engine()
+    return engine.get_biomass if engine is not None else None
+
+
+def fit_biomass_params(taxa, coords=(-76.8, 39.2), backend=None):
+    """
+    拟合一次 allodb 参数 (a, b, sigma)，不做缓存 (缓存见 biomass_store)
+
+    R 版 get_biomass 每次调用都重新随机重采样并拟合，同一 (树种, 坐标) 的多次调用
+    结果略有不同；固定一组参数后，所有DBH都由同一次拟合计算。
+
+    返回:
+    AllodbParams；后端不可用或无法拟合（如属名不在allodb中）时返回None
+    """
+    import math
+    import allodb_native
+
+    backend = backend or _BIOMASS_BACKEND
+    params = None
+    if backend == 'native' and get_biomass_function('native') is allodb_native.get_biomass \
+            and not allodb_native.requires_r(taxa, coords):
+        genus, species = split_taxa(taxa)
+        try:
+            params = allodb_native.get_allodb_tables().est_params(genus, species, coords)
+        except (ValueError, KeyError) as e:
+            print(f"原生allodb计算失败: {e}")
+    else:
+        engine = get_allodb_engine()
+        if engine is not None:
+            params = engine.est_params(taxa, coords)
+    if params is None or not all(math.isfinite(v) for v in params):
+        return None
+    return params
+
+
+def evaluate_biomass_params(params, dbh):
+    """按拟合参数计算生物量: AGB = a * DBH^b * exp(sigma^2 / 2)"""
+    import numpy as np
+    dbh = np.asarray(dbh, dtype=float)
+    return params.a * dbh ** params.b * np.exp(params.sigma ** 2 / 2)
+
+
+def split_taxa(taxa):
+    """将"属 种"格式的分类信息拆分为 (属, 种)，只有属名时种为空字符串"""
+    genus = taxa.split()[0] if " " in taxa else taxa
+    species = taxa.split()[1] if " " in taxa else ""
+    return genus, species
+
+
+def estimate_biomass_array(dbh, taxa, coords=(-76.8, 39.2), backend=None):
+    """
+    以NumPy数组为输入和输出的生物量估算入口
+
+    参数:
+    dbh: 胸径(cm)数组
     taxa: 树种分类信息，可以是属名或"属 种"格式
-    coords: 坐标元组 (经度, 纬度)，默认为北美坐标(-76.8, 39.2)
-    
+    coords: 坐标元组 (经度, 纬度)
+    backend: 生物量后端 ('r' 或 'native')，默认使用 set_biomass_backend 的设置
+
     返回:
-    pandas DataFrame: 包含所有生物量估算结果
+    numpy数组: 与输入等长的生物量(kg)
+    """
+    import numpy as np
+
+    biomass_function = get_biomass_function(backend)
+    if biomass_function is not None:
+        return biomass_function(dbh, taxa, coords=coords)
+
+    # 引擎不可用时回退到Rscript子进程
+    dbh_values = np.atleast_1d(np.asarray(dbh, dtype=float))
+    genus, species = split_taxa(taxa)
+    result = _rscript_get_biomass(dbh_values.tolist(), genus, species, coords)
+    return result['agb'].values.astype(float)
+
+
+def _rscript_get_biomass(all_dbh, genus, species, coords):
+    """
+    通过Rscript子进程调用get_biomass（无法在进程内加载allodb时的回退方案）
+
+    返回:
+    pandas DataFrame: 包含dbh和agb两列
     """
     import os
-    import sys
     import tempfile
     import subprocess
     import pandas as pd
     import numpy as np
-    import json
-    
+
     # 创建临时文件
     temp_output = tempfile.NamedTemporaryFile(suffix='.csv', delete=False).name
     temp_script = tempfile.NamedTemporaryFile(suffix='.R', delete=False).name
-    
+
     # 确保路径使用正斜杠，避免R中的转义问题
     temp_output_r = temp_output.replace('\\', '/')
-    temp_script_r = temp_script.replace('\\', '/')
-    
+
     try:
-        # 解析属和种
-        genus = taxa.split()[0] if " " in taxa else taxa
-        species = taxa.split()[1] if " " in taxa else ""
-        
         # 准备坐标数据
         coords_str = f"c({coords[0]}, {coords[1]})"
-        
-        # 将所有DBH值扁平化为一个大列表
-        all_dbh = []
-        id_mapping = []  # 记录每个DBH值的原始位置
-        
-        for i, dbh in enumerate(dbh_list):
-            try:
-                if isinstance(dbh, (list, tuple, np.ndarray)):
-                    # 处理数组/列表
-                    for j, val in enumerate(dbh):
-                        try:
-                            # 处理NaN和None值
-                            if val is None or (isinstance(val, float) and np.isnan(val)):
-                                all_dbh.append(0.01)  # 使用小值代替NaN
-                            else:
-                                all_dbh.append(float(val))
-                            id_mapping.append((i, j))
-                        except (ValueError, TypeError):
-                            print(f"警告: 无法转换值 {val} 为浮点数，使用默认值0.01")
-                            all_dbh.append(0.01)
-                            id_mapping.append((i, j))
-                else:
-                    # 处理单个值
-                    if dbh is None or (isinstance(dbh, float) and np.isnan(dbh)):
-                        all_dbh.append(0.01)
-                    else:
-                        all_dbh.append(float(dbh))
-                    id_mapping.append((i, 0))
-            except Exception as e:
-                print(f"处理DBH值时出错: {e}，使用默认值0.01")
-                if isinstance(dbh, (list, tuple, np.ndarray)):
-                    for j in range(len(dbh)):
-                        all_dbh.append(0.01)
-                        id_mapping.append((i, j))
-                else:
-                    all_dbh.append(0.01)
-                    id_mapping.append((i, 0))
-        
-        # 将DBH列表转换为R格式 - 确保没有方括号，直接用逗号分隔数字
-        if len(all_dbh) == 0:
-            print("警告: 没有有效的DBH值，使用默认值0.01")
-            all_dbh = [0.01]
-            
         dbh_str = ','.join(str(x) for x in all_dbh)
-        
+
         # 创建R脚本
         with open(temp_script, 'w') as f:
             f.write(f"""
@@ -244,11 +449,15 @@ def batch_estimate_biomass(dbh_list, taxa, coords=(-76.8, 39.2)):
             
             # 加载包
             suppressPackageStartupMessages(library(allodb))
+            data("equations", package="allodb")
+            
+            # 检查输入参数的有效性
+            {_R_CHECK_TAXA}
             
             # 批量处理函数
             process_batch <- function() {{
-                # 获取allodb中所有可用的属和种
-                data("equations", package="allodb")
+                # 检查属种是否存在于数据库中
+                check_taxa("{genus}", "{species}")
                 
                 # 使用get_biomass函数进行批量计算
                 result <- get_biomass(
@@ -277,14 +486,14 @@ def batch_estimate_biomass(dbh_list, taxa, coords=(-76.8, 39.2)):
                 write.csv(output, "{temp_output_r}", row.names=FALSE)
             }})
             """)
-        
+
         # 执行R脚本
         result = subprocess.run(
             ["Rscript", temp_script], 
             capture_output=True, 
             text=True
         )
-        
+
         # 只在出错时打印R脚本的输出
         if "ERROR:" in result.stdout or result.stderr:
             print("R script errors:")
@@ -292,13 +501,93 @@ def batch_estimate_biomass(dbh_list, taxa, coords=(-76.8, 39.2)):
                 print(result.stdout)
             if result.stderr:
                 print(result.stderr)
+
+        if os.path.exists(temp_output) and os.path.getsize(temp_output) > 0:
+            return pd.read_csv(temp_output)
+        return pd.DataFrame({'dbh': all_dbh, 'agb': [np.nan] * len(all_dbh)})
+
+    finally:
+        # 清理临时文件
+        try:
+            os.remove(temp_script)
+            if os.path.exists(temp_output):
+                os.remove(temp_output)
+        except:
+            pass
+
+# 添加批量处理函数，大幅减少R脚本调用次数
+def batch_estimate_biomass(dbh_list, taxa, coords=(-76.8, 39.2)):
+    """
+    批量估算树木生物量，大幅提高性能
+    
+    参数:
+    dbh_list: 胸径列表，每个元素可以是单个值或列表
+    taxa: 树种分类信息，可以是属名或"属 种"格式
+    coords: 坐标元组 (经度, 纬度)，默认为北美坐标(-76.8, 39.2)
+    
+    返回:
+    pandas DataFrame: 包含所有生物量估算结果
+    """
+    import pandas as pd
+    import numpy as np
+    
+    try:
+        # 解析属和种
+        genus, species = split_taxa(taxa)
+        
+        # 将所有DBH值扁平化为一个大列表
+        all_dbh = []
+        id_mapping = []  # 记录每个DBH值的原始位置
+        
+        for i, dbh in enumerate(dbh_list):
+            try:
+                if isinstance(dbh, (list, tuple, np.ndarray)):
+                    # 处理数组/列表
+                    for j, val in enumerate(dbh):
+                        try:
+                            # 处理NaN和None值
+                            if val is None or (isinstance(val, float) and np.isnan(val)):
+                                all_dbh.append(0.01)  # 使用小值代替NaN
+                            else:
+                                all_dbh.append(float(val))
+                            id_mapping.append((i, j))
+                        except (ValueError, TypeError):
+                            print(f"警告: 无法转换值 {val} 为浮点数，使用默认值0.01")
+                            all_dbh.append(0.01)
+                            id_mapping.append((i, j))
+                else:
+                    # 处理单个值
+                    if dbh is None or (isinstance(dbh, float) and np.isnan(dbh)):
+                        all_dbh.append(0.01)
+                    else:
+                        all_dbh.append(float(dbh))
+                    id_mapping.append((i, 0))
+            except Exception as e:
+                print(f"处理DBH值时出错: {e}，使用默认值0.01")
+                if isinstance(dbh, (list, tuple, np.ndarray)):
+                    for j in range(len(dbh)):
+                        all_dbh.append(0.01)
+                        id_mapping.append((i, j))
+                else:
+                    all_dbh.append(0.01)
+                    id_mapping.append((i, 0))
+        
+        # 将DBH列表转换为R格式 - 确保没有方括号，直接用逗号分隔数字
+        if len(all_dbh) == 0:
+            print("警告: 没有有效的DBH值，使用默认值0.01")
+            all_dbh = [0.01]
+            
+        # 一次性计算所有DBH值 - 优先使用原生后端或常驻引擎，否则回退到Rscript
+        biomass_function = get_biomass_function()
+        if biomass_function is not None:
+            agb = biomass_function(np.array(all_dbh, dtype=float), taxa, coords=coords)
+            all_results = pd.DataFrame({'dbh': all_dbh, 'agb': agb})
+        else:
+            all_results = _rscript_get_biomass(all_dbh, genus, species, coords)
         
         # 检查输出
-        if os.path.exists(temp_output) and os.path.getsize(temp_output) > 0:
+        if all_results is not None and len(all_results) > 0:
             try:
-                # 读取所有结果
-                all_results = pd.read_csv(temp_output)
-                
                 # 根据原始位置重组结果
                 results = []
                 for i, _ in enumerate(dbh_list):
@@ -344,19 +633,10 @@ def batch_estimate_biomass(dbh_list, taxa, coords=(-76.8, 39.2)):
                    for dbh in dbh_list]
     
     except Exception as e:
-        print(f"批量执行R脚本时出错: {e}")
+        print(f"批量计算生物量时出错: {e}")
         return [pd.DataFrame({'dbh': dbh if isinstance(dbh, (list, tuple)) else [dbh], 
                              'agb': [np.nan] * (len(dbh) if isinstance(dbh, (list, tuple)) else 1)}) 
                for dbh in dbh_list]
-    
-    finally:
-        # 清理临时文件
-        try:
-            os.remove(temp_script)
-            if os.path.exists(temp_output):
-                os.remove(temp_output)
-        except:
-            pass
 
 # 增加一个缓存装饰器以避免对相同参数的重复计算
 def memoize(func):
@@ -9,7 +9,25 @@ import rpy2.robjects
 from rpy2.robjects import r, pandas2ri
 from rpy2.robjects.conversion import localconverter
 from rpy2.robjects.packages import importr
-from improved_allodb import batch_estimate_biomass
+from improved_allodb import estimate_biomass_array, get_biomass_backend, fit_biomass_params
+from biomass_pool import start_biomass_pool, get_active_biomass_pool
+from biomass_lut import set_biomass_mode, get_biomass_mode, get_lookup_table
+from biomass_store import set_biomass_store, get_biomass_store
+from biomass_batch import SiteBiomassBatch
+from biomass_planner import BiomassPlanner
+from site_results import SiteResults
+from chronology import get_chronology_backend, set_chronology_backend, chronology_frame, dplr_chronology_frames
+from site_stages import run_stage, stage_key, file_fingerprint, get_stage_cache, set_stage_cache
+from chronology_cache import get_chronology_cache, set_chronology_cache, chronology_key, rwl_content_hash
+from site_statistics import EPS_THRESHOLD, eps_cutoff_year, apply_year_cutoff
+from detrend import detrend_spline
+from tucson import read_rwl, get_rwl_reader
+from sampling import sample_initial_widths, make_sampler_rng, set_sampling_method, get_sampling_method
+from draw_statistics import DrawStatistics, summarize_draws, DEFAULT_PERCENTILES
+from diameter_engine import (DRAW_INVARIANT_KEYS, compute_site_diameters, compute_sweep_diameters,
+                             draw_chunks, biomass_requests, attach_biomass, draw_columns, invariant_columns)
+from correction_sweep import correction_grid, sweep_frame
+from species_mapper import SPECIES_CODE_MAP
 
 # Activate pandas R object conversion
 pandas2ri.activate()
@@ -19,6 +37,21 @@ METADATA_CACHE = {} # Global cache for tree metadata  # 全局缓存，用于存
 dplR = importr('dplR')
 r_base = importr('base')
 
+# 输出变量 -> diameter_engine 结果中对应的矩阵
+SITE_OUTPUT_COLUMNS = (
+    ('dia', 'diameter'),
+    ('bio', 'biomass'),
+    ('delta_dia', 'delta_dia'),
+    ('delta_bio', 'delta_bio'),
+    ('diaa', 'diameterr_geo_bark'),
+    ('bioo', 'biomasss'),
+    ('delta_diaa', 'delta_diaa'),
+    ('delta_bioo', 'delta_bioo'),
+    ('age', 'age'),
+)
+# 与随机值无关的输出变量: 每个站点只计算和保存一份
+SITE_INVARIANT_VARIABLES = tuple(key for key, source in SITE_OUTPUT_COLUMNS if source in DRAW_INVARIANT_KEYS)
+
 def get_metadata_for_tree(tree_name, metadata_file="metadata.csv"):
     """获取树木元数据（树种代码和坐标信息）"""
     species_code = "PIST"  # 默认树种代码
@@ -205,28 +238,14 @@ def process_tree_data(r_result, orig_dataframe=None, years=None, var_type='dia')
             return pd.DataFrame() # Return empty DataFrame
 
 # 生成随机值列表 - 修复的代码
-def generate_random_values(min_value, max_value, times):
-    '''生成随机值列表，使用集合保证唯一性，优化版本'''
+def generate_random_values(min_value, max_value, times, method=None, rng=None):
+    '''生成不重复的随机值列表 (抽样方法和种子见 sampling)'''
     if times <= 0:
         return [0 if times == 0 else min_value]  # 简化逻辑
-        
-    # 使用numpy生成随机值，比random更高效
-    import numpy as np
-    # 生成一批足够多的随机值以确保有足够的唯一值
-    batch_size = min(times * 3, 1000)  # 避免生成过多值
-    random_values = set()
-    
-    while len(random_values) < times:
-        new_values = np.round(np.random.uniform(min_value, max_value, batch_size), 3)
-        random_values.update(new_values)
-        # 如果生成了足够多的值，截断并返回
-        if len(random_values) >= times:
-            random_values_list = list(random_values)[:times]
-            print(f"Generated {len(random_values_list)} unique random values")
-            return random_values_list
-            
-    # 这里应该不会到达，但为安全起见
-    return list(random_values)[:times]  # 对于无校正模式，返回0
+
+    random_values_list = sample_initial_widths(min_value, max_value, times, method=method, rng=rng)
+    print(f"Generated {len(random_values_list)} unique random values")
+    return random_values_list
 
 # Add memoization decorator for expensive functions
 def memoize(func):
@@ -283,7 +302,6 @@ def calculate_biomass_batch(diameter_values, species_code, lat, lon, logger=None
                 logger.info(f"使用默认坐标: {coords}")
 
         # 获取拉丁名
-        from species_mapper import SPECIES_CODE_MAP
         latin_name = SPECIES_CODE_MAP.get(species_code, species_code)
         if species_code != latin_name:
             if logger:
@@ -296,46 +314,36 @@ def calculate_biomass_batch(diameter_values, species_code, lat, lon, logger=None
         if logger:
             logger.debug(f"开始批量计算 {len(diameter_values)} 个直径值")
 
-        results = batch_estimate_biomass([diameter_values], latin_name, coords=coords)
-
-        if not results:
-            if logger:
-                logger.error("批量计算返回空结果")
-            raise ValueError("批量计算返回空结果")
+        # 直接以数组形式交给常驻allodb引擎计算；启动了工作进程池时分派给进程池
+        pool = get_active_biomass_pool()
+        if pool is not None:
+            agb_values = pool.get_biomass(diameter_values, latin_name, coords=coords)
+        else:
+            agb_values = estimate_biomass_array(diameter_values, latin_name, coords=coords)
 
-        if not results[0].empty:
+        if len(agb_values) > 0:
             if logger:
-                logger.debug(f"批量计算成功，返回 {len(results[0]['agb'])} 个结果")
+                logger.debug(f"批量计算成功，返回 {len(agb_values)} 个结果")
 
             # 确保结果长度与输入长度相同
-            if len(results[0]['agb']) != len(diameter_values):
+            if len(agb_values) != len(diameter_values):
                 if logger:
-                    logger.warning(f"结果长度 ({len(results[0]['agb'])}) 与输入长度 ({len(diameter_values)}) 不匹配")
+                    logger.warning(f"结果长度 ({len(agb_values)}) 与输入长度 ({len(diameter_values)}) 不匹配")
 
                 # 填充结果到正确长度
                 output_values = np.full(len(diameter_values), np.nan)
-                min_len = min(len(results[0]['agb']), len(diameter_values))
-                output_values[:min_len] = results[0]['agb'].values[:min_len]
+                min_len = min(len(agb_values), len(diameter_values))
+                output_values[:min_len] = agb_values[:min_len]
                 return output_values
 
-            return results[0]['agb'].values
+            return agb_values
 
-        # 如果批处理失败，退回到逐一计算
+        # 如果批处理失败，退回到硬编码方程（整条序列一次计算，不再逐值调用allodb）
         if logger:
-            logger.warning("批量计算结果为空，回退到逐一计算")
-            
-        biomass_values = []
-        for dbh in diameter_values:
-            try:
-                from allometric_dict import allometric_dict
-                biomass = allometric_dict(dbh, species_code, lat, lon, logger)
-                biomass_values.append(biomass)
-            except Exception as e:
-                if logger:
-                    logger.error(f"计算单个生物量时出错: dbh={dbh}, error={e}")
-                biomass_values.append(np.nan)
+            logger.warning("批量计算结果为空，回退到硬编码方程")
 
-        return np.array(biomass_values)
+        from allometric_dict import allometric_dict_array
+        return allometric_dict_array(diameter_values, species_code, lat, lon, logger)
         
     except Exception as e:
         error_msg = f"批量计算生物量出错: {e}"
@@ -344,29 +352,71 @@ def calculate_biomass_batch(diameter_values, species_code, lat, lon, logger=None
         else:
             print(error_msg)
             
-        # 退回到逐一计算
-        biomass_values = []
-        for dbh in diameter_values:
-            try:
-                from allometric_dict import allometric_dict
-                biomass = allometric_dict(dbh, species_code, lat, lon, logger)
-                biomass_values.append(biomass)
-            except Exception as e2:
-                if logger:
-                    logger.error(f"计算单个生物量时出错: dbh={dbh}, error={e2}")
-                biomass_values.append(np.nan)
-
-        return np.array(biomass_values)
+        # 退回到硬编码方程
+        try:
+            from allometric_dict import allometric_dict_array
+            return allometric_dict_array(diameter_values, species_code, lat, lon, logger)
+        except Exception as e2:
+            if logger:
+                logger.error(f"使用硬编码方程计算生物量时出错: error={e2}")
+            return np.full(len(diameter_values), np.nan)
 
 # Add memoization for expensive functions
 biomass_cache = {}
 
+def stored_calculate_biomass_batch(diameter_values, species_code, lat, lon, logger=None):
+    '''
+    通过磁盘缓存 (biomass_store) 计算生物量，未启用缓存时直接计算
+    '''
+    store = get_biomass_store()
+    if store is None:
+        return calculate_biomass_batch(diameter_values, species_code, lat, lon, logger)
+    coords = (lon, lat) if lat is not None and lon is not None else (-76.8, 39.2)
+    latin_name = SPECIES_CODE_MAP.get(species_code, species_code)
+    # 缓存的是 allodb 一次拟合的参数，拟合失败时按原流程计算 (可能回退到硬编码方程)，结果不缓存
+    return store.get_biomass(
+        diameter_values, get_biomass_backend(), latin_name, coords,
+        lambda: fit_biomass_params(latin_name, coords),
+        lambda d: calculate_biomass_batch(d, species_code, lat, lon, logger))
+
+def fixed_fit_biomass_function(species_code, lat, lon):
+    '''
+    固定一次 allodb 拟合参数的站点生物量函数 (R 后端且未启用磁盘缓存时使用)
+
+    R 版 get_biomass 每次调用都重新拟合；固定参数后同一站点所有块的原始和校正生物量
+    来自同一次拟合，原始生物量的阶段缓存按参数区分。
+
+    返回:
+    (生物量函数, AllodbParams)；无法拟合时返回 (None, None)，调用方按原流程计算
+    '''
+    coords = (lon, lat) if lat is not None and lon is not None else (-76.8, 39.2)
+    latin_name = SPECIES_CODE_MAP.get(species_code, species_code)
+    params = fit_biomass_params(latin_name, coords)
+    if params is None:
+        return None, None
+    scale = np.exp(params.sigma ** 2 / 2)
+
+    def biomass_function(diameter_values):
+        return params.a * np.asarray(diameter_values, dtype=float) ** params.b * scale
+    return biomass_function, params
+
 def cached_calculate_biomass_batch(diameter_values, species_code, lat, lon, logger=None):
     '''
     Cached version of calculate_biomass_batch that stores results to avoid redundant calculations
     '''
     # Create a cache key from the parameters
-    cache_key = f"{species_code}_{lat}_{lon}"
+    # 键中包含生物量后端，切换后端后不会沿用旧后端的查找表和缓存结果
+    cache_key = f"{get_biomass_backend()}:{species_code}_{lat}_{lon}"
+
+    # 查找表模式: 每个树种/坐标只在DBH网格上精确计算一次，之后插值
+    if get_biomass_mode() == 'lut':
+        table = get_lookup_table(
+            cache_key, lambda d: stored_calculate_biomass_batch(d, species_code, lat, lon, logger))
+        return table(diameter_values)
+
+    # 启用磁盘缓存时所有直径使用缓存的拟合参数计算，不再使用整组直径作为键
+    if get_biomass_store() is not None:
+        return stored_calculate_biomass_batch(diameter_values, species_code, lat, lon, logger)
     
     # Convert diameter_values to tuple for hashability if it's a list
     if isinstance(diameter_values, list):
@@ -393,233 +443,149 @@ def cached_calculate_biomass_batch(diameter_values, species_code, lat, lon, logg
     
     return result
 
-# 处理单个树木列的代码 - 修复后的函数
-def process_tree_column(pdf_sub, first_valid_idx, rand_val, dbh_method, species_code, lat, lon, logger=None, file_Column_Randoms=None, col_idx=None, times=0, bark_method=0, region=None, user_geometric_rate=1.0, user_bark_rate=0.05):
-    """处理单个树木列的数据，计算直径和生物量
-    
-    参数说明:
-    - pdf_sub: 单个树木样本的数据
-    - first_valid_idx: 第一个有效值的索引
-    - rand_val: 随机值
-    - dbh_method: 树干直径校正方法
-        - -1: 不校正
-        - 0: Lockwood et al.,2021方程
-        - 1: 用户自定义校正率
-    - bark_method: 树皮处理方法
-        - -1: 自定义处理 (Custom)
-        - 0: 不处理树皮 (No)
-        - 1: 基于生物计量学处理 (Allometry)
-    - species_code: 树种代码
-    - lat, lon: 坐标
-    - logger: 日志记录器
-    - file_Column_Randoms: 自定义初始宽度偏差列表
-    - col_idx: 列索引
-    - times: 随机值次数
-    - region: 地区
-    - user_geometric_rate: 用户定义的几何校正率
-    - user_bark_rate: 用户定义的树皮校正率
+def read_tree_widths(tree_file, logger=None):
     """
-    # 获取开始和结束索引
-    y_start = first_valid_idx
-    y_end = pdf_sub.last_valid_index()
-    
-    if y_start is None or y_end is None:
-        return None, None, None, None, None, None, None, None, None
-    
-    # 初始化向量
-    diameter = pd.Series(np.nan, index=pdf_sub.index)
-    diameterr = pd.Series(np.nan, index=pdf_sub.index)
-    diameterr_geo = pd.Series(np.nan, index=pdf_sub.index)
-    diameterr_geo_bark = pd.Series(np.nan, index=pdf_sub.index)
-    biomass = pd.Series(np.nan, index=pdf_sub.index)
-    biomasss = pd.Series(np.nan, index=pdf_sub.index)
-    delta_dia = pd.Series(np.nan, index=pdf_sub.index)
-    delta_diaa = pd.Series(np.nan, index=pdf_sub.index)
-    delta_bio = pd.Series(np.nan, index=pdf_sub.index)
-    delta_bioo = pd.Series(np.nan, index=pdf_sub.index)
-    age = pd.Series(np.nan, index=pdf_sub.index)
+    读取年轮宽度文件 (Tucson格式) 并转换为pandas数据框
     
-    # 分别处理第一年和后续年份
-    # 第一年
-    if pdf_sub[y_start] == 0:
-        pdf_sub[y_start] = 1e-8
+    返回:
+    (pdf_input, years): 以年份为索引、第一列为Year的数据框，以及年份范围
+    """
+    # 直接解析 Tucson 文件，不需要 R (见 tucson)
+    pdf_input = read_rwl(tree_file)
+    years = range(int(pdf_input.index[0]), int(pdf_input.index[-1]) + 1)
     
-    # 添加随机宽度
-    # 为保留原始数据，创建一个带有初始宽度修正的副本用于计算diaa相关指标
-    pdf_sub_corrected = pdf_sub.copy()
+    # 显示一些基本信息，便于调试
+    if logger:
+        num_samples = len(pdf_input.columns)
+        logger.info(f"文件包含 {num_samples} 个样本，年份范围: {years[0]} - {years[-1]}")
     
-    # 只有在有效的条件下才应用初始宽度校正
-    if times < 0 and file_Column_Randoms is not None and col_idx is not None and col_idx < len(file_Column_Randoms):
-        # 只对校正后的数据应用初始宽度偏差
-        pdf_sub_corrected[y_start] = pdf_sub_corrected[y_start] + file_Column_Randoms[col_idx]
-    elif times > 0:
-        # 随机校正
-        pdf_sub_corrected[y_start] = pdf_sub_corrected[y_start] + rand_val
+    pdf_input.index = years
+    pdf_input.insert(0, "Year", years)
     
-    # 初始年龄和直径
-    age[y_start] = 1
+    # 记录原始数据的一些统计信息
+    if logger:
+        logger.info(f"转换后DataFrame形状: {pdf_input.shape}")
+        logger.info(f"DataFrame列名: {list(pdf_input.columns)}")
     
-    # 计算原始直径 (无校正)
-    diameter[y_start] = (2 * pdf_sub[y_start]) / 10  # cm
-    
-    # 计算校正后的直径 (应用了初始宽度校正)
-    diameterr[y_start] = (2 * pdf_sub_corrected[y_start]) / 10  # cm
+    return pdf_input, years
 
-    # geometric correction
-    if dbh_method == -1:
-        # No correction
-        diameterr_geo[y_start] = diameterr[y_start]
-    elif dbh_method == 0:
-        # Lockwood et al.,2021方程
-        diameterr_geo[y_start] = diameterr[y_start] * 0.998 + 22.3
-    elif dbh_method == 1:
-        # user defined correction rate
-        diameterr_geo[y_start] = diameterr[y_start] * user_geometric_rate
-        if logger:
-            logger.debug(f"Geometric correction - Original diameter: {diameterr[y_start]:.4f} cm, Rate: {user_geometric_rate}, Corrected: {diameterr_geo[y_start]:.4f} cm")
 
-    # bark correction
-    if bark_method == -1:
-        # Custom bark thickness based on user-defined rate
-        bark_thickness = diameterr_geo[y_start] * user_bark_rate
-        diameterr_geo_bark[y_start] = diameterr_geo[y_start] + bark_thickness
-        if logger and y_start % 20 == 0:
-            logger.debug(f"Year {y_start} custom bark correction - Original diameter: {diameterr_geo[y_start]:.4f} cm, Rate: {user_bark_rate}, Bark thickness: {bark_thickness:.4f} cm, Corrected: {diameterr_geo_bark[y_start]:.4f} cm")
-    elif bark_method == 0:
-        # No bark correction
-        diameterr_geo_bark[y_start] = diameterr_geo[y_start]
-    elif bark_method == 1:
-        # Allometry-based bark correction using bark_dict_species function
-        from bark_dict_species import bark_dict_species
-        bark_thickness = bark_dict_species(region, species_code, diameterr_geo[y_start])
-        if logger and y_start % 20 == 0:
-            logger.debug(f"Year {y_start} bark correction - Species: {species_code}, Original diameter: {diameterr_geo[y_start]:.4f} cm, Bark thickness: {bark_thickness:.4f} cm, Corrected: {diameterr_geo[y_start] + bark_thickness:.4f} cm")
-        diameterr_geo_bark[y_start] = diameterr_geo[y_start] + bark_thickness
+def read_site_widths(tree_file, logger=None):
+    """
+    parse 阶段: 读取年轮宽度文件，结果按文件标识和RWL读取方式缓存 (见 site_stages)
+
+    返回:
+    (阶段键, pdf_input, years)；pdf_input 为缓存结果的副本
+    """
+    parse_key, (pdf_input, years) = run_stage(
+        'parse', (file_fingerprint(tree_file), get_rwl_reader()), lambda: read_tree_widths(tree_file, logger), logger)
+    return parse_key, pdf_input.copy(), years
+
+
+def site_correction_rates(pdf_input, indexF, geometric_correction_rates, bark_correction_rates,
+                          default_geometric_rate, default_bark_rate, logger=None):
+    """查找站点每个样本的几何校正率和树皮校正率（先按样本名，再按列序号）
     
-    # 批量计算后续年份的直径
-    for k in range(y_start + 1, y_end + 1):
-        if pd.isna(pdf_sub[k]):
+    返回:
+    (几何校正率数组, 树皮校正率数组)，长度为除Year外的列数
+    """
+    geometric_rates = []
+    bark_rates = []
+    for i, column_name in enumerate(pdf_input.columns):
+        if column_name == 'Year':
             continue
         
-        # 替换零值
-        if pdf_sub[k] == 0:
-            pdf_sub[k] = 1e-8
-                
-            # 同样替换校正数据中的零值
-            if pdf_sub_corrected[k] == 0:
-                pdf_sub_corrected[k] = 1e-8
-        
-        # 计算年龄和累积直径
-        if not pd.isna(age[k-1]):
-            age[k] = age[k-1] + 1
-            
-        # 计算原始直径 (无校正)
-        diameter[k] = diameter[k-1] + (2 * pdf_sub[k]) / 10
-            
-        # 计算校正后的直径 (应用了初始宽度校正)
-        diameterr[k] = diameterr[k-1] + (2 * pdf_sub_corrected[k]) / 10
-    
-        # geometric correction
-        if dbh_method == -1:
-            diameterr_geo[k] = diameterr[k]
-        elif dbh_method == 0:
-            # Lockwood et al.,2021方程
-            diameterr_geo[k] = diameterr[k] * 0.998 + 22.3
-        elif dbh_method == 1:
-            # user defined correction rate
-            diameterr_geo[k] = diameterr[k] * user_geometric_rate
+        # Default rates
+        user_geometric_rate = default_geometric_rate
+        user_bark_rate = default_bark_rate
 
-        # bark correction
-        if bark_method == -1:
-            # Custom bark thickness based on user-defined rate
-            bark_thickness = diameterr_geo[k] * user_bark_rate
-            diameterr_geo_bark[k] = diameterr_geo[k] + bark_thickness
-            if logger and k % 20 == 0:
-                logger.debug(f"Year {k} custom bark correction - Original diameter: {diameterr_geo[k]:.4f} cm, Rate: {user_bark_rate}, Bark thickness: {bark_thickness:.4f} cm, Corrected: {diameterr_geo_bark[k]:.4f} cm")
-        elif bark_method == 0:
-            # No bark correction
-            diameterr_geo_bark[k] = diameterr_geo[k]
-        elif bark_method == 1:
-            # Allometry-based bark correction using bark_dict_species function
-            from bark_dict_species import bark_dict_species
-            bark_thickness = bark_dict_species(region, species_code, diameterr_geo[k])
-            if logger and k % 20 == 0:
-                logger.debug(f"Year {k} bark correction - Species: {species_code}, Original diameter: {diameterr_geo[k]:.4f} cm, Bark thickness: {bark_thickness:.4f} cm, Corrected: {diameterr_geo[k] + bark_thickness:.4f} cm")
-            diameterr_geo_bark[k] = diameterr_geo[k] + bark_thickness
-    
-    # 计算直径增量
-    delta_dia[y_start] = diameter[y_start]
-    delta_diaa[y_start] = diameterr_geo_bark[y_start]
-    
-    # 计算后续年份的直径增量
-    for k in range(y_start + 1, y_end + 1):
-        if not pd.isna(diameter[k]) and not pd.isna(diameter[k-1]):
-            delta_dia[k] = diameter[k] - diameter[k-1]
-        if not pd.isna(diameterr_geo_bark[k]) and not pd.isna(diameterr_geo_bark[k-1]):
-            delta_diaa[k] = diameterr_geo_bark[k] - diameterr_geo_bark[k-1]
-    
-    # 批量计算生物量
-    valid_indices = ~diameter.isna()
-    valid_diameters = diameter[valid_indices].values
-    
-    if len(valid_diameters) > 0:
-        try:
-            biomass_values = cached_calculate_biomass_batch(valid_diameters, species_code, lat, lon, logger)
-            
-            # 检查长度是否匹配
-            if len(biomass_values) == sum(valid_indices):
-                biomass[valid_indices] = biomass_values
-            else:
+        # Look up geometric correction rate by sample name if available
+        if geometric_correction_rates and indexF < len(geometric_correction_rates) and isinstance(geometric_correction_rates[indexF], dict):
+            if column_name in geometric_correction_rates[indexF]:
+                user_geometric_rate = geometric_correction_rates[indexF][column_name]
                 if logger:
-                    logger.error(f"生物量计算结果长度不匹配: 预期 {sum(valid_indices)}, 实际 {len(biomass_values)}")
-                # 回退到逐个赋值以避免长度不匹配错误
-                valid_idx_positions = np.where(valid_indices)[0]
-                for j, pos in enumerate(valid_idx_positions):
-                    if j < len(biomass_values):
-                        biomass.iloc[pos] = biomass_values[j]
-        except Exception as e:
+                    logger.info(f"Applied custom geometric rate for sample {column_name}: {user_geometric_rate}")
+            elif i in geometric_correction_rates[indexF]: # Fallback to index
+                user_geometric_rate = geometric_correction_rates[indexF][i]
+                if logger:
+                    logger.info(f"Applied index-based geometric rate for sample {column_name}: {user_geometric_rate}")
+        else:
             if logger:
-                logger.error(f"计算生物量时出错: {str(e)}")
-    
-    valid_indices = ~diameterr_geo_bark.isna()
-    valid_diameters = diameterr_geo_bark[valid_indices].values
-    
-    if len(valid_diameters) > 0:
-        try:
-            biomasss_values = cached_calculate_biomass_batch(valid_diameters, species_code, lat, lon, logger)
-            
-            # 检查长度是否匹配
-            if len(biomasss_values) == sum(valid_indices):
-                biomasss[valid_indices] = biomasss_values
-            else:
+                logger.info(f"Using default geometric rate for sample {column_name}: {user_geometric_rate}")
+
+        # Look up bark correction rate by sample name if available
+        if bark_correction_rates and indexF < len(bark_correction_rates) and isinstance(bark_correction_rates[indexF], dict):
+            if column_name in bark_correction_rates[indexF]:
+                user_bark_rate = bark_correction_rates[indexF][column_name]
                 if logger:
-                    logger.error(f"校正生物量计算结果长度不匹配: 预期 {sum(valid_indices)}, 实际 {len(biomasss_values)}")
-                # 回退到逐个赋值以避免长度不匹配错误
-                valid_idx_positions = np.where(valid_indices)[0]
-                for j, pos in enumerate(valid_idx_positions):
-                    if j < len(biomasss_values):
-                        biomasss.iloc[pos] = biomasss_values[j]
-        except Exception as e:
+                    logger.info(f"Using custom bark rate for sample {column_name}: {user_bark_rate}")
+            elif i in bark_correction_rates[indexF]: # Fallback to index
+                user_bark_rate = bark_correction_rates[indexF][i]
+                if logger:
+                    logger.info(f"Using index-based bark rate for sample {column_name}: {user_bark_rate}")
+        else:
             if logger:
-                logger.error(f"计算校正生物量时出错: {str(e)}")
+                logger.info(f"Using default bark rate for sample {column_name}: {user_bark_rate}")
+        
+        geometric_rates.append(user_geometric_rate)
+        bark_rates.append(user_bark_rate)
+    return np.array(geometric_rates, dtype=float), np.array(bark_rates, dtype=float)
+
+
+def prepare_site_columns(pdf_input, indexF, random_values, species_code, dbh_method, bark_method, times,
+                         file_Column_Randoms, geometric_correction_rates, bark_correction_rates,
+                         default_geometric_rate, default_bark_rate, logger=None, draw_chunk_size=None):
+    """计算一个站点所有样本和随机值的直径部分
     
-    # 计算生物量增量
-    delta_bio[y_start] = biomass[y_start]
-    delta_bioo[y_start] = biomasss[y_start]
+    所有随机值作为 (随机值, 年份, 样本) 的一个数组维度，由 diameter_engine.compute_site_diameters
+    一次计算；随机值按 draw_chunk_size 分块以限制内存。
     
-    # 计算后续年份的生物量增量 - 使用向量化操作
-    # 构建移位数据
-    shifted_biomass = biomass.shift(1)
-    shifted_biomasss = biomasss.shift(1)
+    参数说明:
+    - pdf_input: 站点的年轮宽度数据 (包含Year列，索引为年份)
+    - indexF: 文件序号，用于查找该文件的初始宽度偏差和校正率
+    - random_values: 随机值列表
+    - draw_chunk_size: 每块的随机值个数，None时自动确定 (见 diameter_engine.draw_chunks)
+    - 其余参数同 plot_allometry
+    
+    返回:
+    (columns, site_chunks): columns 为除Year外各列的 (列序号, 列名)；
+    site_chunks 为逐块生成 (起始, 结束, compute_site_diameters 结果) 的迭代器，起始/结束为随机值的序号
+    """
+    columns = [(i, col) for i, col in enumerate(pdf_input.columns) if col != 'Year']
+    widths = pdf_input[[col for _, col in columns]].to_numpy(dtype=float)
+    geometric_rates, bark_rates = site_correction_rates(
+        pdf_input, indexF, geometric_correction_rates, bark_correction_rates,
+        default_geometric_rate, default_bark_rate, logger)
     
-    # 计算差值 - 向量化操作
-    valid_mask = ~biomass.isna() & ~shifted_biomass.isna()
-    delta_bio[valid_mask] = biomass[valid_mask] - shifted_biomass[valid_mask]
+    # 自定义初始宽度偏差 (times < 0)，按列序号取当前文件的偏差
+    current_file_biases = file_Column_Randoms[indexF] if file_Column_Randoms and indexF < len(file_Column_Randoms) else []
+    biases = np.array([current_file_biases[i] if current_file_biases is not None and i < len(current_file_biases) else 0.0
+                       for i, _ in columns], dtype=float)
     
-    valid_mask = ~biomasss.isna() & ~shifted_biomasss.isna()
-    delta_bioo[valid_mask] = biomasss[valid_mask] - shifted_biomasss[valid_mask]
+    if logger:
+        for j, (i, col) in enumerate(columns):
+            if np.all(np.isnan(widths[:, j])):
+                logger.warning(f"列 {col} 没有有效值，跳过处理")
     
-    return diameter, diameterr, diameterr_geo, diameterr_geo_bark, biomass, biomasss, delta_dia, delta_diaa, delta_bio, delta_bioo, age
+    # 每个随机值、每个样本第一个有效年份的宽度偏差 (随机值, 样本)
+    if times < 0:
+        draw_offsets = np.broadcast_to(biases, (len(random_values), len(columns)))
+    elif times > 0:
+        draw_offsets = np.broadcast_to(np.asarray(random_values, dtype=float)[:, np.newaxis],
+                                       (len(random_values), len(columns)))
+    else:
+        draw_offsets = np.zeros((len(random_values), len(columns)))
+    
+    def site_chunks():
+        for lo, hi in draw_chunks(len(random_values), widths.shape[0], widths.shape[1], draw_chunk_size):
+            if logger:
+                logger.info(f"Processing random values {lo + 1}-{hi} of {len(random_values)}")
+            yield lo, hi, compute_site_diameters(
+                widths, draw_offsets[lo:hi], dbh_method, bark_method,
+                geometric_rates, bark_rates, species_code, "default")
+
+    return columns, site_chunks()
+
 
 # 设置显示图表的代码块 - 固定缩进问题
 def display_plot(processed_files, plot_file, logger):
@@ -635,10 +601,80 @@ def display_plot(processed_files, plot_file, logger):
         logger.warning("没有处理任何文件，跳过绘图")
         pyplot.close()
 
+def sweep_allometry(fk, times, file_Column_Randoms, output_path, metadata_file="metadata.csv",
+                    dbh_methods=(-1, 0, 1), geometric_rates=(1.0,), bark_methods=(-1, 0, 1), bark_rates=(0.05,),
+                    biomass_mode=None, biomass_store=None):
+    """
+    校正参数敏感性分析: 每个站点对所有 (dbh_method, 几何校正率, bark_method, 树皮校正率)
+    组合一次计算，写出一个长表 {站点}_correction_sweep.csv (见 correction_sweep)
+    
+    参数说明:
+    - fk, times, file_Column_Randoms, output_path, metadata_file: 同 plot_allometry；
+      times < 0 时使用自定义初始宽度偏差，times = 0 时不加偏差；扫描模式不支持
+      Monte Carlo 随机值，times > 0 时抛出 ValueError
+    - dbh_methods, geometric_rates, bark_methods, bark_rates: 各参数的取值列表，
+      校正率对所有样本相同
+    - biomass_mode, biomass_store: 同 plot_allometry；每个站点只有一次拟合，不使用生物量工作进程池
+    
+    返回:
+    {文件: 长表DataFrame}
+    """
+    if times > 0:
+        raise ValueError(f"校正参数扫描不支持 Monte Carlo 随机值 (times={times})，请使用 times=0 或 times<0")
+    logger = logging.getLogger('biomass_estimation')
+    logger.setLevel(logging.INFO)
+    if biomass_mode is not None:
+        set_biomass_mode(biomass_mode)
+    if biomass_store is not None:
+        set_biomass_store(None if biomass_store is True else biomass_store)
+    
+    points = correction_grid(dbh_methods, geometric_rates, bark_methods, bark_rates)
+    logger.info(f"校正参数扫描: {len(points)} 个参数组合, {len(fk)} 个文件")
+    
+    tables = {}
+    for indexF, tree_file in enumerate(fk):
+        mm = os.path.splitext(os.path.basename(tree_file))[0]
+        species_code, lat, lon = get_metadata_for_tree(mm, metadata_file)
+        try:
+            _, pdf_input, years = read_site_widths(tree_file, logger)
+        except Exception as e:
+            logger.error(f"读取文件失败 {tree_file}: {str(e)}")
+            continue
+        
+        columns = [(i, col) for i, col in enumerate(pdf_input.columns) if col != 'Year']
+        widths = pdf_input[[col for _, col in columns]].to_numpy(dtype=float)
+        offsets = 0.0
+        if times < 0 and file_Column_Randoms and indexF < len(file_Column_Randoms) and file_Column_Randoms[indexF] is not None:
+            biases = file_Column_Randoms[indexF]
+            offsets = np.array([biases[i] if i < len(biases) else 0.0 for i, _ in columns], dtype=float)
+        
+        result = compute_sweep_diameters(widths, points, offsets, species_code, "default")
+        
+        # 所有参数点的直径去重后一次计算生物量
+        site_batch = SiteBiomassBatch()
+        raw, corrected = biomass_requests(result)
+        raw_handle = site_batch.add(raw)
+        corrected_handle = site_batch.add(corrected)
+        site_batch.evaluate(lambda d: cached_calculate_biomass_batch(d, species_code, lat, lon, logger))
+        logger.info(f"站点生物量批处理: {site_batch.n_requested} 个直径值, 去重后计算 {site_batch.n_unique} 个")
+        attach_biomass(result, site_batch.result(raw_handle), site_batch.result(corrected_handle))
+        
+        table = sweep_frame(years, result)
+        output_file = os.path.join(output_path, f"{mm}_correction_sweep.csv")
+        table.to_csv(output_file, index=False)
+        logger.info(f"已保存校正参数扫描结果: {output_file}")
+        tables[tree_file] = table
+    return tables
+
+
 def plot_allometry(fk, min_value, max_value, times, file_Column_Randoms, 
                 dbh_method, bark_method, output_path, metadata_file="metadata.csv",
                 geometric_correction_rates=None, bark_correction_rates=None,
-                default_geometric_rate=1.0, default_bark_rate=0.05):
+                default_geometric_rate=1.0, default_bark_rate=0.05,
+                biomass_workers=0, biomass_mode=None, biomass_store=None, plan_biomass=None,
+                draw_chunk_size=None, result_dtype=None, stream_draws=False, keep_draw_columns=False,
+                draw_summary=None, sampling_method=None, sampling_seed=None, stage_cache=None,
+                chronology_backend=None, chronology_cache=None, eps_cutoff=None):
     """
     处理树木生物量计算和绘图
     
@@ -661,6 +697,26 @@ def plot_allometry(fk, min_value, max_value, times, file_Column_Randoms,
     - bark_correction_rates: 每个文件的每个样本的树皮校正率字典列表
     - default_geometric_rate: 默认几何校正率
     - default_bark_rate: 默认树皮校正率
+    - biomass_workers: 常驻allodb工作进程数，规划生物量 (plan_biomass，多文件运行) 时启动进程池，
+                       各 (拉丁名, 坐标网格) 分组并发计算 (见 biomass_pool、biomass_planner)；
+                       同一组的直径只有一次拟合，不拆分，因此不规划生物量时 (单站点) 不启动进程池；0为单进程
+    - biomass_mode: 生物量计算模式，'exact' 精确计算，'lut' 使用AGB-DBH查找表 (见 biomass_lut)；None保持当前设置
+    - biomass_store: 生物量磁盘缓存文件路径 (见 biomass_store)，True使用默认路径，False关闭，None保持当前设置
+    - plan_biomass: 是否先汇总所有文件的直径，按 (拉丁名, 坐标网格) 分组计算生物量 (见 biomass_planner)；None时多文件运行自动启用
+    - draw_chunk_size: 每次一起计算的随机值个数，用于限制内存 (见 diameter_engine.draw_chunks)；None时自动确定
+    - result_dtype: 站点结果数组的类型 (见 site_results)，'float32' 可使内存减半；None为float64
+    - stream_draws: times>0时按块流式统计各随机值的 biweight 年表在随机值之间的均值、标准差和范围 (见 draw_statistics)，
+                    内存与随机值个数无关
+    - keep_draw_columns: 流式模式下是否仍保存每个随机值的样本列
+    - draw_summary: 多个随机值时均值表只输出随机值之间的均值、标准差和百分位数 (见 draw_statistics.summarize_draws)；
+                    True使用默认百分位数 (2.5, 50, 97.5)，也可以传入百分位数序列；None保持每个随机值一列
+    - sampling_method: 初始宽度偏差的抽样方法，'uniform'、'lhs' 或 'sobol' (见 sampling)；None保持当前设置
+    - sampling_seed: 抽样的随机种子，设定后随机值可复现
+    - stage_cache: 阶段缓存 (见 site_stages)，True缓存到磁盘默认目录，也可以传入目录路径，False关闭，None保持当前设置 (默认只在内存中)
+    - chronology_backend: 年表计算后端，'native' NumPy biweight (见 chronology)，'r' dplR.chron；None保持当前设置
+    - chronology_cache: 原始直径和年龄年表的磁盘缓存 (见 chronology_cache；bio/delta_bio 不写入磁盘)，True使用默认目录，也可以传入目录路径，False关闭，None保持当前设置
+    - eps_cutoff: EPS 截断 (见 site_statistics)，均值表中去掉滑动窗口 EPS 达到阈值之前的年份；
+                  True使用阈值0.85，也可以传入阈值；None不截断
     """
     import logging
     import os
@@ -697,6 +753,21 @@ def plot_allometry(fk, min_value, max_value, times, file_Column_Randoms,
     logger.info(f"Bark method: {bark_method}")
     logger.info(f"Output path: {output_path}")
     logger.info(f"Metadata file: {metadata_file}")
+
+    if biomass_mode is not None:
+        set_biomass_mode(biomass_mode)
+    if sampling_method is not None or sampling_seed is not None:
+        set_sampling_method(sampling_method or get_sampling_method()[0], sampling_seed)
+    if chronology_backend is not None:
+        set_chronology_backend(chronology_backend)
+    if stage_cache is not None:
+        set_stage_cache(stage_cache if stage_cache is not False else None, enabled=stage_cache is not False)
+    if chronology_cache is not None:
+        set_chronology_cache(None if chronology_cache in (True, False) else chronology_cache,
+                             enabled=chronology_cache is not False)
+    if biomass_store is not None:
+        set_biomass_store(None if biomass_store is True else biomass_store)
+
     # Log the geometric correction rates
     logger.info("=== GEOMETRIC CORRECTION RATES ===")
     if geometric_correction_rates:
@@ -745,6 +816,54 @@ def plot_allometry(fk, min_value, max_value, times, file_Column_Randoms,
     # Moved import dplR to top level
     # Moved pandas2ri.activate() to top level
     
+    # 预先读取所有文件的元数据并生成随机值（按文件顺序，与逐个文件生成的随机序列相同）
+    site_metadata = []
+    file_random_values = []
+    sampler_rng = make_sampler_rng()
+    for tree_file in fk:
+        mm = os.path.splitext(os.path.basename(tree_file))[0]
+        site_metadata.append(get_metadata_for_tree(mm, metadata_file))
+        
+        # 生成随机值列表 - 所有文件共用一个随机数生成器，设定种子时结果可复现
+        if times > 0:
+            file_random_values.append(sample_initial_widths(min_value, max_value, times, rng=sampler_rng))
+        else:
+            # times = 0 或 times < 0 时，只使用一个固定的随机值
+            file_random_values.append([0])
+    
+    # 多文件运行时先规划生物量计算: 汇总所有站点的直径，按 (拉丁名, 坐标网格) 每组计算一次。
+    # 原始直径与随机值无关，只登记第一块；校正后的直径按块流式登记，登记后即丢弃，
+    # 内存只与每组的唯一直径个数有关。主循环按块重新计算直径 (年轮宽度来自 parse 阶段缓存)。
+    if plan_biomass is None:
+        plan_biomass = len(fk) > 1
+    planner = None
+    if biomass_workers and biomass_workers > 0 and not plan_biomass:
+        logger.info("未规划生物量 (单站点)，每个 (拉丁名, 坐标) 只有一次拟合，不启动生物量工作进程池")
+    if plan_biomass:
+        if biomass_workers and biomass_workers > 0:
+            start_biomass_pool(biomass_workers)
+        planner = BiomassPlanner(SPECIES_CODE_MAP)
+        for indexF, tree_file in enumerate(fk):
+            species_code, lat, lon = site_metadata[indexF]
+            try:
+                _, pdf_input, _ = read_site_widths(tree_file)
+            except Exception as e:
+                logger.warning(f"规划阶段读取文件失败 {tree_file}: {str(e)}")
+                continue
+            _, site_chunks = prepare_site_columns(
+                pdf_input, indexF, file_random_values[indexF], species_code, dbh_method, bark_method, times,
+                file_Column_Randoms, geometric_correction_rates, bark_correction_rates,
+                default_geometric_rate, default_bark_rate, draw_chunk_size=draw_chunk_size)
+            for chunk_index, (_, _, result) in enumerate(site_chunks):
+                raw, corrected = biomass_requests(result)
+                if chunk_index == 0:
+                    planner.add_site(species_code, lat, lon, raw)
+                planner.add_site(species_code, lat, lon, corrected)
+            del pdf_input, site_chunks
+        planner.evaluate(
+            lambda code, lat_c, lon_c, d: cached_calculate_biomass_batch(d, code, lat_c, lon_c, logger),
+            workers=biomass_workers, logger=logger)
+    
     for indexF in range(len(fk)):
         # Create a new figure for each site
         pyplot.figure()
@@ -757,20 +876,9 @@ def plot_allometry(fk, min_value, max_value, times, file_Column_Randoms,
         mm = os.path.splitext(os.path.basename(tree_file))[0]
         
         # 获取树木元数据 - 传入用户选择的元数据文件
-        species_code, lat, lon = get_metadata_for_tree(mm, metadata_file)
+        species_code, lat, lon = site_metadata[indexF]
         
-        # 生成随机值列表 - 使用集合保证唯一性
-        random_values = []
-        if times > 0:
-            # 使用集合保证唯一性
-            random_value_set = set()
-            while len(random_value_set) < times:
-                random_value = round(random.uniform(min_value, max_value), 3)
-                random_value_set.add(random_value)
-            random_values = list(random_value_set)
-        else:
-            # times = 0 或 times < 0 时，只使用一个固定的随机值
-            random_values = [0]
+        random_values = file_random_values[indexF]
         
         logger.info(f"Using random values: {random_values}")
         
@@ -780,28 +888,7 @@ def plot_allometry(fk, min_value, max_value, times, file_Column_Randoms,
         try:
             # 读取树木年轮数据
             logger.info(f"读取树木文件: {tree_file}")
-            TR_input = r['read.tucson'](tree_file)
-            start = r['min'](r['as.numeric'](r['rownames'](TR_input)))
-            end = r['max'](r['as.numeric'](r['rownames'](TR_input)))
-            
-            # 显示一些基本信息，便于调试
-            num_samples = len(r['colnames'](TR_input))
-            logger.info(f"文件包含 {num_samples} 个样本，年份范围: {start[0]} - {end[0]}")
-            
-            # 优化: 一次性获取年份范围并转换R数据框为pandas
-            with localconverter(rpy2.robjects.default_converter + pandas2ri.converter):
-                t_start = float(start[0])
-                t_end = float(end[0])
-                years = range(int(t_start), int(t_end) + 1)
-                
-                # 一次性转换 R 数据框为 pandas，并直接设置年份为索引
-                pdf_input = pandas2ri.rpy2py(TR_input)
-                pdf_input.index = years
-                pdf_input.insert(0, "Year", years)
-                
-                # 记录原始数据的一些统计信息
-                logger.info(f"转换后DataFrame形状: {pdf_input.shape}")
-                logger.info(f"DataFrame列名: {list(pdf_input.columns)}")
+            parse_key, pdf_input, years = read_site_widths(tree_file, logger)
             
             # 记录每列的第一个非空值索引，优化后续计算
             first_valid_indices = {}
@@ -815,6 +902,22 @@ def plot_allometry(fk, min_value, max_value, times, file_Column_Randoms,
                     logger.warning(f"样本 {col} 没有有效值")
                 
             logger.info(f"成功读取树木宽度数据: {len(years)} 年, {len(pdf_input.columns)-1} 个样本")
+            
+            # EPS 截断年份: 在去趋势后的年轮宽度指数上计算滑动窗口 EPS
+            cutoff_year = None
+            if eps_cutoff is not None and eps_cutoff is not False:
+                eps_threshold = EPS_THRESHOLD if eps_cutoff is True else float(eps_cutoff)
+                widths = pdf_input.drop(columns='Year', errors='ignore').to_numpy(dtype=float)
+                try:
+                    cutoff_year = eps_cutoff_year(list(years), detrend_spline(widths), eps_threshold)
+                except ValueError as e:
+                    # 序列中间有缺测时无法去趋势 (与 dplR.detrend 相同)
+                    logger.warning(f"无法计算EPS ({e})，均值表不截断")
+                else:
+                    if cutoff_year is None:
+                        logger.warning(f"没有EPS达到 {eps_threshold} 的窗口，均值表不截断")
+                    else:
+                        logger.info(f"EPS截断年份: {cutoff_year} (阈值 {eps_threshold})")
                 
             # 创建诊断文件来跟踪处理过程
             diagnostic_file = os.path.join(output_path, f"{mm}_processing_diagnostic.txt")
@@ -843,149 +946,169 @@ def plot_allometry(fk, min_value, max_value, times, file_Column_Randoms,
             
             logger.info(f"已保存处理诊断文件: {diagnostic_file}")
                 
-            # 优化: 使用数据字典来收集数据，避免频繁创建/修改DataFrame
-            data_columns = {
-                'dia': {'Year': years},
-                'bio': {'Year': years},
-                'delta_dia': {'Year': years},
-                'delta_bio': {'Year': years},
-                'diaa': {'Year': years},
-                'bioo': {'Year': years},
-                'delta_diaa': {'Year': years}, 
-                'delta_bioo': {'Year': years},
-                'age': {'Year': years},
-                'dia_mean': {'Year': years},
-                'bio_mean': {'Year': years},
-                'delta_dia_mean': {'Year': years},
-                'delta_bio_mean': {'Year': years},
-                'diaa_mean': {'Year': years},
-                'bioo_mean': {'Year': years},
-                'delta_diaa_mean': {'Year': years},
-                'delta_bioo_mean': {'Year': years},
-                'age_mean': {'Year': years}
-            }
+            # 优化: 结果存放在预先分配的数组中 (site_results)，只在需要时生成DataFrame
+            site_results = None
+            # 流式模式: 每块随机值只更新逐年统计量 (draw_statistics)，不保留样本列
+            draw_stats = None
+            if stream_draws and times > 0:
+                draw_stats = DrawStatistics(
+                    years, [key for key, _ in SITE_OUTPUT_COLUMNS if key not in SITE_INVARIANT_VARIABLES])
+            keep_columns = draw_stats is None or keep_draw_columns
+            # 汇总模式: 均值表只保留随机值之间的均值、标准差和百分位数
+            summary_percentiles = None
+            if draw_summary and times > 0 and len(random_values) > 1:
+                summary_percentiles = DEFAULT_PERCENTILES if draw_summary is True else tuple(draw_summary)
             
-            # 处理每个样本和随机值
-            for rand_val in random_values:
-                logger.info(f"Processing random value: {rand_val}")
-                
-                for i, col in enumerate(pdf_input.columns):
-                    if col == 'Year':
-                        continue
-                    
-                    # 获取样本数据，优化：直接使用pandas Series
-                    pdf_sub = pdf_input[col].copy()
-                    
-                    # 检查是否有有效的第一个索引
-                    y_start = pdf_sub.first_valid_index()
-                    if y_start is None:
-                        logger.warning(f"列 {col} 没有有效值，跳过处理")
-                        continue
-                    
-                    # 使用 process_tree_column 处理数据
-                    # Get sample name (column name in the dataframe)
-                    column_name = pdf_input.columns[i]
-
-                    # Default rates
-                    user_geometric_rate = default_geometric_rate
-                    user_bark_rate = default_bark_rate
-                    region = "default" # Region might not be relevant here, use default
-
-                    # Look up geometric correction rate by sample name if available
-                    if geometric_correction_rates and indexF < len(geometric_correction_rates) and isinstance(geometric_correction_rates[indexF], dict):
-                        if column_name in geometric_correction_rates[indexF]:
-                            user_geometric_rate = geometric_correction_rates[indexF][column_name]
-                            logger.info(f"Applied custom geometric rate for sample {column_name}: {user_geometric_rate}")
-                        elif i in geometric_correction_rates[indexF]: # Fallback to index
-                            user_geometric_rate = geometric_correction_rates[indexF][i]
-                            logger.info(f"Applied index-based geometric rate for sample {column_name}: {user_geometric_rate}")
-                    else:
-                         logger.info(f"Using default geometric rate for sample {column_name}: {user_geometric_rate}")
-
-                    # Look up bark correction rate by sample name if available
-                    if bark_correction_rates and indexF < len(bark_correction_rates) and isinstance(bark_correction_rates[indexF], dict):
-                        if column_name in bark_correction_rates[indexF]:
-                            user_bark_rate = bark_correction_rates[indexF][column_name]
-                            logger.info(f"Using custom bark rate for sample {column_name}: {user_bark_rate}")
-                        elif i in bark_correction_rates[indexF]: # Fallback to index
-                            user_bark_rate = bark_correction_rates[indexF][i]
-                            logger.info(f"Using index-based bark rate for sample {column_name}: {user_bark_rate}")
-                    else:
-                        logger.info(f"Using default bark rate for sample {column_name}: {user_bark_rate}")
-                    
-                    # 记录传递给process_tree_column的关键参数
-                    logger.info(f"处理样本 {col} 的随机值 {rand_val}, 第一个有效索引对应年份: {y_start}")
-                    
-                    # Pass the specific list for the current file
-                    current_file_biases = file_Column_Randoms[indexF] if file_Column_Randoms and indexF < len(file_Column_Randoms) else []
-                    
-                    diameter, diameterr, diameterr_geo, diameterr_geo_bark, biomass, biomasss, delta_dia, delta_diaa, delta_bio, delta_bioo, age = process_tree_column(
-                        pdf_sub, y_start, rand_val, dbh_method, species_code, lat, lon, 
-                        logger, current_file_biases, i, times, bark_method, region, 
-                        user_geometric_rate, user_bark_rate
-                    )
-                    
-                    if diameter is None:
-                        continue
-                    
-                    # 修正：为列名添加随机值标识，确保当times>0时每个随机值都有唯一的列名
-                    if times > 0:
-                        # 使用随机值作为列名的一部分，确保每个随机值都有唯一的列名
-                        column_suffix = f"{rand_val}_{col}"
+            # 第一步: 所有随机值和样本的直径矩阵按块计算 (随机值, 年份, 样本)
+            columns, site_chunks = prepare_site_columns(
+                pdf_input, indexF, random_values, species_code, dbh_method, bark_method, times,
+                file_Column_Randoms, geometric_correction_rates, bark_correction_rates,
+                default_geometric_rate, default_bark_rate, logger, draw_chunk_size)
+            
+            site_biomass_function = lambda d: cached_calculate_biomass_batch(d, species_code, lat, lon, logger)
+            # R 版 allodb 每次调用都重新拟合: 未启用磁盘缓存时，站点固定一次拟合的参数，
+            # 原始生物量按参数缓存；规划生物量时各块使用同一次分组计算，但不同运行的分组结果不同，
+            # 原始生物量不写入阶段缓存
+            fit_key = None
+            raw_biomass_stored = True
+            if get_biomass_backend() == 'r' and get_biomass_store() is None:
+                if planner is not None:
+                    raw_biomass_stored = False
+                else:
+                    fixed_function, fit_key = fixed_fit_biomass_function(species_code, lat, lon)
+                    if fixed_function is not None:
+                        site_biomass_function = fixed_function
                     else:
-                        column_suffix = col
-                    
-                    # 输出当前处理的随机值和列名以便调试
-                    logger.info(f"Adding columns with random value {rand_val} for sample {col}, using column suffix: {column_suffix}")
-                    
-                    # 添加到结果数据字典
-                    col_key = f"dia_{column_suffix}"
-                    data_columns['dia'][col_key] = diameter
-                    
-                    col_key = f"bio_{column_suffix}"
-                    data_columns['bio'][col_key] = biomass
-                    
-                    col_key = f"delta_dia_{column_suffix}"
-                    data_columns['delta_dia'][col_key] = delta_dia
-                    
-                    col_key = f"delta_bio_{column_suffix}"
-                    data_columns['delta_bio'][col_key] = delta_bio
-                    
-                    col_key = f"diaa_{column_suffix}"
-                    data_columns['diaa'][col_key] = diameterr_geo_bark
-                    
-                    col_key = f"bioo_{column_suffix}"
-                    data_columns['bioo'][col_key] = biomasss
-                    
-                    col_key = f"delta_diaa_{column_suffix}"
-                    data_columns['delta_diaa'][col_key] = delta_diaa
-                    
-                    col_key = f"delta_bioo_{column_suffix}"
-                    data_columns['delta_bioo'][col_key] = delta_bioo
-                    
-                    col_key = f"age_{column_suffix}"
-                    data_columns['age'][col_key] = age
+                        raw_biomass_stored = False
+            if planner is not None:
+                site_biomass_function = planner.site_function(species_code, lat, lon, site_biomass_function)
             
-            # 优化: 一次性创建DataFrame，避免频繁修改
-            dataframes = {}
-            for key in ['dia', 'bio', 'delta_dia', 'delta_bio', 'diaa', 'bioo', 'delta_diaa', 'delta_bioo', 'age']:
-                dataframes[key] = pd.DataFrame(data_columns[key])
+            # 原始直径/生物量与随机值无关: 原始生物量只在第一块计算，之后的块复用；
+            # raw_biomass 阶段按 (年轮宽度, 树种, 坐标, 生物量设置, 拟合参数) 缓存，只改变校正设置时不重新计算
+            stages = get_stage_cache()
+            raw_stages = stages if raw_biomass_stored else None
+            raw_biomass_key = stage_key('raw_biomass', parse_key, species_code, lat, lon, get_biomass_backend(),
+                                        get_biomass_mode(), get_biomass_store() is not None,
+                                        None if fit_key is None else tuple(fit_key))
+            raw_biomass = raw_stages.get(raw_biomass_key) if raw_stages is not None else None
+            raw_biomass_cached = raw_biomass is not None
+            if raw_biomass_cached:
+                logger.info(f"阶段缓存命中: raw_biomass ({raw_biomass_key[-12:]})")
+            for draw_start, draw_stop, result in site_chunks:
+                chunk_values = random_values[draw_start:draw_stop]
+                # 第二步: 汇总该块需要的直径（原始和校正后），去掉NaN并去重后一次计算生物量
+                site_batch = SiteBiomassBatch()
+                raw, corrected = biomass_requests(result)
+                raw_handle = site_batch.add(raw) if raw_biomass is None else None
+                corrected_handle = site_batch.add(corrected)
+                site_batch.evaluate(site_biomass_function)
+                logger.info(f"站点生物量批处理: {site_batch.n_requested} 个直径值, 去重后计算 {site_batch.n_unique} 个")
+                if raw_handle is not None:
+                    raw_biomass = site_batch.result(raw_handle)
+                    if raw_stages is not None:
+                        raw_stages.put(raw_biomass_key, raw_biomass)
+                
+                # 第三步: 把生物量填回矩阵，展开为输出列
+                attach_biomass(result, raw_biomass, site_batch.result(corrected_handle))
+                if draw_stats is not None:
+                    for key, source in SITE_OUTPUT_COLUMNS:
+                        if key not in SITE_INVARIANT_VARIABLES:
+                            draw_stats.update(key, result[source])
+                if site_results is None:
+                    sample_names = [col for (i, col), has_data in zip(columns, result['has_data']) if has_data]
+                    # 修正：为列名添加随机值标识，确保当times>0时每个随机值都有唯一的列名；
+                    # 与随机值无关的变量只保存一份
+                    stored_variables = [key for key, _ in SITE_OUTPUT_COLUMNS
+                                        if keep_columns or key in SITE_INVARIANT_VARIABLES]
+                    site_results = SiteResults(
+                        years, stored_variables, sample_names, random_values if times > 0 else None,
+                        dtype=result_dtype, invariant=SITE_INVARIANT_VARIABLES)
+                    for key, source in SITE_OUTPUT_COLUMNS:
+                        if key in SITE_INVARIANT_VARIABLES:
+                            site_results.store(key, 0, 1, invariant_columns(result, source))
+                if not keep_columns:
+                    continue
+                logger.info(f"Adding {len(site_results.samples)} samples for random values {chunk_values}")
+                
+                for key, source in SITE_OUTPUT_COLUMNS:
+                    if key not in SITE_INVARIANT_VARIABLES:
+                        site_results.store(key, draw_start, draw_stop, draw_columns(result, source))
             
-            dia_all = dataframes['dia']
-            bio_all = dataframes['bio']
-            delta_dia_all = dataframes['delta_dia']
-            delta_bio_all = dataframes['delta_bio']
-            diaa_all = dataframes['diaa']
-            bioo_all = dataframes['bioo']
-            delta_diaa_all = dataframes['delta_diaa']
-            delta_bioo_all = dataframes['delta_bioo']
-            age_all = dataframes['age']
+            if site_results is not None:
+                logger.info(f"站点结果数组: {site_results.nbytes / 1e6:.1f} MB ({site_results.dtype})")
+            if draw_stats is not None:
+                logger.info(f"流式统计: {draw_stats.n_draws} 个随机值")
+            dataframes = {}
             
             # 在完成所有随机值处理后，计算各个样本的均值 - ADDED MEAN CALCULATION
             logger.info("Calculating means across samples...")
-            for var_type in ['dia', 'bio', 'delta_dia', 'delta_bio', 'diaa', 'bioo', 'delta_diaa', 'delta_bioo', 'age']:
-                var_df = dataframes[var_type]
-                all_sample_cols = [col for col in var_df.columns if col != 'Year'] 
+            mean_variables = ['dia', 'bio', 'delta_dia', 'delta_bio', 'diaa', 'bioo', 'delta_diaa', 'delta_bioo', 'age']
+            # 原始变量的年表只依赖年轮宽度 (和原始生物量)，按 chronology 阶段缓存
+            # 内存中没有时再查年表磁盘缓存 (按文件内容和RWL读取方式寻址，见 chronology_cache)。
+            # 原始生物量来自一次随机拟合，bio/delta_bio 的年表只在原始生物量也来自阶段缓存时复用，
+            # 保证与输出的 bio/delta_bio 样本列来自同一次拟合；它们不写入磁盘缓存
+            chron_keys = {}
+            disk_chron_keys = {}
+            cached_means = {}
+            chron_cache = get_chronology_cache()
+            if stages is not None or chron_cache is not None:
+                for var_type in SITE_INVARIANT_VARIABLES:
+                    from_biomass = var_type in ('bio', 'delta_bio')
+                    upstream_key = raw_biomass_key if from_biomass else parse_key
+                    chron_keys[var_type] = stage_key('chronology', upstream_key, var_type, get_chronology_backend())
+                    if from_biomass and not raw_biomass_cached:
+                        continue
+                    cached_mean = stages.get(chron_keys[var_type]) if stages is not None else None
+                    if chron_cache is not None and not from_biomass:
+                        disk_chron_keys[var_type] = chronology_key(
+                            rwl_content_hash(tree_file), ('allometry', var_type, get_rwl_reader()),
+                            ('biweight', get_chronology_backend()))
+                        if cached_mean is None:
+                            cached_mean = chron_cache.get_frame(disk_chron_keys[var_type])
+                            if cached_mean is not None and stages is not None:
+                                stages.put(chron_keys[var_type], cached_mean.copy())
+                    if cached_mean is not None:
+                        cached_means[var_type] = cached_mean
+            
+            # dplR 后端: 站点所有需要年表的变量和随机值一次传给 R 计算 (见 chronology.dplr_chronology_frames)
+            batched_means = {}
+            if get_chronology_backend() == 'r':
+                chronology_jobs = {}
+                for var_type in mean_variables:
+                    per_draw = times > 0 and var_type not in SITE_INVARIANT_VARIABLES
+                    if var_type in cached_means or not site_results.column_names(var_type):
+                        continue
+                    if per_draw and (draw_stats is not None or summary_percentiles is not None):
+                        continue
+                    if per_draw and len(random_values) > 1:
+                        chronology_jobs[var_type] = (site_results.draw_axis_values(var_type), random_values)
+                    else:
+                        chronology_jobs[var_type] = (site_results.draw_values(var_type), None)
+                try:
+                    batched_means = dplr_chronology_frames(years, chronology_jobs)
+                    logger.info(f"Processed {len(batched_means)} chronologies in one dplR call")
+                except Exception as e:
+                    logger.warning(f"Batched dplR chronology failed, falling back to per-variable calls: {e}")
+            
+            for var_type in mean_variables:
+                # 与随机值无关的变量只有一组样本列，按单次模拟计算均值
+                per_draw = times > 0 and var_type not in SITE_INVARIANT_VARIABLES
+                chron_key = chron_keys.get(var_type)
+                if var_type in cached_means:
+                    logger.info(f"阶段缓存命中: chronology {var_type} ({chron_key[-12:]})")
+                    dataframes[f'{var_type}_mean'] = cached_means[var_type].copy()
+                    continue
+                chron_ok = False
+                if draw_stats is not None and per_draw:
+                    # 流式模式: 均值表为随机值之间的均值、标准差、最小值、最大值和样本量
+                    dataframes[f'{var_type}_mean'] = draw_stats.to_frame(var_type)
+                    continue
+                if summary_percentiles is not None and per_draw:
+                    dataframes[f'{var_type}_mean'] = summarize_draws(
+                        years, site_results.draw_axis_values(var_type), var_type, summary_percentiles)
+                    logger.info(f"Summarized {var_type} across {len(random_values)} simulations: percentiles {summary_percentiles}")
+                    continue
+                all_sample_cols = site_results.column_names(var_type)
 
                 if not all_sample_cols:
                     logger.warning(f"No sample columns found for {var_type}")
@@ -994,13 +1117,23 @@ def plot_allometry(fk, min_value, max_value, times, file_Column_Randoms,
                     
                 mean_output_df = pd.DataFrame({'Year': years})
                 
-                if times > 0 and len(random_values) > 1:
+                if var_type in batched_means:
+                    mean_output_df = batched_means[var_type]
+                    chron_ok = True
+                elif get_chronology_backend() == 'native':
+                    # NumPy biweight 年表: 所有随机值一次计算，行与年份一一对应 (见 chronology)
+                    if per_draw and len(random_values) > 1:
+                        mean_output_df = chronology_frame(
+                            years, site_results.draw_axis_values(var_type), var_type, random_values)
+                    else:
+                        mean_output_df = chronology_frame(years, site_results.draw_values(var_type), var_type)
+                    logger.info(f"Processed {var_type} chronology using native biweight mean")
+                    chron_ok = True
+                elif per_draw and len(random_values) > 1:
                     logger.info(f"Calculating {var_type} means and sample depths for {len(random_values)} simulations.")
-                    for rand_val in random_values:
-                        # Corrected logic: Find columns containing the random value suffix AND sample name part
-                        # This assumes column names are like 'dia_0.123_Sample1'
-                        rand_suffix = f"_{rand_val}_" 
-                        sim_sample_cols = [col for col in all_sample_cols if rand_suffix in col]
+                    for rand_index, rand_val in enumerate(random_values):
+                        # 该随机值的所有样本列 (列名如 'dia_0.123_Sample1')
+                        sim_sample_cols = site_results.column_names(var_type, rand_index)
 
                         if not sim_sample_cols:
                             logger.warning(f"No sample columns found for {var_type} simulation {rand_val}")
@@ -1011,8 +1144,8 @@ def plot_allometry(fk, min_value, max_value, times, file_Column_Randoms,
                         sim_mean_col_name = f"mean_{var_type}_{rand_val}"
                         sim_samp_depth_col_name = f"samp.depth_{rand_val}"
 
+                        sample_data = site_results.draw_frame(var_type, rand_index)
                         try:
-                            sample_data = var_df[sim_sample_cols]
                             with localconverter(rpy2.robjects.default_converter + pandas2ri.converter):
                                 r_df = pandas2ri.py2rpy(sample_data)
                                 r_result = dplR.chron(r_df) 
@@ -1045,8 +1178,8 @@ def plot_allometry(fk, min_value, max_value, times, file_Column_Randoms,
 
                         except Exception as e:
                             logger.warning(f"R processing failed for sim {rand_val}, falling back to pandas: {e}")
-                            mean_values = var_df[sim_sample_cols].mean(axis=1).values
-                            samp_depth_values = var_df[sim_sample_cols].count(axis=1).values
+                            mean_values = sample_data.mean(axis=1).values
+                            samp_depth_values = sample_data.count(axis=1).values
                             
                             if len(mean_values) >= len(years):
                                 mean_output_df[sim_mean_col_name] = mean_values[:len(years)]
@@ -1068,8 +1201,8 @@ def plot_allometry(fk, min_value, max_value, times, file_Column_Randoms,
                     mean_col_name = f"mean_{var_type}" 
                     samp_depth_col_name = "samp.depth" # Standard name
                     
+                    sample_data = site_results.draw_frame(var_type)
                     try:
-                        sample_data = var_df[all_sample_cols]
                         with localconverter(rpy2.robjects.default_converter + pandas2ri.converter):
                             r_df = pandas2ri.py2rpy(sample_data)
                             r_result = dplR.chron(r_df)
@@ -1095,6 +1228,7 @@ def plot_allometry(fk, min_value, max_value, times, file_Column_Randoms,
                                  mean_output_df[samp_depth_col_name] = padded_sd
                                  
                             logger.info(f"Processed {mean_col_name} and {samp_depth_col_name} using R biweight mean")
+                            chron_ok = True
                         else:
                             missing_cols = [c for c in [mean_col_name, samp_depth_col_name] if c not in mean_df_from_r.columns]
                             logger.warning(f"R result missing {missing_cols}, falling back to pandas mean/count.")
@@ -1117,8 +1251,8 @@ def plot_allometry(fk, min_value, max_value, times, file_Column_Randoms,
                     except Exception as e:
                         logger.error(f"Error calculating overall {var_type} mean/depth: {str(e)}")
                         # Fallback
-                        mean_values = var_df[all_sample_cols].mean(axis=1).values
-                        samp_depth_values = var_df[all_sample_cols].count(axis=1).values
+                        mean_values = sample_data.mean(axis=1).values
+                        samp_depth_values = sample_data.count(axis=1).values
                         if len(mean_values) >= len(years):
                             mean_output_df[mean_col_name] = mean_values[:len(years)]
                         else: 
@@ -1134,7 +1268,16 @@ def plot_allometry(fk, min_value, max_value, times, file_Column_Randoms,
                         logger.info(f"Used pandas fallback for overall {var_type} mean/depth due to error.")
 
                 dataframes[f'{var_type}_mean'] = mean_output_df
+                # 只缓存 R 计算成功的年表 (回退结果不缓存)
+                if chron_key is not None and chron_ok:
+                    if stages is not None:
+                        stages.put(chron_key, mean_output_df.copy())
+                    if var_type in disk_chron_keys:
+                        chron_cache.put_frame(disk_chron_keys[var_type], mean_output_df)
             # --- END OF ADDED MEAN CALCULATION ---
+            if cutoff_year is not None:
+                for name in dataframes:
+                    dataframes[name] = apply_year_cutoff(dataframes[name], cutoff_year)
 
             # Assign final mean dataframes
             final_dia_mean = dataframes['dia_mean']
@@ -1148,22 +1291,20 @@ def plot_allometry(fk, min_value, max_value, times, file_Column_Randoms,
             final_age_mean = dataframes['age_mean']
             
             # 在完成所有随机值处理后，输出数据框的列名以便调试
+            # delta_bio 与随机值无关，每个样本只有一列；随机值列在校正变量 (delta_bioo) 中
+            delta_bio_all = site_results.to_frame('delta_bio')
             logger.info(f"Final column count for delta_bio_all: {len(delta_bio_all.columns)}")
-            if times > 0:
+            # 流式模式且不保留样本列时没有逐随机值的宽表
+            has_draw_columns = 'delta_bioo' in site_results.variables
+            if times > 0 and has_draw_columns:
                 # 检查是否有预期的随机值列
-                has_expected_columns = False
-                for col in delta_bio_all.columns:
-                    if col != 'Year' and '_' in col:
-                        has_expected_columns = True
-                        break
-                        
-                if not has_expected_columns:
+                if not site_results.column_names('delta_bioo'):
                     logger.error("随机值列未正确创建，可能出现了问题，请检查数据框")
                 else:
                     logger.info("随机值列已成功创建")
             
             # 保存诊断信息
-            if times > 0:
+            if times > 0 and has_draw_columns:
                 # 创建诊断文件，以帮助跟踪随机值是如何应用的
                 diagnostic_file = os.path.join(output_path, f"{mm}_random_value_diagnostic.txt")
                 with open(diagnostic_file, 'w') as f:
@@ -1171,16 +1312,9 @@ def plot_allometry(fk, min_value, max_value, times, file_Column_Randoms,
                     f.write(f"Delta bio all columns: {list(delta_bio_all.columns)}\n\n")
                     
                     # 写入各个随机值的列信息
-                    for rand_val in random_values:
-                        # 修正查找特定随机值的列
-                        random_cols = [col for col in delta_bio_all.columns if col != 'Year' and f"{rand_val}_" in col]
+                    for rand_index, rand_val in enumerate(random_values):
+                        random_cols = site_results.column_names('delta_bioo', rand_index)
                         f.write(f"Columns for random value {rand_val}: {random_cols}\n")
-                        
-                        # 计算这个随机值的均值并添加到诊断信息中，但不创建单独的CSV文件
-                        if random_cols:
-                            mean_col_name = f'mean_{rand_val}'
-                            delta_bio_all[mean_col_name] = delta_bio_all[random_cols].mean(axis=1)
-                            f.write(f"Created mean column: {mean_col_name}\n")
                 
                 logger.info(f"Saved random value diagnostic to: {diagnostic_file}")
             
@@ -1203,16 +1337,16 @@ def plot_allometry(fk, min_value, max_value, times, file_Column_Randoms,
             # 并行保存所有文件 - 优化：使用批量保存来减少磁盘操作
             # 保存非校正文件 - 标准格式
             file_saves = [
-                (os.path.join(output_path, f"{file_prefix}_dia.csv"), dia_all),
-                (os.path.join(output_path, f"{file_prefix}_bio.csv"), bio_all),
-                (os.path.join(output_path, f"{file_prefix}_delta_dia.csv"), delta_dia_all),
+                (os.path.join(output_path, f"{file_prefix}_dia.csv"), 'dia'),
+                (os.path.join(output_path, f"{file_prefix}_bio.csv"), 'bio'),
+                (os.path.join(output_path, f"{file_prefix}_delta_dia.csv"), 'delta_dia'),
                 (os.path.join(output_path, f"{file_prefix}_delta_bio.csv"), delta_bio_all),
-                (os.path.join(output_path, f"{file_prefix}_age.csv"), age_all),
+                (os.path.join(output_path, f"{file_prefix}_age.csv"), 'age'),
                 # 保存校正文件 - 包含校正代码
-                (os.path.join(output_path, f"{file_prefix}_diaa_correction_{initial_width_code}_{geometric_code}_{bark_code}.csv"), diaa_all),
-                (os.path.join(output_path, f"{file_prefix}_bioo_correction_{initial_width_code}_{geometric_code}_{bark_code}.csv"), bioo_all),
-                (os.path.join(output_path, f"{file_prefix}_delta_diaa_correction_{initial_width_code}_{geometric_code}_{bark_code}.csv"), delta_diaa_all),
-                (os.path.join(output_path, f"{file_prefix}_delta_bioo_correction_{initial_width_code}_{geometric_code}_{bark_code}.csv"), delta_bioo_all),
+                (os.path.join(output_path, f"{file_prefix}_diaa_correction_{initial_width_code}_{geometric_code}_{bark_code}.csv"), 'diaa'),
+                (os.path.join(output_path, f"{file_prefix}_bioo_correction_{initial_width_code}_{geometric_code}_{bark_code}.csv"), 'bioo'),
+                (os.path.join(output_path, f"{file_prefix}_delta_diaa_correction_{initial_width_code}_{geometric_code}_{bark_code}.csv"), 'delta_diaa'),
+                (os.path.join(output_path, f"{file_prefix}_delta_bioo_correction_{initial_width_code}_{geometric_code}_{bark_code}.csv"), 'delta_bioo'),
                 # ADDED: Save mean dataframes
                 (os.path.join(output_path, f"{file_prefix}_dia_mean.csv"), final_dia_mean),
                 (os.path.join(output_path, f"{file_prefix}_bio_mean.csv"), final_bio_mean),
@@ -1225,12 +1359,18 @@ def plot_allometry(fk, min_value, max_value, times, file_Column_Randoms,
                 (os.path.join(output_path, f"{file_prefix}_delta_diaa_mean_correction_{initial_width_code}_{geometric_code}_{bark_code}.csv"), final_delta_diaa_mean),
                 (os.path.join(output_path, f"{file_prefix}_delta_bioo_mean_correction_{initial_width_code}_{geometric_code}_{bark_code}.csv"), final_delta_bioo_mean)
             ]
+            # 流式模式: 只保存统计表和与随机值无关的变量
+            file_saves = [(output_file, df) for output_file, df in file_saves
+                          if not isinstance(df, str) or df in site_results.variables]
             
             # 并行写入所有文件
             from concurrent.futures import ThreadPoolExecutor
             
             def save_df_to_csv(file_info):
                 output_file, df = file_info
+                # 变量名: 写出时才从 site_results 生成DataFrame
+                if isinstance(df, str):
+                    df = site_results.to_frame(df)
                 df.to_csv(output_file, index=False)
                 return output_file
             
@@ -1247,7 +1387,7 @@ def plot_allometry(fk, min_value, max_value, times, file_Column_Randoms,
             
             # 绘制delta_bio曲线 - Use mean dataframe for plotting
             # Modify plotting logic to use the mean dataframe similar to species version
-            if times > 0 and len(random_values) > 1:
+            if times > 0 and len(random_values) > 1 and draw_stats is None and summary_percentiles is None:
                  logger.info("Plotting mean AABI for each simulation.")
                  # Find all mean columns for delta_bioo simulations in the mean dataframe
                  plot_mean_df = final_delta_bioo_mean # Use the calculated mean df
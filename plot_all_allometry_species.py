@@ -1,6 +1,18 @@
 from rpy2.robjects import FloatVector
-from improved_allodb import batch_estimate_biomass, estimate_biomass_using_get_biomass_cached
-from bark_dict_species import bark_dict_species
+from improved_allodb import (estimate_biomass_array, estimate_biomass_using_get_biomass_cached, get_biomass_backend,
+                             fit_biomass_params)
+from biomass_lut import set_biomass_mode, get_biomass_mode, get_lookup_table
+from biomass_store import set_biomass_store, get_biomass_store
+from biomass_batch import SiteBiomassBatch
+from site_results import SiteResults
+from chronology import get_chronology_backend, set_chronology_backend, chronology_frame, dplr_chronology_frames
+from sampling import sample_initial_widths, make_sampler_rng, set_sampling_method, get_sampling_method
+from draw_statistics import summarize_draws, DEFAULT_PERCENTILES
+from site_statistics import EPS_THRESHOLD, eps_cutoff_year, apply_year_cutoff
+from detrend import detrend_spline
+from tucson import read_rwl
+from diameter_engine import (DRAW_INVARIANT_KEYS, compute_site_diameters, draw_chunks, biomass_requests,
+                             attach_biomass, draw_columns, invariant_columns)
 from allometric_dict import *
 import rpy2
 import tzlocal
@@ -36,25 +48,52 @@ numpy2ri.activate()
 # import function to get the site allometric relationships
 
 
-# Add memoization decorator for expensive functions
-def memoize(func):
-    cache = {}
-    def wrapper(*args):
-        key = str(args)
-        if key not in cache:
-            cache[key] = func(*args)
-        return cache[key]
-    return wrapper
-
-# Apply memoization to expensive functions
-bark_dict_species_original = bark_dict_species
-bark_dict_species = memoize(bark_dict_species_original)
+# 输出变量 -> diameter_engine 结果中对应的矩阵 (diaa 为几何校正前的校正直径)
+SITE_OUTPUT_COLUMNS = (
+    ('dia', 'diameter'),
+    ('bio', 'biomass'),
+    ('delta_dia', 'delta_dia'),
+    ('delta_bio', 'delta_bio'),
+    ('diaa', 'diameterr'),
+    ('bioo', 'biomasss'),
+    ('delta_diaa', 'delta_diaa'),
+    ('delta_bioo', 'delta_bioo'),
+    ('age', 'age'),
+)
+# 与随机值无关的输出变量: 每个站点只计算和保存一份
+SITE_INVARIANT_VARIABLES = tuple(key for key, source in SITE_OUTPUT_COLUMNS if source in DRAW_INVARIANT_KEYS)
 
 # Add biomass calculation caching
 biomass_cache = {}
+def stored_calculate_biomass_batch(diameter_values, species_code, lat, lon, logger=None):
+    '''
+    通过磁盘缓存 (biomass_store) 计算生物量，未启用缓存时直接计算
+    '''
+    store = get_biomass_store()
+    if store is None:
+        return calculate_biomass_batch(diameter_values, species_code, lat, lon, logger)
+    coords = (lon, lat) if lat is not None and lon is not None else (-76.8, 39.2)
+    latin_name = SPECIES_CODE_MAP.get(species_code, species_code)
+    # 缓存的是 allodb 一次拟合的参数，拟合失败时按原流程计算 (可能回退到硬编码方程)，结果不缓存
+    return store.get_biomass(
+        diameter_values, get_biomass_backend(), latin_name, coords,
+        lambda: fit_biomass_params(latin_name, coords),
+        lambda d: calculate_biomass_batch(d, species_code, lat, lon, logger))
+
 def cached_calculate_biomass_batch(diameter_values, species_code, lat, lon, logger=None):
     # Create a cache key from the parameters
-    cache_key = f"{species_code}_{lat}_{lon}"
+    # 键中包含生物量后端，切换后端后不会沿用旧后端的查找表和缓存结果
+    cache_key = f"{get_biomass_backend()}:{species_code}_{lat}_{lon}"
+
+    # 查找表模式: 每个树种/坐标只在DBH网格上精确计算一次，之后插值
+    if get_biomass_mode() == 'lut':
+        table = get_lookup_table(
+            cache_key, lambda d: stored_calculate_biomass_batch(d, species_code, lat, lon, logger))
+        return table(diameter_values)
+
+    # 启用磁盘缓存时所有直径使用缓存的拟合参数计算，不再使用整组直径作为键
+    if get_biomass_store() is not None:
+        return stored_calculate_biomass_batch(diameter_values, species_code, lat, lon, logger)
     
     # Convert diameter_values to tuple for hashability if it's a list
     if isinstance(diameter_values, list):
@@ -239,45 +278,38 @@ def calculate_biomass_batch(
         if logger:
             logger.debug(f"开始批量计算 {len(diameter_values)} 个直径值")
 
-        results = batch_estimate_biomass(
-            [diameter_values], latin_name, coords=coords)
+        # 直接以数组形式交给常驻allodb引擎计算
+        agb_values = estimate_biomass_array(
+            diameter_values, latin_name, coords=coords)
 
-        if not results:
+        if len(agb_values) > 0:
             if logger:
-                logger.error("批量计算返回空结果")
-            raise ValueError("批量计算返回空结果")
-
-        if not results[0].empty:
-            if logger:
-                logger.debug(f"批量计算成功，返回 {len(results[0]['agb'])} 个结果")
+                logger.debug(f"批量计算成功，返回 {len(agb_values)} 个结果")
 
             # 确保结果长度与输入长度相同
-            if len(results[0]['agb']) != len(diameter_values):
+            if len(agb_values) != len(diameter_values):
                 if logger:
                     logger.warning(
-                        f"结果长度 ({len(results[0]['agb'])}) 与输入长度 ({len(diameter_values)}) 不匹配")
+                        f"结果长度 ({len(agb_values)}) 与输入长度 ({len(diameter_values)}) 不匹配")
 
                 # 填充结果到正确长度
                 output_values = np.full(len(diameter_values), np.nan)
-                min_len = min(len(results[0]['agb']), len(diameter_values))
-                output_values[:min_len] = results[0]['agb'].values[:min_len]
+                min_len = min(len(agb_values), len(diameter_values))
+                output_values[:min_len] = agb_values[:min_len]
                 return output_values
 
-            return results[0]['agb'].values
+            return agb_values
         else:
             if logger:
                 logger.warning("批量计算结果为空，回退到逐一计算")
 
-        # 如果批处理失败，退回到逐一计算
-        biomass_values = []
-        for dbh in diameter_values:
-            biomass = allometric_dict(dbh, species_code, lat, lon, logger)
-            biomass_values.append(biomass)
+        # 如果批处理失败，退回到硬编码方程（整条序列一次计算，不再逐值调用allodb）
+        biomass_values = allometric_dict_array(diameter_values, species_code, lat, lon, logger)
 
         if logger:
-            logger.debug(f"逐一计算完成，返回 {len(biomass_values)} 个结果")
+            logger.debug(f"硬编码方程计算完成，返回 {len(biomass_values)} 个结果")
 
-        return np.array(biomass_values)
+        return biomass_values
 
     except Exception as e:
         error_msg = f"批量计算生物量出错: {e}"
@@ -285,18 +317,13 @@ def calculate_biomass_batch(
         if logger:
             logger.error(error_msg, exc_info=True)
 
-        # 退回到逐一计算，包含异常处理
-        biomass_values = []
-        for dbh in diameter_values:
-            try:
-                biomass = allometric_dict(dbh, species_code, lat, lon, logger)
-                biomass_values.append(biomass)
-            except Exception as e2:
-                if logger:
-                    logger.error(f"计算单个生物量时出错: dbh={dbh}, error={e2}")
-                biomass_values.append(np.nan)
-
-        return np.array(biomass_values)
+        # 退回到硬编码方程，包含异常处理
+        try:
+            return allometric_dict_array(diameter_values, species_code, lat, lon, logger)
+        except Exception as e2:
+            if logger:
+                logger.error(f"使用硬编码方程计算生物量时出错: error={e2}")
+            return np.full(len(diameter_values), np.nan)
 
 
 def plot_allometry_species(
@@ -316,7 +343,10 @@ def plot_allometry_species(
         geometric_correction_rates=None,
         bark_correction_rates=None,
         default_geometric_rate=1.0,
-        default_bark_rate=0.05):
+        default_bark_rate=0.05,
+        biomass_mode=None, biomass_store=None,
+        draw_chunk_size=None, result_dtype=None, draw_summary=None,
+        sampling_method=None, sampling_seed=None, chronology_backend=None, eps_cutoff=None):
     """
     处理树木生物量计算和绘图 - 优化版本 (适用于自定义物种)
 
@@ -331,6 +361,17 @@ def plot_allometry_species(
     - bark_correction_rates: 每个文件的每个样本的树皮校正率字典列表
     - default_geometric_rate: 默认几何校正率
     - default_bark_rate: 默认树皮校正率
+    - biomass_mode: 生物量计算模式，'exact' 精确计算，'lut' 使用AGB-DBH查找表 (见 biomass_lut)；None保持当前设置
+    - biomass_store: 生物量磁盘缓存文件路径 (见 biomass_store)，True使用默认路径，False关闭，None保持当前设置
+    - draw_chunk_size: 每次一起计算的随机值个数，用于限制内存 (见 diameter_engine.draw_chunks)；None时自动确定
+    - result_dtype: 站点结果数组的类型 (见 site_results)，'float32' 可使内存减半；None为float64
+    - draw_summary: 多个随机值时均值表只输出随机值之间的均值、标准差和百分位数 (见 draw_statistics.summarize_draws)；
+                    True使用默认百分位数 (2.5, 50, 97.5)，也可以传入百分位数序列；None保持每个随机值一列
+    - sampling_method: 初始宽度偏差的抽样方法，'uniform'、'lhs' 或 'sobol' (见 sampling)；None保持当前设置
+    - sampling_seed: 抽样的随机种子，设定后随机值可复现
+    - chronology_backend: 年表计算后端，'native' NumPy biweight (见 chronology)，'r' dplR.chron；None保持当前设置
+    - eps_cutoff: EPS 截断 (见 site_statistics)，均值表中去掉滑动窗口 EPS 达到阈值之前的年份；
+                  True使用阈值0.85，也可以传入阈值；None不截断
 
     注意: 当bark_method=1时，使用bark_dict_species函数计算树皮厚度。
     """
@@ -388,6 +429,16 @@ def plot_allometry_species(
     logger.info(f"DBH method: {dbh_method}")
     logger.info(f"Bark method: {bark_method}")
     logger.info(f"Output path: {output_path}")
+
+    if biomass_mode is not None:
+        set_biomass_mode(biomass_mode)
+    if chronology_backend is not None:
+        set_chronology_backend(chronology_backend)
+    if sampling_method is not None or sampling_seed is not None:
+        set_sampling_method(sampling_method or get_sampling_method()[0], sampling_seed)
+    sampler_rng = make_sampler_rng()
+    if biomass_store is not None:
+        set_biomass_store(None if biomass_store is True else biomass_store)
     
     # Log the geometric correction rates
     logger.info("=== GEOMETRIC CORRECTION RATES ===")
@@ -437,52 +488,37 @@ def plot_allometry_species(
         # 使用传入的物种代码和坐标，而不是从元数据中查找
         species_code = species
 
-        TR_input = r['read.tucson'](TR_input_dir)
-        start = r['min'](r['as.numeric'](r['rownames'](TR_input)))
-        end = r['max'](r['as.numeric'](r['rownames'](TR_input)))
-
-        # 优化: 一次性获取年份范围
-        with localconverter(rpy2.robjects.default_converter + pandas2ri.converter):
-            t_start = float(start[0])
-            t_end = float(end[0])
-            years = range(int(t_start), int(t_end) + 1)
-
-            # 一次性转换 R 数据框为 pandas
-            pdf_input = pandas2ri.rpy2py(TR_input)
-            pdf_input.index = years
-            pdf_input.insert(0, "Year", years)
-            pdf_input = pdf_input.drop(pdf_input.columns[0], axis=1)
-
-        # 初始化收集数据的字典，用于减少DataFrame碎片化
-        data_columns = {
-            'dia': {'Year': years},
-            'bio': {'Year': years},
-            'delta_dia': {'Year': years},
-            'delta_bio': {'Year': years},
-            'diaa': {'Year': years},
-            'bioo': {'Year': years},
-            'delta_diaa': {'Year': years},
-            'delta_bioo': {'Year': years},
-            'age': {'Year': years}
-        }
+        # 直接解析 Tucson 文件，不需要 R (见 tucson)
+        pdf_input = read_rwl(TR_input_dir)
+        years = range(int(pdf_input.index[0]), int(pdf_input.index[-1]) + 1)
+        pdf_input.index = years
+
+        # EPS 截断年份: 在去趋势后的年轮宽度指数上计算滑动窗口 EPS
+        cutoff_year = None
+        if eps_cutoff is not None and eps_cutoff is not False:
+            eps_threshold = EPS_THRESHOLD if eps_cutoff is True else float(eps_cutoff)
+            widths = pdf_input.drop(columns='Year', errors='ignore').to_numpy(dtype=float)
+            try:
+                cutoff_year = eps_cutoff_year(list(years), detrend_spline(widths), eps_threshold)
+            except ValueError as e:
+                # 序列中间有缺测时无法去趋势 (与 dplR.detrend 相同)
+                logger.warning(f"无法计算EPS ({e})，均值表不截断")
+            else:
+                if cutoff_year is None:
+                    logger.warning(f"没有EPS达到 {eps_threshold} 的窗口，均值表不截断")
+                else:
+                    logger.info(f"EPS截断年份: {cutoff_year} (阈值 {eps_threshold})")
+
+        # 结果存放在预先分配的数组中 (site_results)，只在需要时生成DataFrame，避免DataFrame碎片化
+        site_results = None
         
         # Initialize dataframes dictionary to store all DataFrames
         dataframes = {}
 
-        # 记录每列的第一个非空值索引，优化后续计算
-        first_valid_indices = {}
-        for i, col in enumerate(pdf_input.columns):
-            first_valid_indices[i] = pdf_input.iloc[:, i].first_valid_index()
-
-        # 生成随机值列表 - 使用集合保证唯一性
+        # 生成随机值列表 - 所有文件共用一个随机数生成器，设定种子时结果可复现
         random_values = []
         if times > 0:
-            # 使用集合保证唯一性
-            random_value_set = set()
-            while len(random_value_set) < times:
-                random_value = round(random.uniform(min_value, max_value), 3)
-                random_value_set.add(random_value)
-            random_values = list(random_value_set)
+            random_values = sample_initial_widths(min_value, max_value, times, rng=sampler_rng)
         else:
             # times = 0 或 times < 0 时，只使用一个固定的随机值
             random_values = [0]
@@ -490,326 +526,152 @@ def plot_allometry_species(
         print("random_values = ", random_values)
         logger.info(f"Using random values: {random_values}")
 
-        for rand_val in random_values:
-            print("rand_val = ", rand_val)
-            logger.info(f"Processing random value: {rand_val}")
-
-            # Process each random value and store results in temporary
-            # dataframes
-            for i in range(len(pdf_input.columns)):
-                col_start_time = time.time()
-                # 提取一列数据并创建副本
-                pdf_sub = pdf_input.iloc[:, i].copy()
-                column_name = pdf_input.columns[i]
-
-                # 获取该列的第一个和最后一个非NaN值的索引
-                y_start = first_valid_indices[i]
-                y_end = pdf_sub.last_valid_index()
-
-                if y_start is None or y_end is None:
-                    continue  # 跳过全是NaN的列
-
-                # 为当前样本获取自定义校正率
-                user_geometric_rate = default_geometric_rate
-                user_bark_rate = default_bark_rate
-
-                # Get sample name (column name in the dataframe)
-                column_name = pdf_input.columns[i]
-                
-                # EXTENSIVE DEBUGGING FOR GEOMETRIC RATES
-                logger.info(f"======= DEBUGGING GEOMETRIC RATES FOR SAMPLE {column_name} =======")
-                if geometric_correction_rates and len(geometric_correction_rates) > indexF:
-                    logger.info(f"Geometric correction rates available for file #{indexF}")
-                    if isinstance(geometric_correction_rates[indexF], dict):
-                        logger.info(f"Correction rates stored as dictionary with {len(geometric_correction_rates[indexF])} entries")
-                        logger.info(f"Available keys: {list(geometric_correction_rates[indexF].keys())}")
-                        if column_name in geometric_correction_rates[indexF]:
-                            logger.info(f"MATCH FOUND! Sample name '{column_name}' exists in correction rates")
-                        else:
-                            logger.info(f"No match for sample '{column_name}' in correction rates dictionary")
-                    else:
-                        logger.info(f"Correction rates not stored as dictionary but as: {type(geometric_correction_rates[indexF])}")
-                else:
-                    logger.info(f"No geometric correction rates defined for file #{indexF}")
-                
-                # Look up geometric correction rate by sample name if available
-                if geometric_correction_rates and len(geometric_correction_rates) > indexF and isinstance(geometric_correction_rates[indexF], dict):
-                    # First try to find by sample name (column_name)
+        # 查找单个样本的几何校正率和树皮校正率
+        def column_rates(i):
+            column_name = pdf_input.columns[i]
+
+            # 为当前样本获取自定义校正率
+            user_geometric_rate = default_geometric_rate
+            user_bark_rate = default_bark_rate
+
+            # EXTENSIVE DEBUGGING FOR GEOMETRIC RATES
+            logger.info(f"======= DEBUGGING GEOMETRIC RATES FOR SAMPLE {column_name} =======")
+            if geometric_correction_rates and len(geometric_correction_rates) > indexF:
+                logger.info(f"Geometric correction rates available for file #{indexF}")
+                if isinstance(geometric_correction_rates[indexF], dict):
+                    logger.info(f"Correction rates stored as dictionary with {len(geometric_correction_rates[indexF])} entries")
+                    logger.info(f"Available keys: {list(geometric_correction_rates[indexF].keys())}")
                     if column_name in geometric_correction_rates[indexF]:
-                        prev_rate = user_geometric_rate
-                        user_geometric_rate = geometric_correction_rates[indexF][column_name]
-                        logger.info(f"Applied custom geometric rate for sample {column_name}: changed from {prev_rate} to {user_geometric_rate}")
-                    # Fall back to index-based lookup for backward compatibility
-                    elif i in geometric_correction_rates[indexF]:
-                        prev_rate = user_geometric_rate
-                        user_geometric_rate = geometric_correction_rates[indexF][i]
-                        logger.info(f"Applied index-based geometric rate for sample {column_name}: changed from {prev_rate} to {user_geometric_rate}")
+                        logger.info(f"MATCH FOUND! Sample name '{column_name}' exists in correction rates")
+                    else:
+                        logger.info(f"No match for sample '{column_name}' in correction rates dictionary")
                 else:
-                    logger.info(f"Using default geometric rate for sample {column_name}: {user_geometric_rate}")
-
-                # 检查是否有为该样本设置的自定义树皮校正率
-                if bark_correction_rates and len(bark_correction_rates) > indexF and isinstance(bark_correction_rates[indexF], dict):
-                    # First try to find by sample name
-                    if column_name in bark_correction_rates[indexF]:
-                        user_bark_rate = bark_correction_rates[indexF][column_name]
-                        logger.info(f"Using custom bark rate for sample {column_name}: {user_bark_rate}")
-                    # Fall back to index-based lookup for backward compatibility
-                    elif i in bark_correction_rates[indexF]:
-                        user_bark_rate = bark_correction_rates[indexF][i]
-                        logger.info(f"Using index-based bark rate for sample {column_name}: {user_bark_rate}")
+                    logger.info(f"Correction rates not stored as dictionary but as: {type(geometric_correction_rates[indexF])}")
+            else:
+                logger.info(f"No geometric correction rates defined for file #{indexF}")
+        
+            # Look up geometric correction rate by sample name if available
+            if geometric_correction_rates and len(geometric_correction_rates) > indexF and isinstance(geometric_correction_rates[indexF], dict):
+                # First try to find by sample name (column_name)
+                if column_name in geometric_correction_rates[indexF]:
+                    prev_rate = user_geometric_rate
+                    user_geometric_rate = geometric_correction_rates[indexF][column_name]
+                    logger.info(f"Applied custom geometric rate for sample {column_name}: changed from {prev_rate} to {user_geometric_rate}")
+                # Fall back to index-based lookup for backward compatibility
+                elif i in geometric_correction_rates[indexF]:
+                    prev_rate = user_geometric_rate
+                    user_geometric_rate = geometric_correction_rates[indexF][i]
+                    logger.info(f"Applied index-based geometric rate for sample {column_name}: changed from {prev_rate} to {user_geometric_rate}")
+            else:
+                logger.info(f"Using default geometric rate for sample {column_name}: {user_geometric_rate}")
+
+            # 检查是否有为该样本设置的自定义树皮校正率
+            if bark_correction_rates and len(bark_correction_rates) > indexF and isinstance(bark_correction_rates[indexF], dict):
+                # First try to find by sample name
+                if column_name in bark_correction_rates[indexF]:
+                    user_bark_rate = bark_correction_rates[indexF][column_name]
+                    logger.info(f"Using custom bark rate for sample {column_name}: {user_bark_rate}")
+                # Fall back to index-based lookup for backward compatibility
+                elif i in bark_correction_rates[indexF]:
+                    user_bark_rate = bark_correction_rates[indexF][i]
+                    logger.info(f"Using index-based bark rate for sample {column_name}: {user_bark_rate}")
+            else:
+                logger.info(f"Using default bark rate for sample {column_name}: {user_bark_rate}")
+
+            return user_geometric_rate, user_bark_rate
+
+        # 第一步: 所有随机值和样本的直径矩阵按块计算 (随机值, 年份, 样本)，见 diameter_engine
+        widths = pdf_input.to_numpy(dtype=float)
+        column_rate_pairs = [column_rates(i) for i in range(len(pdf_input.columns))]
+        geometric_rates = np.array([rates[0] for rates in column_rate_pairs], dtype=float)
+        bark_rates = np.array([rates[1] for rates in column_rate_pairs], dtype=float)
+
+        # 自定义初始宽度偏差 (times < 0)
+        biases = np.zeros(len(pdf_input.columns))
+        if times < 0 and file_Column_Randoms is not None and indexF < len(
+                file_Column_Randoms) and file_Column_Randoms[indexF] is not None:
+            for i in range(min(len(pdf_input.columns), len(file_Column_Randoms[indexF]))):
+                biases[i] = file_Column_Randoms[indexF][i]
+
+        # 每个随机值、每个样本第一个有效年份的宽度偏差 (随机值, 样本)
+        if times < 0:
+            draw_offsets = np.broadcast_to(biases, (len(random_values), len(pdf_input.columns)))
+        elif times > 0:
+            draw_offsets = np.broadcast_to(np.asarray(random_values, dtype=float)[:, np.newaxis],
+                                           (len(random_values), len(pdf_input.columns)))
+        else:
+            draw_offsets = np.zeros((len(random_values), len(pdf_input.columns)))
+
+        # 原始直径/生物量与随机值无关: 原始生物量只在第一块计算，之后的块复用
+        raw_biomass = None
+        for lo, hi in draw_chunks(len(random_values), widths.shape[0], widths.shape[1], draw_chunk_size):
+            logger.info(f"Processing random values {lo + 1}-{hi} of {len(random_values)}")
+            result = compute_site_diameters(
+                widths, draw_offsets[lo:hi], dbh_method, bark_method, geometric_rates, bark_rates,
+                species_code, region, bark_from_geo=False)
+            # 第二步: 汇总该块需要的直径（原始和校正后），去掉NaN并去重后一次计算生物量
+            site_batch = SiteBiomassBatch()
+            raw, corrected = biomass_requests(result)
+            raw_handle = site_batch.add(raw) if raw_biomass is None else None
+            corrected_handle = site_batch.add(corrected)
+            site_batch.evaluate(lambda d: cached_calculate_biomass_batch(d, species_code, lat, lon, logger))
+            logger.info(f"站点生物量批处理: {site_batch.n_requested} 个直径值, 去重后计算 {site_batch.n_unique} 个")
+            if raw_handle is not None:
+                raw_biomass = site_batch.result(raw_handle)
+
+            # 第三步: 把生物量填回矩阵，展开为输出列
+            attach_biomass(result, raw_biomass, site_batch.result(corrected_handle))
+            if site_results is None:
+                # 为列名添加随机值标识；与随机值无关的变量只保存一份
+                site_results = SiteResults(
+                    years, [key for key, _ in SITE_OUTPUT_COLUMNS], list(pdf_input.columns[result['has_data']]),
+                    random_values if times > 0 else None, dtype=result_dtype, invariant=SITE_INVARIANT_VARIABLES)
+                for key, source in SITE_OUTPUT_COLUMNS:
+                    if key in SITE_INVARIANT_VARIABLES:
+                        site_results.store(key, 0, 1, invariant_columns(result, source))
+
+            for key, source in SITE_OUTPUT_COLUMNS:
+                if key not in SITE_INVARIANT_VARIABLES:
+                    site_results.store(key, lo, hi, draw_columns(result, source))
+
+        logger.info(f"站点结果数组: {site_results.nbytes / 1e6:.1f} MB ({site_results.dtype})")
+        
+        # 汇总模式: 均值表只保留随机值之间的均值、标准差和百分位数
+        summary_percentiles = None
+        if draw_summary and times > 0 and len(random_values) > 1:
+            summary_percentiles = DEFAULT_PERCENTILES if draw_summary is True else tuple(draw_summary)
+
+        mean_variables = ['dia', 'bio', 'delta_dia', 'delta_bio', 'diaa', 'bioo', 'delta_diaa', 'delta_bioo', 'age']
+        # dplR 后端: 站点所有需要年表的变量和随机值一次传给 R 计算 (见 chronology.dplr_chronology_frames)
+        batched_means = {}
+        if get_chronology_backend() == 'r':
+            chronology_jobs = {}
+            for var_type in mean_variables:
+                per_draw = times > 0 and var_type not in SITE_INVARIANT_VARIABLES
+                if not site_results.column_names(var_type) or (per_draw and summary_percentiles is not None):
+                    continue
+                if per_draw and len(random_values) > 1:
+                    chronology_jobs[var_type] = (site_results.draw_axis_values(var_type), random_values)
                 else:
-                    logger.info(f"Using default bark rate for sample {column_name}: {user_bark_rate}")
-                    
-                # 初始化向量
-                diameter = pd.Series(np.nan, index=pdf_sub.index)
-                diameterr = pd.Series(np.nan, index=pdf_sub.index)
-                diameterr_geo = pd.Series(np.nan, index=pdf_sub.index)  # Initialize diameterr_geo
-                diameterr_geo_bark = pd.Series(np.nan, index=pdf_sub.index)  # Initialize diameterr_geo_bark
-                biomass = pd.Series(np.nan, index=pdf_sub.index)
-                biomasss = pd.Series(np.nan, index=pdf_sub.index)
-                delta_dia = pd.Series(np.nan, index=pdf_sub.index)
-                delta_diaa = pd.Series(np.nan, index=pdf_sub.index)
-                delta_bio = pd.Series(np.nan, index=pdf_sub.index)
-                delta_bioo = pd.Series(np.nan, index=pdf_sub.index)
-                age = pd.Series(np.nan, index=pdf_sub.index)
-
-                # 分别处理第一年和后续年份
-                # 第一年
-                if pdf_sub[y_start] == 0:
-                    pdf_sub[y_start] = 1e-8
-
-                # 添加随机宽度
-                # 为保留原始数据，创建一个带有初始宽度修正的副本用于计算diaa相关指标
-                pdf_sub_corrected = pdf_sub.copy()
-
-                # 只有在有效的条件下才应用初始宽度校正
-                if times < 0 and file_Column_Randoms is not None and indexF < len(
-                        file_Column_Randoms) and file_Column_Randoms[indexF] is not None and i < len(file_Column_Randoms[indexF]):
-                    # 只对校正后的数据应用初始宽度偏差
-                    pdf_sub_corrected[y_start] = pdf_sub_corrected[y_start] + \
-                        file_Column_Randoms[indexF][i]
-                elif times > 0:
-                    # 随机校正
-                    pdf_sub_corrected[y_start] = pdf_sub_corrected[y_start] + rand_val
-
-                # 初始年龄和直径
-                age[y_start] = 1
-
-                # 计算原始直径 (无校正)
-                diameter[y_start] = (2 * pdf_sub[y_start]) / 10  # cm
-
-                # 计算校正后的直径 (应用了初始宽度校正)
-                diameterr[y_start] = (2 * pdf_sub_corrected[y_start]) / 10  # cm
-
-                # geometric correction
-                if dbh_method == -1:
-                    # No correction for both
-                    diameterr_geo[y_start] = diameterr[y_start]
-                    logger.info(f"No geometric correction applied - Sample: {column_name}, Diameter: {diameterr[y_start]:.4f} cm")
-                elif dbh_method == 0:
-                    # Lockwood et al.,2021方程
-                    orig_value = diameterr[y_start]
-                    diameterr_geo[y_start] = diameterr[y_start] * 0.998 + 22.3
-                    logger.info(f"Lockwood geometric correction - Sample: {column_name}, Original: {orig_value:.4f} cm, Corrected: {diameterr_geo[y_start]:.4f} cm")
-                elif dbh_method == 1:
-                    # user defined correction rate
-                    orig_value = diameterr[y_start]
-                    diameterr_geo[y_start] = diameterr[y_start] * user_geometric_rate
-                    logger.info(
-                        f"Custom geometric correction - Sample: {column_name}, Original: {orig_value:.4f} cm, Rate: {user_geometric_rate}, Corrected: {diameterr_geo[y_start]:.4f} cm")
-
-                # bark correction
-                if bark_method == -1:
-                    # Custom bark thickness based on user-defined rate
-                    #original_diameter = diameterr[y_start]
-                    bark_thickness = diameterr_geo[y_start] * user_bark_rate
-                    diameterr_geo_bark[y_start] = diameterr_geo[y_start] + bark_thickness
-                    logger.info(
-                        f"Custom bark correction - Sample: {column_name}, Original diameter: {diameterr_geo[y_start]:.4f} cm, Rate: {user_bark_rate}, Bark thickness: {bark_thickness:.4f} cm, Corrected: {diameterr_geo[y_start]:.4f} cm")
-                elif bark_method == 0:
-                    # No bark correction
-                    diameterr_geo_bark[y_start] = diameterr_geo[y_start]
-                elif bark_method == 1:
-                    # Allometry-based bark correction using bark_dict_species
-                    # function
-                    bark_thickness = bark_dict_species(
-                        region, species_code, diameterr[y_start])
-                    logger.info(
-                        f"Initial bark correction - Species: {species_code}, Sample: {column_name}, Original diameter: {diameterr[y_start]:.4f} cm, Bark thickness: {bark_thickness:.4f} cm, Corrected: {diameterr[y_start] + bark_thickness:.4f} cm")
-                    diameterr_geo_bark[y_start] = diameterr_geo[y_start] + bark_thickness
-
-                # 批量计算后续年份的直径
-                for k in range(y_start + 1, y_end + 1):
-                    if pd.isna(pdf_sub[k]):
-                        continue
-
-                    # 替换零值
-                    if pdf_sub[k] == 0:
-                        pdf_sub[k] = 1e-8
-
-                    # 同样替换校正数据中的零值
-                    if pdf_sub_corrected[k] == 0:
-                        pdf_sub_corrected[k] = 1e-8
-
-                    # 计算年龄和累积直径
-                    if not pd.isna(age[k - 1]):
-                        age[k] = age[k - 1] + 1
-
-                    # 计算原始直径 (无校正)
-                    diameter[k] = diameter[k - 1] + (2 * pdf_sub[k]) / 10
-
-                    # 计算校正后的直径 (应用了初始宽度校正)
-                    diameterr[k] = diameterr[k - 1] + \
-                        (2 * pdf_sub_corrected[k]) / 10
-                    
-
-                    # geometric correction
-                    if dbh_method == -1:
-                        diameterr_geo[k] = diameterr[k]
-                    elif dbh_method == 0:
-                        # Lockwood et al.,2021方程
-                        diameterr_geo[k] = diameterr[k] * 0.998 + 22.3
-                        if k % 20 == 0: # Log only every 20th entry to avoid excessive logging
-                            logger.info(f"Year {k} Lockwood correction - Sample: {column_name}, Original: {diameterr[k]:.4f} cm, Corrected: {diameterr_geo[k]:.4f} cm")
-                    elif dbh_method == 1:
-                        # user defined correction rate
-                        orig_value = diameterr[k]
-                        diameterr_geo[k] = diameterr[k] * user_geometric_rate
-                        if k % 20 == 0: # Log only every 20th entry to avoid excessive logging
-                            logger.info(f"Year {k} custom geometric correction - Sample: {column_name}, Original: {orig_value:.4f} cm, Rate: {user_geometric_rate}, Corrected: {diameterr_geo[k]:.4f} cm")
-
-                    # bark correction
-                    if bark_method == -1:
-                        # Custom bark thickness based on user-defined rate
-                        #original_diameter = diameterr[k]
-                        bark_thickness = diameterr_geo[k] * user_bark_rate
-                        diameterr_geo_bark[k] = diameterr_geo[k] + bark_thickness
-                        if k % 20 == 0:  # Log less frequently to avoid excessive logging
-                            logger.info(
-                                f"Year {k} custom bark correction - Sample: {column_name}, Original diameter: {diameterr_geo[k]:.4f} cm, Rate: {user_bark_rate}, Bark thickness: {bark_thickness:.4f} cm, Corrected: {diameterr_geo[k]:.4f} cm")
-                    elif bark_method == 0:
-                        # No bark correction
-                        diameterr_geo_bark[k] = diameterr_geo[k]
-                    elif bark_method == 1:
-                        # Allometry-based bark correction using bark_dict_species
-                        # function
-                        bark_thickness = bark_dict_species(
-                            region, species_code, diameterr[k])
-                        if k % 20 == 0:  # Log only every 20th entry to avoid excessive logging
-                            logger.info(
-                                f"Year {k} bark correction - Species: {species_code}, Sample: {column_name}, Original diameter: {diameterr_geo[k]:.4f} cm, Bark thickness: {bark_thickness:.4f} cm, Corrected: {diameterr_geo[k] + bark_thickness:.4f} cm")
-                        diameterr_geo_bark[k] = diameterr_geo[k] + bark_thickness
-
-                # 计算直径增量
-                delta_dia[y_start] = diameter[y_start]
-                delta_diaa[y_start] = diameterr_geo_bark[y_start]
-
-                # 计算后续年份的直径增量
-                for k in range(y_start + 1, y_end + 1):
-                    if not pd.isna(diameter[k]) and not pd.isna(diameter[k - 1]):
-                        delta_dia[k] = diameter[k] - diameter[k - 1]
-                    if not pd.isna(diameterr_geo_bark[k]) and not pd.isna(diameterr_geo_bark[k - 1]):
-                        delta_diaa[k] = diameterr_geo_bark[k] - diameterr_geo_bark[k - 1]
-
-                # 批量计算生物量 - 使用批处理函数
-                valid_indices = ~diameter.isna()
-                valid_diameters = diameter[valid_indices].values
-
-                if len(valid_diameters) > 0:
-                    try:
-                        biomass_values = cached_calculate_biomass_batch(
-                            valid_diameters, species_code, lat, lon, logger)
-
-                        # 检查长度是否匹配
-                        if len(biomass_values) == sum(valid_indices):
-                            biomass[valid_indices] = biomass_values
-                        else:
-                            logger.error(
-                                f"生物量计算结果长度不匹配: 预期 {sum(valid_indices)}, 实际 {len(biomass_values)}")
-                            # 回退到逐个赋值以避免长度不匹配错误
-                            valid_idx_positions = np.where(valid_indices)[0]
-                            for j, pos in enumerate(valid_idx_positions):
-                                if j < len(biomass_values):
-                                    biomass.iloc[pos] = biomass_values[j]
-                    except Exception as e:
-                        logger.error(f"计算生物量时出错: {str(e)}")
-                        # 使用默认值或保持NaN
-
-                valid_indices = ~diameterr_geo_bark.isna()  # Changed from diameterr to diameterr_geo_bark
-                valid_diameters = diameterr_geo_bark[valid_indices].values  # Changed from diameterr to diameterr_geo_bark
-
-                if len(valid_diameters) > 0:
-                    try:
-                        biomasss_values = cached_calculate_biomass_batch(
-                            valid_diameters, species_code, lat, lon, logger)
-
-                        # 检查长度是否匹配
-                        if len(biomasss_values) == sum(valid_indices):
-                            biomasss[valid_indices] = biomasss_values
-                        else:
-                            logger.error(
-                                f"校正生物量计算结果长度不匹配: 预期 {sum(valid_indices)}, 实际 {len(biomasss_values)}")
-                            # 回退到逐个赋值以避免长度不匹配错误
-                            valid_idx_positions = np.where(valid_indices)[0]
-                            for j, pos in enumerate(valid_idx_positions):
-                                if j < len(biomasss_values):
-                                    biomasss.iloc[pos] = biomasss_values[j]
-                    except Exception as e:
-                        logger.error(f"计算校正生物量时出错: {str(e)}")
-                        # 使用默认值或保持NaN
-
-                # 计算生物量增量
-                delta_bio[y_start] = biomass[y_start]
-                delta_bioo[y_start] = biomasss[y_start]
-                
-                # 计算后续年份的生物量增量
-                for k in range(y_start + 1, y_end + 1):
-                    if not pd.isna(biomass[k]) and not pd.isna(biomass[k - 1]):
-                        delta_bio[k] = biomass[k] - biomass[k - 1]
-                    if not pd.isna(biomasss[k]) and not pd.isna(biomasss[k - 1]):
-                        delta_bioo[k] = biomasss[k] - biomasss[k - 1]
-
-                # 将处理结果保存到数据字典中，而不是立即添加到DataFrame中
-                # 为列名添加随机值标识
-                rand_suffix = f"_{rand_val}" if times > 0 else ""
-
-                # 存入字典而不是立即添加到DataFrame
-                col_key = f"dia{rand_suffix}_{column_name}"
-                data_columns['dia'][col_key] = diameter
-
-                col_key = f"bio{rand_suffix}_{column_name}"
-                data_columns['bio'][col_key] = biomass
-
-                col_key = f"delta_dia{rand_suffix}_{column_name}"
-                data_columns['delta_dia'][col_key] = delta_dia
-
-                col_key = f"delta_bio{rand_suffix}_{column_name}"
-                data_columns['delta_bio'][col_key] = delta_bio
-
-                col_key = f"diaa{rand_suffix}_{column_name}"
-                data_columns['diaa'][col_key] = diameterr
-
-                col_key = f"bioo{rand_suffix}_{column_name}"
-                data_columns['bioo'][col_key] = biomasss
-
-                col_key = f"delta_diaa{rand_suffix}_{column_name}"
-                data_columns['delta_diaa'][col_key] = delta_diaa
-
-                col_key = f"delta_bioo{rand_suffix}_{column_name}"
-                data_columns['delta_bioo'][col_key] = delta_bioo
-
-                col_key = f"age{rand_suffix}_{column_name}"
-                data_columns['age'][col_key] = age
+                    chronology_jobs[var_type] = (site_results.draw_values(var_type), None)
+            try:
+                batched_means = dplr_chronology_frames(years, chronology_jobs)
+                logger.info(f"Processed {len(batched_means)} chronologies in one dplR call")
+            except Exception as e:
+                logger.warning(f"Batched dplR chronology failed, falling back to per-variable calls: {e}")
 
-        # 完成数据收集后，一次性创建DataFrame，避免频繁插入列导致的碎片化
-        for key in ['dia', 'bio', 'delta_dia', 'delta_bio', 'diaa', 'bioo', 'delta_diaa', 'delta_bioo', 'age']:
-            dataframes[key] = pd.DataFrame(data_columns[key])
-        
         # Process each variable type to calculate means
-        for var_type in ['dia', 'bio', 'delta_dia', 'delta_bio', 'diaa', 'bioo', 'delta_diaa', 'delta_bioo', 'age']:
-            var_df = dataframes[var_type]
+        for var_type in mean_variables:
+            # 与随机值无关的变量只有一组样本列，按单次模拟计算均值
+            per_draw = times > 0 and var_type not in SITE_INVARIANT_VARIABLES
+            if summary_percentiles is not None and per_draw:
+                dataframes[f'{var_type}_mean'] = summarize_draws(
+                    years, site_results.draw_axis_values(var_type), var_type, summary_percentiles)
+                logger.info(f"Summarized {var_type} across {len(random_values)} simulations: percentiles {summary_percentiles}")
+                continue
+
             # Get all sample columns (excluding 'Year') for this variable type
-            all_sample_cols = [col for col in var_df.columns if col != 'Year'] 
+            all_sample_cols = site_results.column_names(var_type)
 
             if not all_sample_cols:
                 logger.warning(f"No sample columns found for {var_type}")
@@ -819,15 +681,24 @@ def plot_allometry_species(
             # Initialize the mean output dataframe for this variable type
             mean_output_df = pd.DataFrame({'Year': years})
             
+            if var_type in batched_means:
+                mean_output_df = batched_means[var_type]
+            elif get_chronology_backend() == 'native':
+                # NumPy biweight 年表: 所有随机值一次计算，行与年份一一对应 (见 chronology)
+                if per_draw and len(random_values) > 1:
+                    mean_output_df = chronology_frame(
+                        years, site_results.draw_axis_values(var_type), var_type, random_values)
+                else:
+                    mean_output_df = chronology_frame(years, site_results.draw_values(var_type), var_type)
+                logger.info(f"Processed {var_type} chronology using native biweight mean")
             # Check if we have multiple simulations (times > 0 and more than one random value)
-            if times > 0 and len(random_values) > 1:
+            elif per_draw and len(random_values) > 1:
                 logger.info(f"Calculating {var_type} means and sample depths for {len(random_values)} simulations.")
                 
                 # --- Multiple Simulations Logic ---
                 # mean_output_df starts with just 'Year' column
-                for rand_val in random_values:
-                    rand_suffix = f"_{rand_val}_"
-                    sim_sample_cols = [col for col in all_sample_cols if rand_suffix in col]
+                for rand_index, rand_val in enumerate(random_values):
+                    sim_sample_cols = site_results.column_names(var_type, rand_index)
 
                     if not sim_sample_cols:
                         logger.warning(f"No sample columns found for {var_type} simulation {rand_val}")
@@ -839,9 +710,9 @@ def plot_allometry_species(
                     sim_mean_col_name = f"mean_{var_type}_{rand_val}"
                     sim_samp_depth_col_name = f"samp.depth_{rand_val}"
 
+                    sample_data = site_results.draw_frame(var_type, rand_index)
                     try:
                         # Try R biweight mean for this simulation's samples
-                        sample_data = var_df[sim_sample_cols]
                         with localconverter(rpy2.robjects.default_converter + pandas2ri.converter):
                             r_df = pandas2ri.py2rpy(sample_data)
                             r_result = dplR.chron(r_df) 
@@ -880,8 +751,8 @@ def plot_allometry_species(
                     except Exception as e:
                         logger.warning(f"R processing failed for sim {rand_val}, falling back to pandas: {e}")
                         # Fallback to pandas mean and count for this simulation
-                        mean_values = var_df[sim_sample_cols].mean(axis=1).values
-                        samp_depth_values = var_df[sim_sample_cols].count(axis=1).values
+                        mean_values = sample_data.mean(axis=1).values
+                        samp_depth_values = sample_data.count(axis=1).values
                         
                         # Add mean column
                         if len(mean_values) >= len(years):
@@ -908,8 +779,8 @@ def plot_allometry_species(
                 mean_col_name = f"mean_{var_type}" 
                 samp_depth_col_name = "samp.depth" # Standard name
                 
+                sample_data = site_results.draw_frame(var_type)
                 try:
-                    sample_data = var_df[all_sample_cols]
                     with localconverter(rpy2.robjects.default_converter + pandas2ri.converter):
                         r_df = pandas2ri.py2rpy(sample_data)
                         r_result = dplR.chron(r_df)
@@ -960,8 +831,8 @@ def plot_allometry_species(
                 except Exception as e:
                     logger.error(f"Error calculating overall {var_type} mean/depth: {str(e)}")
                     # Fallback to pandas mean and count
-                    mean_values = var_df[all_sample_cols].mean(axis=1).values
-                    samp_depth_values = var_df[all_sample_cols].count(axis=1).values
+                    mean_values = sample_data.mean(axis=1).values
+                    samp_depth_values = sample_data.count(axis=1).values
                     # Add mean column
                     if len(mean_values) >= len(years):
                         mean_output_df[mean_col_name] = mean_values[:len(years)]
@@ -981,16 +852,21 @@ def plot_allometry_species(
             # Store the resulting mean dataframe
             dataframes[f'{var_type}_mean'] = mean_output_df
 
+        if cutoff_year is not None:
+            for name in dataframes:
+                dataframes[name] = apply_year_cutoff(dataframes[name], cutoff_year)
+
         # Assign all the final dataframes (including the potentially modified mean ones)
-        final_dia = dataframes['dia']
-        final_bio = dataframes['bio']
-        final_delta_dia = dataframes['delta_dia']
-        final_delta_bio = dataframes['delta_bio']
-        final_diaa = dataframes['diaa']
-        final_bioo = dataframes['bioo']
-        final_delta_diaa = dataframes['delta_diaa']
-        final_delta_bioo = dataframes['delta_bioo']
-        final_age = dataframes['age']
+        # 宽表只在写出CSV前从 site_results 生成
+        final_dia = site_results.to_frame('dia')
+        final_bio = site_results.to_frame('bio')
+        final_delta_dia = site_results.to_frame('delta_dia')
+        final_delta_bio = site_results.to_frame('delta_bio')
+        final_diaa = site_results.to_frame('diaa')
+        final_bioo = site_results.to_frame('bioo')
+        final_delta_diaa = site_results.to_frame('delta_diaa')
+        final_delta_bioo = site_results.to_frame('delta_bioo')
+        final_age = site_results.to_frame('age')
         
         final_dia_mean = dataframes['dia_mean']
         final_bio_mean = dataframes['bio_mean']
@@ -1116,7 +992,7 @@ def plot_allometry_species(
         plot_mean_df = dataframes.get('delta_bioo_mean', None)
         
         if plot_mean_df is not None and not plot_mean_df.empty:
-            if times > 0 and len(random_values) > 1:
+            if times > 0 and len(random_values) > 1 and summary_percentiles is None:
                 logger.info("Plotting mean AABI for each simulation.")
                 # Find all mean columns for delta_bioo simulations
                 sim_mean_cols = [col for col in plot_mean_df.columns if col.startswith('mean_delta_bioo_')]
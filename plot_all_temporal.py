@@ -1,18 +1,26 @@
 import os
 import sys
-import rpy2
-import tzlocal
-from rpy2.robjects import r
-from rpy2.robjects.packages import importr
-from rpy2.robjects.vectors import StrVector
-
-from rpy2.robjects.packages import importr, data
-from rpy2.robjects.vectors import DataFrame, StrVector
-from rpy2.robjects.conversion import localconverter
-import rpy2.robjects.pandas2ri as pandas2ri
+import logging
 import pandas as pd
 from pandas import *
 
+# R/dplR 只在 'r' 去趋势后端中使用；RWL 文件由 tucson 直接读取，没有 R 时也可以计算年表
+try:
+    import rpy2
+    import tzlocal
+    from rpy2.robjects import r
+    from rpy2.robjects.packages import importr
+    from rpy2.robjects.vectors import StrVector
+
+    from rpy2.robjects.packages import importr, data
+    from rpy2.robjects.vectors import DataFrame, StrVector
+    from rpy2.robjects.conversion import localconverter
+    import rpy2.robjects.pandas2ri as pandas2ri
+    R_AVAILABLE = True
+except ImportError:
+    R_AVAILABLE = False
+    logging.warning("rpy2未安装，去趋势只能使用 native 后端")
+
 #plot
 #import ggplot
 #import ggpy
@@ -20,12 +28,130 @@ from matplotlib import *
 from matplotlib import pyplot
 #import plotnine
 
-# 激活 pandas 转换
-pandas2ri.activate()
+import numpy as np
+
+from detrend import detrend_spline, get_detrend_backend, SPLINE_FREQUENCY_RESPONSE, SPLINE_LENGTH_FRACTION
+from chronology import site_chronology, BIWEIGHT_C
+from chronology_cache import get_chronology_cache, chronology_key, rwl_content_hash
+from tucson import read_rwl, get_rwl_reader
+
+if R_AVAILABLE:
+    # 激活 pandas 转换
+    pandas2ri.activate()
+
+    # 导入 R 包
+    dplR = importr('dplR')
+    r_base = importr('base')
+
+def detrend_chronology(widths):
+    """
+    样条去趋势 (50%频率响应，nyrs = 0.67 × 序列长度) 和 biweight 年表
+
+    去趋势后端为 'native' 时用 detrend.detrend_spline 和 chronology.site_chronology
+    一次处理站点的所有序列，为 'r' 时调用 dplR.detrend 和 dplR.chron。
+
+    参数:
+    widths: 以年份为索引的年轮宽度 DataFrame (见 tucson.read_rwl)
+
+    返回:
+    (pdf_input, pdf_mean): 年轮宽度指数 DataFrame 和年表 DataFrame (std, samp.depth)
+    """
+    if get_detrend_backend() == 'r':
+        if not R_AVAILABLE:
+            raise RuntimeError("'r' 去趋势后端需要 rpy2 和 dplR")
+        with localconverter(rpy2.robjects.default_converter + pandas2ri.converter):
+            TR_input = pandas2ri.py2rpy(widths)
+        TR_de = dplR.detrend(TR_input, method="Spline")
+        #biweight robust mean (an average that is unaffected by outliers)
+        TR_de1 = dplR.chron(TR_de)
+        with localconverter(rpy2.robjects.default_converter + pandas2ri.converter):
+            return pandas2ri.rpy2py(TR_de), pandas2ri.rpy2py(TR_de1)
+
+    indices = detrend_spline(widths.to_numpy(dtype=float))
+    std, samp_depth = site_chronology(indices)
+    pdf_input = pd.DataFrame(indices, index=widths.index, columns=widths.columns)
+    pdf_mean = pd.DataFrame({'std': std, 'samp.depth': samp_depth}, index=widths.index)
+    return pdf_input, pdf_mean
+
+
+def temporal_cache_key(tree_file):
+    """年表缓存的键: RWL 文件内容 (及读取方式) + 样条参数 + biweight 年表 (后端均随去趋势后端)"""
+    backend = get_detrend_backend()
+    return chronology_key(rwl_content_hash(tree_file),
+                          ('spline', SPLINE_FREQUENCY_RESPONSE, SPLINE_LENGTH_FRACTION, backend, get_rwl_reader()),
+                          ('biweight', BIWEIGHT_C, backend))
+
+
+def temporal_chronology_frames(tree_file):
+    """
+    读取一个 RWL 文件，去趋势并计算年表
+
+    结果 (年轮宽度指数、稳健均值和样本量) 保存在年表缓存中 (见 chronology_cache)，
+    同一文件再次处理时直接读取。
+
+    返回:
+    (pdf_input, pdf_mean): 以年份为索引的年轮宽度指数 DataFrame，
+    以及 Year, TRW_mean 两列的年表 DataFrame
+    """
+    cache = get_chronology_cache()
+    key = temporal_cache_key(tree_file) if cache is not None else None
+    entry = cache.get(key) if cache is not None else None
+
+    if entry is None:
+        # 直接解析 Tucson 文件，不需要 R (见 tucson)
+        widths = read_rwl(tree_file)
+
+        #The heteroscedastic variance structure was stabilized using adaptive power transformation prior to detrending.
+        #The age/size-related trends in the raw data were removed from
+        # all series using cubic smoothing spline detrending with a 50% frequency
+        # from Babst et al 2019 DOI: 10.1126/sciadv.aat4313
+        #TR_powt = dplR.powt(TR_input)
+        pdf_input, pdf_mean = detrend_chronology(widths)  #TRW mean
+
+        t_start = widths.index[0]
+        t_end = widths.index[-1]
+        entry = {
+            'years': np.arange(int(t_start), int(t_end) + 1),
+            'series': np.asarray([str(name) for name in pdf_input.columns]),
+            'indices': pdf_input.to_numpy(dtype=float),
+            'std': pdf_mean.iloc[:, 0].to_numpy(dtype=float),
+            'samp_depth': pdf_mean.iloc[:, 1].to_numpy(dtype=float),
+        }
+        if cache is not None:
+            cache.put(key, entry)
+
+    years = range(int(entry['years'][0]), int(entry['years'][-1]) + 1)  # get the year index in the data
+    pdf_input = pd.DataFrame(entry['indices'], index=years, columns=entry['series'].tolist())
+    pdf_mean = pd.DataFrame({'Year': years, 'TRW_mean': entry['std']}, index=years)
+    return pdf_input, pdf_mean
+
+
+def write_temporal_chronology(tree_file, output_dir=None):
+    """
+    为一个 RWL 文件写出 <站点>_tr.csv 和 <站点>_tr_mean.csv
+
+    参数:
+    tree_file: RWL 文件路径
+    output_dir: 输出目录；None时写到当前目录
+
+    返回:
+    (pdf_input, pdf_mean)
+    """
+    #get the file name without direct and file type Yizhao 2019/12/23
+    mm = os.path.splitext(os.path.basename(tree_file))[0]
+    pdf_input, pdf_mean = temporal_chronology_frames(tree_file)
+
+    name_tr = mm + "_tr.csv"  # "output_tr.csv"
+    name_tr_mean = mm + "_tr_mean.csv"  # "output_tr_mean.csv"
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+        name_tr = os.path.join(output_dir, name_tr)
+        name_tr_mean = os.path.join(output_dir, name_tr_mean)
+
+    pdf_input.to_csv(path_or_buf=name_tr, sep=',', na_rep="-999")
+    pdf_mean.to_csv(path_or_buf=name_tr_mean, sep=',', na_rep="-999")
+    return pdf_input, pdf_mean
 
-# 导入 R 包
-dplR = importr('dplR')
-r_base = importr('base')
 
 #add lat_in lon_in for global synthesis Yizh
 def plot_all(output_fl,nIndex):
@@ -41,131 +167,12 @@ def plot_all(output_fl,nIndex):
     print(f"fk: {fk}")
     print(f"fk[0]: {fk[0]}")
 
-    TR_input_dir = fk[0]
-    #print("hello")
-    #print(fk[0])
-    #get the file name without direct and file type Yizhao 2019/12/23
-    mm = os.path.splitext(os.path.basename(fk[0]))[0]
-    print("mm1" + mm)
-    TR_input = r['read.tucson'](TR_input_dir)
-    start = r['min'](r['as.numeric'](r['rownames'](TR_input)))
-    end = r['max'](r['as.numeric'](r['rownames'](TR_input)))
-    #r['as.numeric'](r['max'](r['rownames'](TR_input)))
-    # get observation period
-    TRW = r['data.frame'](year=r['seq'](start, end, 1))
-    # select only important rows ( the tree (?) or series names, e.g. "LF317s")
-    all = r['names'](TR_input)
-
-    #The heteroscedastic variance structure was stabilized using adaptive power transformation prior to detrending.
-    #The age/size-related trends in the raw data were removed from
-    # all series using cubic smoothing spline detrending with a 50% frequency
-    # from Babst et al 2019 DOI: 10.1126/sciadv.aat4313
-    #TR_powt = dplR.powt(TR_input)
-    TR_de = dplR.detrend(TR_input, method="Spline")
-
-    #biweight robust mean (an average that is unaffected by outliers)
-    TR_de1 = dplR.chron(TR_de)
-
-
-    with localconverter(rpy2.robjects.default_converter + pandas2ri.converter):
-        pdf_input = pandas2ri.rpy2py(TR_de)
-        pdf_mean = pandas2ri.rpy2py(TR_de1)  #TRW mean
-        
-        # 对于单个数值，直接从 R 对象中提取值
-        t_start = float(start[0])
-        t_end = float(end[0])
-        
-        # 数据框处理保持不变
-        years = range(int(t_start), int(t_end) + 1)  # get the year index in the data
-        pdf_input.index = years  # put the year as the index in the data
-        pdf_mean.index = years
-        pdf_input.insert(0, "Year", years)  # put years as the first column
-        pdf_mean.insert(0, "Year", years)
-        pdf_input = pdf_input.drop(pdf_input.columns[0], axis=1)  # delect the first column of years
-        pdf_mean = pdf_mean.drop(pdf_mean.columns[2],axis=1)
-        pdf_mean.columns = ['Year', 'TRW_mean']
-
-        #pdf_mean = pdf_input.mean(axis=1)
-        #pdf_mean = pdf_input.mean(axis=1)
-        #pdf_mean_input = DataFrame(pdf_mean)
-        #pdf_mean_input.index = years  # put the year as the index in the data
-        #pdf_mean_input.insert(0, "Year", years)  # put years as the first column
-        #pdf_mean_input.columns = ['Year', 'TRW_mean']
-
-        pdf_max = pdf_input.max(axis=1)
-        pdf_min = pdf_input.min(axis=1)
-        pdf_std = pdf_input.std(axis=1)
-        pdf_c_summary = pdf_input.describe()
-
-        name_tr = mm + "_tr.csv"  # "output_tr.csv"
-        name_tr_mean = mm + "_tr_mean.csv"  # "output_tr_mean.csv"
-
-        pdf_input.to_csv(path_or_buf=name_tr, sep=',', na_rep="-999")
-        pdf_mean.to_csv(path_or_buf=name_tr_mean, sep=',', na_rep="-999")
-
-
-
-    for i in range(1, len(fk)):
-        TR_input_dir = fk[i]
-        TR_input = r['read.tucson'](TR_input_dir)
-        start = r['min'](r['as.numeric'](r['rownames'](TR_input)))
-        end = r['max'](r['as.numeric'](r['rownames'](TR_input)))
-        # get observation period
-        TRW = r['data.frame'](year=r['seq'](start, end, 1))
-        # select only important rows ( the tree (?) or series names, e.g. "LF317s")
-        all = r['names'](TR_input)
-
-        # The heteroscedastic variance structure was stabilized using adaptive power transformation prior to detrending.
-        # The age/size-related trends in the raw data were removed from
-        # all series using cubic smoothing spline detrending with a 50% frequency
-        # from Babst et al 2019 DOI: 10.1126/sciadv.aat4313
-        #TR_powt = dplR.powt(TR_input)
-        TR_de = dplR.detrend(TR_input, method="Spline")
-        # TR_de1 = dplR.chron(TR_de, prefix="CAM")
-        # print("test")
-        # print(TR_de1)
-
-        # biweight robust mean (an average that is unaffected by outliers)
-        TR_de1 = dplR.chron(TR_de)
-
-        #get the file name without direct and file type Yizhao 2019/12/23
-        mm = os.path.splitext(os.path.basename(fk[i]))[0]
-        print("mm2"+ mm)
-        with localconverter(rpy2.robjects.default_converter + pandas2ri.converter):
-            pdf_input1 = pandas2ri.rpy2py(TR_de)
-            pdf_mean1 = pandas2ri.rpy2py(TR_de1)  #TRW mean
-            
-            # 对于单个数值，直接从 R 对象中提取值
-            t_start = float(start[0])
-            t_end = float(end[0])
-            
-            # 数据框处理保持不变
-            years = range(int(t_start), int(t_end) + 1)  # get the year index in the data
-            pdf_input1.index = years  # put the year as the index in the data
-            pdf_mean1.index = years
-            pdf_input1.insert(0, "Year", years)  # put years as the first column
-            pdf_mean1.insert(0, "Year", years)
-            pdf_input1 = pdf_input1.drop(pdf_input1.columns[0], axis=1)  # delect the first column of years
-            pdf_mean1 = pdf_mean1.drop(pdf_mean1.columns[2], axis=1)
-            pdf_mean1.columns = ['Year', 'TRW_mean']
-
-
-            # pdf_mean1 = pdf_input1.mean(axis=1)
-            # pdf_mean1_input = DataFrame(pdf_mean1)
-            # pdf_mean1_input.index = years  # put the year as the index in the data
-            # pdf_mean1_input.insert(0, "Year", years)  # put years as the first column
-            # pdf_mean1_input.columns = ['Year','TRW_mean']
-
-            pdf_max1 = pdf_input1.max(axis=1)
-            pdf_min1 = pdf_input1.min(axis=1)
-            pdf_std1 = pdf_input1.std(axis=1)
-            pdf_c_summary1 = pdf_input1.describe()
-
-            name_tr = mm + "_tr.csv"  # "output_tr.csv"
-            name_tr_mean = mm + "_tr_mean.csv"  # "output_tr_mean.csv"
-
-            pdf_input1.to_csv(path_or_buf=name_tr, sep=',', na_rep="-999")
-            pdf_mean1.to_csv(path_or_buf=name_tr_mean, sep=',', na_rep="-999")
+    # 多个文件的并行处理见 temporal_batch.plot_all_batch
+    for i, TR_input_dir in enumerate(fk):
+        mm = os.path.splitext(os.path.basename(TR_input_dir))[0]
+        print(("mm1" if i == 0 else "mm2") + mm)
+        write_temporal_chronology(TR_input_dir)
+        if i > 0:
             print('bingo')
 
 
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+初始宽度偏差的抽样
+
+原来的做法是用 random.uniform 逐个抽取随机值放入集合，按3位小数去重；不可复现，
+而且 times 超过区间内不同取值的个数时会无限循环。本模块提供可设定种子的抽样方法:
+- 'uniform': 独立均匀抽样 (默认，与原来的分布相同)；
+- 'lhs':     分层 / 拉丁超立方抽样，[min, max] 等分为 times 层，每层抽一个值；
+- 'sobol':   Sobol 低差异序列 (一维即 van der Corput 序列)，加随机数字平移。
+
+分层和低差异抽样在较少的随机值下就能得到稳定的不确定性估计。
+
+所有方法的结果都按3位小数取整并去重 (用于列名)；区间内不同取值不足 times 个时
+抛出 ValueError。
+"""
+
+import os
+
+import numpy as np
+
+# 抽样方法
+SAMPLING_METHODS = ('uniform', 'lhs', 'sobol')
+_SAMPLING_METHOD = os.environ.get('TR_SNP_SAMPLING', 'uniform')
+_SAMPLING_SEED = int(os.environ['TR_SNP_SAMPLING_SEED']) if os.environ.get('TR_SNP_SAMPLING_SEED') else None
+
+# 随机值保留的小数位数
+DECIMALS = 3
+
+# Sobol 序列的位数
+_SOBOL_BITS = 32
+
+
+def set_sampling_method(method, seed=None):
+    """
+    选择初始宽度偏差的抽样方法
+
+    参数:
+    method: 'uniform' (默认)、'lhs' 或 'sobol'
+    seed: 随机种子；None时保留当前设置的种子 (未设置种子时每次运行的结果不同)
+    """
+    global _SAMPLING_METHOD, _SAMPLING_SEED
+    if method not in SAMPLING_METHODS:
+        raise ValueError(f"未知的抽样方法: {method}，可选: {', '.join(SAMPLING_METHODS)}")
+    _SAMPLING_METHOD = method
+    if seed is not None:
+        _SAMPLING_SEED = seed
+
+
+def get_sampling_method():
+    """返回当前的抽样方法和种子 (方法, 种子)"""
+    return _SAMPLING_METHOD, _SAMPLING_SEED
+
+
+def make_sampler_rng(seed=None):
+    """返回抽样用的随机数生成器；seed为None时使用当前设置的种子"""
+    return np.random.default_rng(_SAMPLING_SEED if seed is None else seed)
+
+
+def _unit_uniform(n, rng):
+    return rng.random(n)
+
+
+def _unit_lhs(n, rng):
+    # 每层 [k/n, (k+1)/n) 抽一个值，再打乱顺序
+    return rng.permutation((np.arange(n) + rng.random(n)) / n)
+
+
+def _unit_sobol(n, rng):
+    index = np.arange(n, dtype=np.uint64)
+    reversed_bits = np.zeros(n, dtype=np.uint64)
+    for bit in range(_SOBOL_BITS):
+        reversed_bits |= ((index >> np.uint64(bit)) & np.uint64(1)) << np.uint64(_SOBOL_BITS - 1 - bit)
+    shift = np.uint64(rng.integers(0, 2 ** _SOBOL_BITS))
+    return (reversed_bits ^ shift).astype(float) / 2 ** _SOBOL_BITS
+
+
+_UNIT_SAMPLERS = {
+    'uniform': _unit_uniform,
+    'lhs': _unit_lhs,
+    'sobol': _unit_sobol,
+}
+
+
+def sample_initial_widths(min_value, max_value, times, method=None, rng=None):
+    """
+    抽取 times 个不重复的初始宽度偏差
+
+    参数:
+    min_value, max_value: 随机值范围
+    times: 随机值个数 (>0)
+    method: 抽样方法；None时使用 set_sampling_method 的设置
+    rng: numpy 随机数生成器 (见 make_sampler_rng)；多个站点共用一个生成器时结果可复现
+
+    返回:
+    列表: times 个按3位小数取整的随机值
+    """
+    method = method or _SAMPLING_METHOD
+    if method not in _UNIT_SAMPLERS:
+        raise ValueError(f"未知的抽样方法: {method}，可选: {', '.join(SAMPLING_METHODS)}")
+    if rng is None:
+        rng = make_sampler_rng()
+
+    low, high = sorted((float(min_value), float(max_value)))
+    scale = 10 ** DECIMALS
+    first, last = int(np.ceil(round(low * scale, 6))), int(np.floor(round(high * scale, 6)))
+    n_distinct = last - first + 1
+    if times > n_distinct:
+        raise ValueError(f"范围 [{min_value}, {max_value}] 内只有 {max(n_distinct, 0)} 个不同的"
+                         f"{DECIMALS}位小数取值，无法抽取 {times} 个不重复的随机值")
+
+    steps = np.round((low + _UNIT_SAMPLERS[method](times, rng) * (high - low)) * scale)
+    steps = np.clip(steps, first, last).astype(np.int64)
+
+    # 取整后重复的值从其余未使用的取值中均匀补齐
+    unique_steps = list(dict.fromkeys(steps.tolist()))
+    if len(unique_steps) < times:
+        unused = np.setdiff1d(np.arange(first, last + 1), unique_steps)
+        unique_steps.extend(rng.choice(unused, times - len(unique_steps), replace=False).tolist())
+    return [round(step / scale, DECIMALS) for step in unique_steps]
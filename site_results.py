@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+站点结果的紧凑存储
+
+每个站点有 9 个输出变量 × 样本 × 随机值 的逐年序列。SiteResults 为每个变量预先分配
+一个 (年份, 随机值, 样本) 数组（可选 float32），年份、样本名和随机值只保存一份，
+只在需要时（计算均值、写出CSV）才生成 DataFrame。
+
+列名与原来的输出一致:
+- 有随机值时: {变量}_{随机值}_{样本}
+- 没有随机值时: {变量}_{样本}
+
+与随机值无关的变量 (invariant，如原始直径和原始生物量) 只保存一份，列名为
+{变量}_{样本}。
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class SiteResults:
+    """
+    一个站点所有变量的结果数组
+
+    参数:
+    years: 年份序列 (作为DataFrame的索引和Year列)
+    variables: 变量名列表，如 ['dia', 'bio', ...]
+    samples: 有有效值的样本名列表
+    draws: 随机值列表；None 表示没有随机值维度 (列名中不含随机值)
+    dtype: 数组类型，np.float64 (默认) 或 np.float32 (内存减半)
+    invariant: 与随机值无关的变量名，只保存一份 (没有随机值维度)
+    """
+
+    def __init__(self, years, variables, samples, draws=None, dtype=np.float64, invariant=()):
+        self.years = pd.Index(years)
+        self.samples = list(samples)
+        self.draws = list(draws) if draws is not None else None
+        self.dtype = np.dtype(dtype)
+        self.invariant = set(invariant)
+        n_draws = len(self.draws) if self.draws is not None else 1
+        self._values = {
+            variable: np.full((len(self.years), 1 if variable in self.invariant else n_draws, len(self.samples)),
+                              np.nan, dtype=self.dtype)
+            for variable in variables
+        }
+
+    @property
+    def variables(self):
+        return list(self._values)
+
+    @property
+    def nbytes(self):
+        """所有结果数组占用的字节数"""
+        return sum(values.nbytes for values in self._values.values())
+
+    def store(self, variable, draw_start, draw_stop, values):
+        """
+        写入一块随机值的结果
+
+        参数:
+        values: (年份, 列) 二维数组，列按 随机值 -> 样本 的顺序排列 (见 diameter_engine.draw_columns)；
+                invariant 变量为 (年份, 样本)，忽略 draw_start/draw_stop
+        """
+        if variable in self.invariant:
+            draw_start, draw_stop = 0, 1
+        block = np.asarray(values).reshape(len(self.years), draw_stop - draw_start, len(self.samples))
+        self._values[variable][:, draw_start:draw_stop, :] = block
+
+    def column_names(self, variable, draw_index=None):
+        """变量的输出列名；draw_index 不为None时只返回该随机值的列"""
+        if self.draws is None or variable in self.invariant:
+            return [f"{variable}_{sample}" for sample in self.samples]
+        draws = self.draws if draw_index is None else [self.draws[draw_index]]
+        return [f"{variable}_{draw}_{sample}" for draw in draws for sample in self.samples]
+
+    def draw_values(self, variable, draw_index=0):
+        """一个随机值的 (年份, 样本) 结果（视图）"""
+        if variable in self.invariant:
+            draw_index = 0
+        return self._values[variable][:, draw_index, :]
+
+    def draw_axis_values(self, variable):
+        """所有随机值的 (随机值, 年份, 样本) 结果（视图）"""
+        return np.moveaxis(self._values[variable], 1, 0)
+
+    def draw_frame(self, variable, draw_index=0):
+        """一个随机值所有样本的 DataFrame（不含Year列）"""
+        if variable in self.invariant:
+            draw_index = None
+        return pd.DataFrame(self.draw_values(variable, draw_index or 0), index=self.years,
+                            columns=self.column_names(variable, draw_index))
+
+    def to_frame(self, variable):
+        """生成与原输出相同的宽表: Year列 + 所有随机值和样本的列"""
+        values = self._values[variable]
+        frame = pd.DataFrame(values.reshape(len(self.years), -1), index=self.years,
+                             columns=self.column_names(variable))
+        frame.insert(0, 'Year', np.asarray(self.years))
+        return frame
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+站点计算阶段的缓存
+
+在配置对话框中反复运行同一个站点时，通常只改变树皮或几何校正的设置，但每次运行都
+重新用 R 读取 RWL、重新计算原始直径和生物量、重新计算所有年表。本模块把一次站点
+运行拆成明确的阶段:
+
+    parse -> raw_biomass -> chronology(原始变量)
+          -> corrected (校正直径/生物量，随校正设置变化，不缓存)
+
+每个阶段的键是 阶段名 + 上游阶段的键 + 本阶段参数 的哈希，结果缓存在内存中，
+可选地同时写入磁盘 (每个键一个 pickle 文件)。只改变树皮设置时，parse、原始生物量
+和原始变量的年表都直接从缓存读取，只有校正之后的阶段重新计算。
+"""
+
+import os
+import hashlib
+import pickle
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_MAX_ENTRIES = 256
+
+
+def _default_stage_dir():
+    cache_dir = os.environ.get('TR_SNP_CACHE_DIR') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'cache')
+    return os.path.join(cache_dir, 'stages')
+
+
+def _update_hash(digest, value):
+    """把参数写入哈希 (numpy数组按内容，其余按repr)"""
+    if isinstance(value, np.ndarray):
+        digest.update(str((value.dtype.str, value.shape)).encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (list, tuple)):
+        digest.update(f"{type(value).__name__}{len(value)}(".encode())
+        for item in value:
+            _update_hash(digest, item)
+        digest.update(b')')
+    else:
+        digest.update(repr(value).encode())
+        digest.update(b';')
+
+
+def stage_key(stage, *inputs):
+    """
+    阶段的缓存键
+
+    参数:
+    stage: 阶段名
+    inputs: 上游阶段的键和本阶段的参数
+
+    返回:
+    字符串，如 'parse-3f2a...'
+    """
+    digest = hashlib.sha1(stage.encode())
+    for value in inputs:
+        _update_hash(digest, value)
+    return f"{stage}-{digest.hexdigest()}"
+
+
+def file_fingerprint(path):
+    """文件的标识: (绝对路径, 修改时间, 大小)；文件改变后键也随之改变"""
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+
+class StageCache:
+    """
+    阶段结果缓存
+
+    参数:
+    path: 磁盘缓存目录；None时只缓存在内存中
+    max_entries: 内存中保留的最大条目数 (LRU)
+    """
+
+    def __init__(self, path=None, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if self.path:
+            os.makedirs(self.path, exist_ok=True)
+
+    def _file(self, key):
+        return os.path.join(self.path, f"{key}.pkl")
+
+    def get(self, key, default=None):
+        """读取缓存；内存中没有时再读磁盘"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+        if self.path and os.path.exists(self._file(key)):
+            try:
+                with open(self._file(key), 'rb') as f:
+                    value = pickle.load(f)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                value = None
+            else:
+                self._remember(key, value)
+                with self._lock:
+                    self.hits += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        return default
+
+    def put(self, key, value):
+        """写入缓存 (磁盘文件先写临时文件再改名，避免读到不完整的文件)"""
+        self._remember(key, value)
+        if self.path:
+            tmp_file = f"{self._file(key)}.{os.getpid()}.tmp"
+            with open(tmp_file, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, self._file(key))
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def run(self, stage, inputs, compute, logger=None):
+        """
+        运行一个阶段: 命中缓存时直接返回结果，否则调用 compute() 并缓存
+
+        参数:
+        stage: 阶段名
+        inputs: 上游阶段的键和本阶段参数的序列
+        compute: 无参数函数，返回阶段结果
+
+        返回:
+        (键, 结果)
+        """
+        key = stage_key(stage, *inputs)
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = compute()
+            self.put(key, value)
+        elif logger:
+            logger.info(f"阶段缓存命中: {stage} ({key[-12:]})")
+        return key, value
+
+    def clear(self):
+        """清空内存中的缓存 (磁盘文件保留)"""
+        with self._lock:
+            self._entries.clear()
+
+
+# 全局阶段缓存: 默认只在内存中；TR_SNP_STAGE_CACHE 设置磁盘目录
+_STAGE_CACHE = StageCache(os.environ.get('TR_SNP_STAGE_CACHE') or None)
+
+
+def set_stage_cache(path=None, enabled=True, max_entries=DEFAULT_MAX_ENTRIES):
+    """
+    设置全局阶段缓存
+
+    参数:
+    path: 磁盘缓存目录；True使用默认目录 ($TR_SNP_CACHE_DIR/stages)，None只缓存在内存中
+    enabled: False时关闭阶段缓存 (每次运行都重新计算)
+    """
+    global _STAGE_CACHE
+    if not enabled:
+        _STAGE_CACHE = None
+        return None
+    if path is True:
+        path = _default_stage_dir()
+    _STAGE_CACHE = StageCache(path, max_entries=max_entries)
+    return _STAGE_CACHE
+
+
+def get_stage_cache():
+    """返回全局阶段缓存，关闭时为None"""
+    return _STAGE_CACHE
+
+
+def run_stage(stage, inputs, compute, logger=None):
+    """用全局阶段缓存运行一个阶段；缓存关闭时直接计算，返回 (键, 结果)"""
+    if _STAGE_CACHE is None:
+        return stage_key(stage, *inputs), compute()
+    return _STAGE_CACHE.run(stage, inputs, compute, logger)
@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+站点年表质量统计: 序列间相关、rbar 和 EPS (NumPy 实现)
+
+全球综合分析需要按站点质量筛选站点；通过 dplR (rwi.stats、interseries.cor) 逐个站点
+计算 6000 多个站点太慢。本模块用带掩码的矩阵运算一次计算一个站点所有序列两两之间
+的相关系数，只使用两条序列都有值的年份 (重叠少于 min_overlap 年的序列对不参与):
+
+    M = 有值的掩码, X = 缺测处为0的 (年份, 序列) 数组
+    n_ij = MᵀM, Σx_i = XᵀM, Σx_i² = (X²)ᵀM, Σx_i x_j = XᵀX
+
+- rbar: 所有序列对相关系数的均值 (dplR rbar.tot)；
+- 序列间相关: 每条序列与其余序列均值的相关系数 (留一法)；
+- EPS = n rbar / (1 + (n - 1) rbar)，n 为每年平均的序列数 (样本量)；
+- 滑动窗口 (默认50年，重叠25年，与 dplR rwi.stats.running 相同) 中的 rbar 和 EPS，
+  多个窗口一起计算 (每批窗口的 (窗口, 序列, 序列) 数组不超过 _MAX_BATCH_ELEMENTS 个元素，
+  几千年、上千条序列的站点也不会占满内存)；
+- EPS 截断年份: 早期样本量逐渐增加的阶段中 EPS 达到阈值 (默认0.85) 的年份；
+  样本量达到最大之后个别窗口的 EPS 低于阈值不影响截断年份，
+  plot_allometry 可以在计算均值之前去掉截断年份之前的年份 (见 apply_year_cutoff)。
+
+统计量应在去趋势后的年轮宽度指数上计算 (见 detrend.detrend_spline)。
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+
+# 常用的 EPS 阈值 (Wigley et al. 1984)
+EPS_THRESHOLD = 0.85
+DEFAULT_WINDOW_LENGTH = 50
+DEFAULT_MIN_OVERLAP = 30
+# 一批窗口的 (窗口, 序列, 序列) 数组的元素数上限
+_MAX_BATCH_ELEMENTS = 2 ** 23
+
+
+def _pairwise(values, min_overlap):
+    """
+    (..., 年份, 序列) 数组中序列两两之间的相关系数和重叠年数
+
+    返回:
+    (corr, overlap): (..., 序列, 序列)；重叠不足或方差为0的序列对以及对角线为NaN
+    """
+    mask = ~np.isnan(values)
+    m = mask.astype(float)
+    # 先减去每条序列的均值，减小大数相消的误差 (相关系数与平移无关)
+    with warnings.catch_warnings():
+        # 全为NaN的序列没有均值
+        warnings.simplefilter('ignore', RuntimeWarning)
+        centre = np.nanmean(values, axis=-2, keepdims=True)
+    x = np.where(mask, values - np.nan_to_num(centre), 0.0)
+    xt = np.swapaxes(x, -1, -2)
+    mt = np.swapaxes(m, -1, -2)
+
+    n = mt @ m
+    sum_i = xt @ m
+    sum_j = np.swapaxes(sum_i, -1, -2)
+    sumsq_i = (xt * xt) @ m
+    sumsq_j = np.swapaxes(sumsq_i, -1, -2)
+    cross = xt @ x
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        covariance = n * cross - sum_i * sum_j
+        variance = (n * sumsq_i - sum_i ** 2) * (n * sumsq_j - sum_j ** 2)
+        corr = covariance / np.sqrt(variance)
+    s = values.shape[-1]
+    invalid = (n < max(min_overlap, 3)) | ~(variance > 0) | np.eye(s, dtype=bool)
+    corr = np.where(invalid, np.nan, np.clip(corr, -1.0, 1.0))
+    return corr, n
+
+
+def pairwise_correlations(values, min_overlap=DEFAULT_MIN_OVERLAP):
+    """
+    序列两两之间的相关系数
+
+    参数:
+    values: (年份, 序列) 数组，缺测为NaN
+    min_overlap: 最少重叠年数
+
+    返回:
+    (corr, overlap): (序列, 序列) 相关系数矩阵 (不可用处为NaN) 和重叠年数矩阵
+    """
+    return _pairwise(np.asarray(values, dtype=float), min_overlap)
+
+
+def _mean_upper(corr):
+    """(..., 序列, 序列) 矩阵上三角中有效值的均值"""
+    s = corr.shape[-1]
+    upper = np.triu(np.ones((s, s), dtype=bool), k=1)
+    pairs = np.where(upper, corr, np.nan)
+    valid = ~np.isnan(pairs)
+    count = valid.sum(axis=(-1, -2))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, np.where(valid, pairs, 0.0).sum(axis=(-1, -2)) / count, np.nan)
+
+
+def rbar(values, min_overlap=DEFAULT_MIN_OVERLAP):
+    """所有序列对相关系数的均值 (dplR rbar.tot)"""
+    corr, _ = pairwise_correlations(values, min_overlap)
+    return float(_mean_upper(corr))
+
+
+def interseries_correlation(values, min_overlap=DEFAULT_MIN_OVERLAP):
+    """
+    每条序列与其余序列均值 (留一法) 的相关系数
+
+    返回:
+    (序列,) 数组；重叠不足 min_overlap 年的序列为NaN
+    """
+    values = np.asarray(values, dtype=float)
+    mask = ~np.isnan(values)
+    filled = np.where(mask, values, 0.0)
+    total = filled.sum(axis=1, keepdims=True)
+    depth = mask.sum(axis=1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        others = (total - filled) / (depth - mask)
+    # 每条序列和它的参照序列在同一列中计算相关: 交错成 (年份, 序列, 2) 再逐对计算
+    paired = np.stack([np.where(mask, values, np.nan), np.where(depth - mask > 0, others, np.nan)], axis=-1)
+    corr, _ = _pairwise(np.moveaxis(paired, 1, 0), min_overlap)
+    return corr[:, 0, 1]
+
+
+def expressed_population_signal(rbar_value, n):
+    """EPS = n rbar / (1 + (n - 1) rbar)"""
+    rbar_value = np.asarray(rbar_value, dtype=float)
+    n = np.asarray(n, dtype=float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return n * rbar_value / (1 + (n - 1) * rbar_value)
+
+
+def _mean_depth(values):
+    """有值年份的平均样本量 (..., 年份, 序列) -> (...)"""
+    depth = (~np.isnan(values)).sum(axis=-1)
+    present = depth > 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(present, depth, 0).sum(axis=-1) / present.sum(axis=-1)
+
+
+def running_statistics(years, values, window_length=DEFAULT_WINDOW_LENGTH, window_overlap=None,
+                       min_overlap=None):
+    """
+    滑动窗口中的 rbar 和 EPS (按批计算多个窗口)
+
+    参数:
+    years: 年份序列
+    values: (年份, 序列) 数组
+    window_length: 窗口长度 (年)；站点年数更少时只有一个窗口
+    window_overlap: 相邻窗口的重叠年数，默认为窗口长度的一半
+    min_overlap: 计算相关系数的最少重叠年数，默认为 min(30, window_length)
+
+    返回:
+    DataFrame: start_year, mid_year, end_year, n_series, n, rbar, eps
+    """
+    years = np.asarray(years)
+    values = np.asarray(values, dtype=float)
+    n_years = len(years)
+    if window_overlap is None:
+        window_overlap = window_length // 2
+    if min_overlap is None:
+        min_overlap = min(DEFAULT_MIN_OVERLAP, window_length)
+    length = min(window_length, n_years)
+    step = max(window_length - window_overlap, 1)
+    starts = np.arange(0, max(n_years - length, 0) + 1, step)
+
+    batch = max(1, _MAX_BATCH_ELEMENTS // max(values.shape[1] ** 2, 1))
+    window_rbar, depth, n_series = [], [], []
+    for first in range(0, len(starts), batch):
+        windows = values[starts[first:first + batch, np.newaxis] + np.arange(length)]  # (窗口, 年份, 序列)
+        corr, _ = _pairwise(windows, min_overlap)
+        window_rbar.append(_mean_upper(corr))
+        depth.append(_mean_depth(windows))
+        n_series.append((~np.isnan(windows)).any(axis=1).sum(axis=-1))
+    window_rbar = np.concatenate(window_rbar)
+    depth = np.concatenate(depth)
+    return pd.DataFrame({
+        'start_year': years[starts],
+        'mid_year': years[starts + (length - 1) // 2],
+        'end_year': years[starts + length - 1],
+        'n_series': np.concatenate(n_series),
+        'n': depth,
+        'rbar': window_rbar,
+        'eps': expressed_population_signal(window_rbar, depth),
+    })
+
+
+def eps_cutoff_year(years, values, threshold=EPS_THRESHOLD, **running_kwargs):
+    """
+    EPS 截断年份
+
+    EPS 低通常是因为年表早期的序列少。只看样本量逐渐增加的阶段 (到平均样本量最大的
+    窗口为止)：从返回的年份所在窗口起，到该窗口为止的所有窗口 EPS 都不低于 threshold；
+    样本量最大之后的窗口 (如近期序列减少) 不影响截断年份。样本量最大的窗口本身不满足
+    条件时，取第一个满足条件的窗口。年份为窗口的中间年份 (dplR rwi.stats.running 的 mid.year)。
+
+    返回:
+    截断年份 (int)；没有满足条件的窗口时为None
+    """
+    running = running_statistics(years, values, **running_kwargs)
+    passed = (running['eps'] >= threshold).to_numpy()
+    if not passed.any():
+        return None
+    depth = running['n'].to_numpy(dtype=float)
+    peak = int(np.nanargmax(depth))
+    # 样本量增加阶段中最后一个不满足条件的窗口之后的第一个窗口
+    failed = np.nonzero(~passed[:peak + 1])[0]
+    first = failed[-1] + 1 if len(failed) else 0
+    if first > peak:
+        first = int(np.nonzero(passed)[0][0])
+    return int(running['mid_year'].iloc[first])
+
+
+def site_quality(years, values, threshold=EPS_THRESHOLD, min_overlap=DEFAULT_MIN_OVERLAP, **running_kwargs):
+    """
+    站点的质量统计
+
+    返回:
+    字典: n_series, rbar_tot, interseries_cor (各序列的均值), eps_tot, eps_cutoff_year
+    """
+    values = np.asarray(values, dtype=float)
+    corr, _ = pairwise_correlations(values, min_overlap)
+    rbar_tot = float(_mean_upper(corr))
+    interseries = interseries_correlation(values, min_overlap)
+    with np.errstate(invalid='ignore'):
+        interseries_mean = float(np.nanmean(interseries)) if np.any(~np.isnan(interseries)) else np.nan
+    return {
+        'n_series': int((~np.isnan(values)).any(axis=0).sum()),
+        'rbar_tot': rbar_tot,
+        'interseries_cor': interseries_mean,
+        'eps_tot': float(expressed_population_signal(rbar_tot, _mean_depth(values))),
+        'eps_cutoff_year': eps_cutoff_year(years, values, threshold, **running_kwargs),
+    }
+
+
+def apply_year_cutoff(frame, cutoff_year):
+    """
+    去掉截断年份之前的年份 (返回新的 DataFrame，行数不变)
+
+    Year 列之外，样本量列 (samp.depth*) 记为0，n_draws 不变，其余列为NaN。
+    """
+    if cutoff_year is None or 'Year' not in frame.columns:
+        return frame
+    frame = frame.copy()
+    before = frame['Year'].to_numpy() < cutoff_year
+    for column in frame.columns:
+        if column in ('Year', 'n_draws'):
+            continue
+        if str(column).startswith('samp.depth'):
+            frame.loc[before, column] = 0
+        else:
+            frame.loc[before, column] = np.nan
+    return frame
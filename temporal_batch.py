@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+多站点年表的并行批处理
+
+plot_all_temporal.plot_all 逐个文件串行地去趋势、计算年表，并把结果写到当前目录。
+本模块把一组 RWL 文件 (或整个区域目录，如 metadata/data/europe) 分配给进程池:
+
+- 每个工作进程只导入一次 plot_all_temporal (安装了 rpy2 时加载一次 R 和 dplR)，
+  之后处理多个文件；R 嵌入进程不能安全地 fork，统一使用 spawn；
+- 结果写到指定的输出目录 (<站点>_tr.csv 和 <站点>_tr_mean.csv，与 plot_all 相同)；
+- 每个文件的错误单独记录，不影响其他文件；工作进程崩溃 (进程池损坏) 时重建进程池，
+  未完成的文件重试一次；
+- 每完成一个文件报告一次进度，最后在输出目录写出 temporal_batch_summary.csv，
+  其中包括每个站点的 rbar、序列间相关和 EPS (见 site_statistics)。
+
+使用方法:
+    python temporal_batch.py metadata/data/europe --output-dir output/europe --workers 16
+"""
+
+import os
+import sys
+import glob
+import time
+import argparse
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+
+from site_statistics import site_quality
+
+SUMMARY_FILE = 'temporal_batch_summary.csv'
+RWL_PATTERNS = ('*.rwl', '*.RWL')
+
+
+def collect_rwl_files(inputs):
+    """
+    展开输入为 RWL 文件列表
+
+    参数:
+    inputs: 文件或目录路径 (或它们的列表)；目录中按文件名排序取所有 .rwl 文件
+
+    返回:
+    去重后的文件路径列表
+    """
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    files = []
+    for path in inputs:
+        if os.path.isdir(path):
+            matched = set()
+            for pattern in RWL_PATTERNS:
+                matched.update(glob.glob(os.path.join(path, pattern)))
+            files.extend(sorted(matched))
+        else:
+            files.append(path)
+    return list(dict.fromkeys(files))
+
+
+def _init_worker(detrend_backend, chronology_backend, rwl_reader):
+    """工作进程初始化: 使用与主进程相同的后端设置"""
+    from detrend import set_detrend_backend
+    from chronology import set_chronology_backend
+    from tucson import set_rwl_reader
+
+    set_detrend_backend(detrend_backend)
+    set_chronology_backend(chronology_backend)
+    set_rwl_reader(rwl_reader)
+
+
+def _process_file(tree_file, output_dir):
+    """在工作进程中处理一个文件，返回该文件的摘要 (错误也作为结果返回)"""
+    started = time.time()
+    summary = {'file': tree_file, 'site': os.path.splitext(os.path.basename(tree_file))[0]}
+    try:
+        # 第一次导入时加载 R 和 dplR，之后同一工作进程中的文件直接使用
+        from plot_all_temporal import write_temporal_chronology
+        pdf_input, pdf_mean = write_temporal_chronology(tree_file, output_dir)
+        summary.update(status='ok', n_series=pdf_input.shape[1],
+                       first_year=int(pdf_mean['Year'].iloc[0]), last_year=int(pdf_mean['Year'].iloc[-1]),
+                       error='')
+        # 站点质量统计 (rbar、EPS，见 site_statistics)，用于筛选站点
+        summary.update(site_quality(list(pdf_input.index), pdf_input.to_numpy(dtype=float)))
+    except Exception as e:
+        summary.update(status='failed', error=f"{type(e).__name__}: {e}",
+                       traceback=traceback.format_exc())
+    summary['seconds'] = round(time.time() - started, 3)
+    return summary
+
+
+def _print_progress(done, total, summary):
+    status = '完成' if summary['status'] == 'ok' else f"失败: {summary['error']}"
+    print(f"[{done}/{total}] {summary['site']} {status} ({summary.get('seconds', 0):.1f}s)", flush=True)
+
+
+def plot_all_batch(inputs, output_dir, workers=None, progress=_print_progress, logger=None, retries=1):
+    """
+    用进程池为多个 RWL 文件计算年表
+
+    参数:
+    inputs: RWL 文件或目录 (或它们的列表)，见 collect_rwl_files
+    output_dir: 输出目录
+    workers: 工作进程数，默认为CPU核心数
+    progress: 每完成一个文件调用一次 progress(已完成数, 总数, 摘要)；None时不报告
+    logger: 日志记录器，记录失败文件的详细错误
+    retries: 工作进程崩溃时未完成文件的重试次数
+
+    返回:
+    DataFrame: 每个文件一行 (file, site, status, n_series, first_year, last_year,
+    rbar_tot, interseries_cor, eps_tot, eps_cutoff_year, error, seconds)，
+    同时写入 output_dir/temporal_batch_summary.csv
+    """
+    from detrend import get_detrend_backend
+    from chronology import get_chronology_backend
+    from tucson import get_rwl_reader
+
+    files = collect_rwl_files(inputs)
+    os.makedirs(output_dir, exist_ok=True)
+    total = len(files)
+    n_workers = max(1, min(workers or os.cpu_count() or 1, total or 1))
+    context = multiprocessing.get_context('spawn')
+    backends = (get_detrend_backend(), get_chronology_backend(), get_rwl_reader())
+
+    results = {}
+    attempts = dict.fromkeys(files, 0)
+    pending = list(files)
+    started = time.time()
+
+    def record(summary):
+        results[summary['file']] = summary
+        if summary['status'] != 'ok' and logger:
+            logger.error(f"处理 {summary['file']} 失败: {summary['error']}\n{summary.get('traceback', '')}")
+        if progress:
+            progress(len(results), total, summary)
+
+    while pending:
+        broken = []
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=context,
+                                 initializer=_init_worker, initargs=backends) as executor:
+            futures = {executor.submit(_process_file, tree_file, output_dir): tree_file for tree_file in pending}
+            for future in as_completed(futures):
+                tree_file = futures[future]
+                try:
+                    record(future.result())
+                except BrokenProcessPool:
+                    broken.append(tree_file)
+                except Exception as e:
+                    record({'file': tree_file, 'site': os.path.splitext(os.path.basename(tree_file))[0],
+                            'status': 'failed', 'error': f"{type(e).__name__}: {e}"})
+
+        # 进程池损坏时无法确定是哪个文件导致的，未完成的文件在新进程池中重试
+        pending = []
+        for tree_file in broken:
+            attempts[tree_file] += 1
+            if attempts[tree_file] > retries:
+                record({'file': tree_file, 'site': os.path.splitext(os.path.basename(tree_file))[0],
+                        'status': 'failed', 'error': '工作进程异常退出'})
+            else:
+                pending.append(tree_file)
+        if pending and logger:
+            logger.warning(f"工作进程异常退出，重试 {len(pending)} 个未完成的文件")
+
+    columns = ['file', 'site', 'status', 'n_series', 'first_year', 'last_year',
+               'rbar_tot', 'interseries_cor', 'eps_tot', 'eps_cutoff_year', 'error', 'seconds']
+    summary = pd.DataFrame([results[f] for f in files if f in results], columns=columns)
+    summary.to_csv(os.path.join(output_dir, SUMMARY_FILE), index=False)
+
+    n_failed = int((summary['status'] != 'ok').sum())
+    print(f"批处理完成: {total - n_failed}/{total} 个文件成功，{n_failed} 个失败，"
+          f"用时 {time.time() - started:.1f}s，输出目录 {output_dir}")
+    return summary
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description='Build spline-detrended chronologies for many RWL files in parallel.')
+    parser.add_argument('inputs', nargs='+', help='RWL files or directories (e.g. metadata/data/europe)')
+    parser.add_argument('--output-dir', dest='output_dir', required=True, help='Directory for the output CSV files')
+    parser.add_argument('--workers', dest='workers', type=int, default=None,
+                        help='Number of worker processes (default: CPU count)')
+    parser.add_argument('--detrend', dest='detrend', choices=('native', 'r'), default=None,
+                        help='Detrending backend (default: TR_SNP_DETREND or native)')
+    args = parser.parse_args()
+
+    if args.detrend:
+        from detrend import set_detrend_backend
+        set_detrend_backend(args.detrend)
+    summary = plot_all_batch(args.inputs, args.output_dir, workers=args.workers)
+    return 0 if (summary['status'] == 'ok').all() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
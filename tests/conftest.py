@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""测试公共设置: 把仓库根目录加入 sys.path，测试直接导入顶层模块"""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, 'tests', 'fixtures')
+
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def r_fixture(path):
+    """
+    需要在装有 R 的机器上生成的参考数据 (见 tests/fixtures/make_*)
+
+    测试总是运行；文件还没有提交时按预期失败 (FileNotFoundError，报告为 xfail)，
+    文件提交后必须通过 (strict)。
+    """
+    return pytest.mark.xfail(not os.path.exists(path), raises=FileNotFoundError, strict=True,
+                             reason=f"缺少 R 生成的参考数据 {os.path.relpath(path, ROOT)}")
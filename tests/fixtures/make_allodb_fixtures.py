@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+生成 tests/fixtures/allodb_tables_v1.npz: allodb 数据表，气候区网格只保留
+allodb_r_reference.csv 中各站点坐标所在的网格 (需要 R、allodb、kgc 和 rpy2)
+
+在仓库根目录运行: python tests/fixtures/make_allodb_fixtures.py
+"""
+
+import os
+import sys
+
+import pandas as pd
+
+FIXTURES = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(os.path.dirname(FIXTURES)))
+
+from allodb_native import TABLES_FORMAT_VERSION, export_allodb_tables
+
+reference = pd.read_csv(os.path.join(FIXTURES, 'allodb_r_reference.csv'))
+coords = sorted(set(zip(reference['lon'], reference['lat'])))
+export_allodb_tables(os.path.join(FIXTURES, f'allodb_tables_v{TABLES_FORMAT_VERSION}.npz'), coords)
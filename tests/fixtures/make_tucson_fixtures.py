@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+生成 tests/test_tucson.py 中与 dplR::read.tucson 比较用的参考结果 (在仓库根目录运行:
+python tests/fixtures/make_tucson_fixtures.py)
+
+参考值来自仓库中旧流程保存的输出。旧流程用 r['read.tucson'](文件) 读取宽度 (mm)，
+第一个随机值的 delta_dia 列就是 read.tucson 的宽度乘以固定系数，宽度为0时流程先
+替换为1e-8:
+- test_output/or092_delta_dia_R.csv: R 写出的 delta_dia = 2 × 宽度 (or092.rwl，结束标记999)；
+- test_output/test_file_select/bol001_usa_QUAL_delta_dia.csv: delta_dia = 0.2 × 宽度
+  (bol001.rwl，结束标记-9999，inp130b 1906 年的原始值为 -646)。
+
+宽度按文件精度 (0.01mm 或 0.001mm) 取整后写出，1e-8 还原为0。
+"""
+
+import os
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+FIXTURES = os.path.join(ROOT, 'tests', 'fixtures')
+
+# (输出文件, 旧流程的 delta_dia 输出, delta_dia / 宽度, 宽度的小数位数)
+SOURCES = (
+    ('or092_read_tucson.csv', 'test_output/or092_delta_dia_R.csv', 2.0, 2),
+    ('bol001_read_tucson.csv', 'test_output/test_file_select/bol001_usa_QUAL_delta_dia.csv', 0.2, 3),
+)
+
+
+def read_tucson_widths(delta_dia_file, scale, decimals):
+    """从旧流程的 delta_dia 输出还原 read.tucson 的宽度 (以年份为索引，每条序列一列)"""
+    frame = pd.read_csv(os.path.join(ROOT, delta_dia_file), index_col=0)
+    # 多个随机值时列名为 delta_dia_<随机值>_<序列>，只取第一个随机值
+    if frame.columns[0].startswith('delta_dia_'):
+        prefix = frame.columns[0].rsplit('_', 1)[0] + '_'
+        frame = frame[[col for col in frame.columns if col.startswith(prefix)]]
+        frame.columns = [col[len(prefix):] for col in frame.columns]
+    frame.index = frame.index.astype(int)
+    frame.index.name = 'Year'
+    return (frame / scale).round(decimals) + 0.0
+
+
+def main():
+    for output, source, scale, decimals in SOURCES:
+        widths = read_tucson_widths(source, scale, decimals)
+        widths.to_csv(os.path.join(FIXTURES, output), float_format=f'%.{decimals}f')
+        print(f"{output}: {widths.shape[0]} 年, {widths.shape[1]} 条序列")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+allodb_native 的测试
+
+fixtures/allodb_r_reference.csv 取自 test_output 中 R 版 get_biomass 的输出，每个站点 12 个 DBH:
+or092 的 Juniperus occidentalis 和 bol001 的 Quercus alba (test_file_select，坐标见日志)，
+or098 的 Tsuga mertensiana (test_search_create，坐标取自 metadata/northamerica_detailed_metadata.csv)。
+与 R 输出的比较使用 fixtures/allodb_tables_v1.npz (make_allodb_fixtures.py 导出的小数据表)。
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import allodb_native
+import improved_allodb
+from conftest import FIXTURES, r_fixture
+
+FIXTURE_TABLES = os.path.join(FIXTURES, f'allodb_tables_v{allodb_native.TABLES_FORMAT_VERSION}.npz')
+
+
+def _write_tables(path):
+    """写出一个最小的数据表: 一个可求值的方程和一个需要树高的方程，同一气候区"""
+    equations = [
+        {'equation_id': 'e1', 'equation_taxa': 'Quercus alba', 'equation_allometry': '0.1*dbh^2.4',
+         'dependent_variable': 'Total aboveground biomass', 'koppen': 'Cfa'},
+        {'equation_id': 'e2', 'equation_taxa': 'Quercus', 'equation_allometry': '0.05*(dbh^2*h)',
+         'dependent_variable': 'Total aboveground biomass', 'koppen': 'Cfa'},
+    ]
+    np.savez_compressed(
+        path,
+        format_version=np.array(allodb_native.TABLES_FORMAT_VERSION),
+        allodb_version=np.array('test'),
+        equations=np.array(json.dumps(equations)),
+        dbh_min_cm=np.array([1.0, 1.0]),
+        dbh_max_cm=np.array([100.0, 100.0]),
+        sample_size=np.array([1000.0, 1000.0]),
+        dbh_unit_cf=np.array([1.0, 1.0]),
+        output_units_cf=np.array([1.0, 1.0]),
+        genus=np.array(['Quercus']),
+        family=np.array(['Fagaceae']),
+        koppen_zone1=np.array(['Cfa']),
+        koppen_zone2=np.array(['Cfa']),
+        koppen_we=np.array([1.0]),
+        zone_lon=np.array([-76.75]),
+        zone_lat=np.array([39.25]),
+        zone_cls=np.array(['Cfa']),
+    )
+    return path
+
+
+@r_fixture(FIXTURE_TABLES)
+def test_matches_saved_r_output():
+    tables = allodb_native.AllodbTables(FIXTURE_TABLES)
+    reference = pd.read_csv(os.path.join(FIXTURES, 'allodb_r_reference.csv'))
+    assert reference['taxa'].nunique() >= 3
+    for (taxa, lon, lat), group in reference.groupby(['taxa', 'lon', 'lat']):
+        genus, species = allodb_native._split_taxa(taxa)
+        assert tables.koppen_zone((lon, lat)) is not None, taxa
+        assert tables.height_weight_share(genus, species, (lon, lat)) <= allodb_native.HEIGHT_WEIGHT_LIMIT, taxa
+        native = tables.get_biomass(group['dbh'].to_numpy(), genus, species, (lon, lat))
+        assert allodb_native.relative_error(native, group['agb']) <= allodb_native.NATIVE_TOLERANCE, taxa
+
+
+def test_height_equations_are_weighted_but_not_fitted(tmp_path):
+    tables = allodb_native.AllodbTables(_write_tables(str(tmp_path / 'tables.npz')))
+    assert [eq['code'] is None for eq in tables.equations] == [False, True]
+
+    # 两个方程样本量和气候权重相同，分类学权重为 1.0 (同种) 和 0.8 (同属)
+    share = tables.height_weight_share('Quercus', 'alba', (-76.8, 39.2))
+    assert share == pytest.approx(0.8 / 1.8)
+
+    # 拟合只使用不需要树高的方程，结果就是该方程本身
+    params = tables.est_params('Quercus', 'alba', (-76.8, 39.2))
+    assert params.b == pytest.approx(2.4)
+    assert params.a == pytest.approx(0.1)
+    assert params.sigma == pytest.approx(0.0, abs=1e-9)
+
+
+def test_height_dominated_taxa_warn_without_r(tmp_path, monkeypatch):
+    monkeypatch.setattr(allodb_native, '_TABLES',
+                        allodb_native.AllodbTables(_write_tables(str(tmp_path / 'tables.npz'))))
+    monkeypatch.setattr(allodb_native, '_HEIGHT_WARNED', set())
+    monkeypatch.setattr(improved_allodb, 'get_allodb_engine', lambda: None)
+
+    with pytest.warns(UserWarning, match='树高'):
+        assert not allodb_native.requires_r('Quercus alba', (-76.8, 39.2))
+    # 同一树种只警告一次，结果仍由原生后端给出
+    agb = allodb_native.get_biomass(np.array([10.0]), 'Quercus alba', (-76.8, 39.2))
+    assert agb[0] == pytest.approx(0.1 * 10 ** 2.4)
+
+
+def test_height_dominated_taxa_use_r_engine(tmp_path, monkeypatch):
+    class Engine:
+        def get_biomass(self, dbh, taxa, coords):
+            return np.full(np.shape(dbh), -1.0)
+
+    monkeypatch.setattr(allodb_native, '_TABLES',
+                        allodb_native.AllodbTables(_write_tables(str(tmp_path / 'tables.npz'))))
+    monkeypatch.setattr(improved_allodb, 'get_allodb_engine', lambda: Engine())
+    assert allodb_native.get_biomass(np.array([10.0, 20.0]), 'Quercus alba', (-76.8, 39.2)).tolist() == [-1.0, -1.0]
+
+
+def test_missing_native_tables_reported_once(monkeypatch, capsys):
+    calls = []
+
+    def missing_tables():
+        calls.append(1)
+        raise FileNotFoundError('no tables')
+
+    monkeypatch.setattr(allodb_native, 'get_allodb_tables', missing_tables)
+    monkeypatch.setattr(improved_allodb, '_NATIVE_BACKEND_ERROR', None)
+    monkeypatch.setattr(improved_allodb, 'get_allodb_engine', lambda: None)
+    for _ in range(3):
+        assert improved_allodb.get_biomass_function('native') is None
+    assert len(calls) == 1
+    assert capsys.readouterr().out.count('原生allodb后端不可用') == 1
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""bark_dict_species 树皮方程的测试"""
+
+import math
+
+import numpy as np
+import pytest
+
+import bark_dict_species as bark
+from species_mapper import SPECIES_CODE_MAP
+
+# formula.csv 中的文献方程，逐字翻译为 math 表达式
+PUBLISHED = {
+    'BEPE': lambda dbh: (dbh * (1 - math.sqrt(1 - 25.502 * dbh ** (-0.289) / 100))) / 2,
+    'FASY': lambda dbh: (0.01149 * dbh ** 0.8516) / 100,
+    'PCAB': lambda dbh: (0.02408 * dbh ** 0.8723) / 100,
+    'PIPN': lambda dbh: 0.103 * dbh ** 1.023,
+    'PISY': lambda dbh: (dbh * (1 - math.sqrt(1 - 75.492 * dbh ** (-0.654) / 100))) / 2,
+    'PONI': lambda dbh: 0.081 * dbh,
+    'QUPE': lambda dbh: (0.02748 * dbh ** 0.6759) / 100,
+}
+
+
+def test_registry_is_loaded_from_formula_csv():
+    assert {code for code, _, _ in bark.BARK_EQUATIONS} == set(PUBLISHED)
+    for code, latin, formula in bark.BARK_EQUATIONS:
+        assert SPECIES_CODE_MAP[code] == latin
+        assert formula.startswith('BT =')
+
+
+@pytest.mark.parametrize('species', sorted(PUBLISHED))
+def test_scalar_and_array_paths_match_published_formula(species):
+    dbh = np.array([5.0, 12.5, 30.0, 80.0])
+    expected = np.array([PUBLISHED[species](d) for d in dbh])
+
+    np.testing.assert_allclose(bark.bark_thickness_array(species, dbh), expected, rtol=1e-12)
+    for d, e in zip(dbh, expected):
+        value = bark.bark_dict_species('europe', species, d)
+        assert isinstance(value, float)
+        assert value == pytest.approx(e, rel=1e-12)
+
+
+def test_unknown_species_uses_default_ratio():
+    assert bark.bark_dict_species('europe', 'XXXX', 20.0) == pytest.approx(20.0 * bark.DEFAULT_BARK_RATIO)
+
+
+def test_nan_is_kept_and_domain_error_is_raised():
+    result = bark.bark_thickness_array('PISY', np.array([[np.nan, 30.0]]))
+    assert result.shape == (1, 2)
+    assert np.isnan(result[0, 0]) and np.isfinite(result[0, 1])
+
+    # Liepiņš 方程在很小的直径上根号内为负
+    with pytest.raises(ValueError):
+        bark.bark_dict_species('europe', 'PISY', 0.1)
+
+
+def test_formula_with_unknown_name_is_rejected():
+    with pytest.raises(ValueError):
+        bark._compile_formula('BT = 0.1 * height')
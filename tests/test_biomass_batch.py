@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""biomass_batch 和 biomass_planner 的测试"""
+
+import threading
+
+import numpy as np
+
+from biomass_batch import SiteBiomassBatch
+from biomass_planner import BiomassPlanner
+
+
+def test_site_batch_makes_one_call():
+    calls = []
+
+    def biomass(dbh):
+        calls.append(dbh.copy())
+        return dbh * 10
+
+    batch = SiteBiomassBatch()
+    first = batch.add([3.0, np.nan, 1.0])
+    second = batch.add(np.arange(1.0, 2000.0))
+    batch.evaluate(biomass)
+
+    assert len(calls) == 1
+    assert np.all(np.diff(calls[0]) > 0)
+    assert batch.n_unique == len(calls[0]) == 1999
+    np.testing.assert_array_equal(batch.result(first), [30.0, np.nan, 10.0])
+    np.testing.assert_array_equal(batch.result(second), np.arange(1.0, 2000.0) * 10)
+
+
+def test_planner_groups_are_evaluated_once_each_in_parallel():
+    calls = []
+    lock = threading.Lock()
+
+    def biomass(code, lat, lon, dbh):
+        with lock:
+            calls.append((code, lat, lon, len(dbh)))
+        return dbh * (2 if code == 'QUAL' else 3)
+
+    planner = BiomassPlanner({'QUAL': 'Quercus alba', 'JUOC': 'Juniperus occidentalis'})
+    planner.add_site('QUAL', 35.59, -94.0, np.linspace(1, 50, 500))
+    planner.add_site('QUAL', 35.6, -93.9, np.linspace(1, 50, 500))
+    planner.add_site('JUOC', 43.1667, -120.8833, [1.0, 2.0, np.nan])
+    planner.evaluate(biomass, workers=4)
+
+    # 两个 QUAL 站点在同一个 0.5° 网格中，合并为一组；每组只调用一次
+    assert sorted(call[0] for call in calls) == ['JUOC', 'QUAL']
+    assert dict((call[0], call[3]) for call in calls)['QUAL'] == 500
+    np.testing.assert_array_equal(planner.lookup('QUAL', 35.6, -93.9, [1.0]), [2.0])
+    np.testing.assert_array_equal(planner.lookup('JUOC', 43.1667, -120.8833, [np.nan, 2.0]), [np.nan, 6.0])
+    assert planner.lookup('QUAL', 35.6, -93.9, [1.5]) is None
+
+
+def test_planner_keeps_each_sites_species_code():
+    # 两个树种代码对应同一个拉丁名: 分组相同，但各自的回退方程按自己的树种代码选择
+    planner = BiomassPlanner({'QUAL': 'Quercus alba', 'QUAL2': 'Quercus alba'})
+    planner.add_site('QUAL', 35.59, -94.0, [1.0, 2.0])
+    planner.add_site('QUAL2', 35.59, -94.0, [2.0, 3.0])
+    planner.evaluate(lambda code, lat, lon, dbh: dbh * (2 if code == 'QUAL' else 5))
+
+    np.testing.assert_array_equal(planner.lookup('QUAL', 35.59, -94.0, [2.0, 1.0]), [4.0, 2.0])
+    np.testing.assert_array_equal(planner.lookup('QUAL2', 35.59, -94.0, [2.0, 3.0]), [10.0, 15.0])
+    assert planner.lookup('QUAL2', 35.59, -94.0, [1.0]) is None
+
+
+def test_planner_merges_streamed_chunks():
+    planner = BiomassPlanner()
+    calls = []
+    for chunk in ([1.0, 2.0], [2.0, 3.0, np.nan], [3.0]):
+        planner.add_site('PIPO', 40.0, -105.0, chunk)
+    planner.evaluate(lambda code, lat, lon, dbh: calls.append(dbh.tolist()) or dbh)
+    assert calls == [[1.0, 2.0, 3.0]]
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""biomass_lut 查找表的测试"""
+
+import numpy as np
+import pytest
+
+from biomass_lut import BiomassLookupTable, MAX_GRID_POINTS
+
+
+def test_power_law_is_interpolated_exactly():
+    calls = []
+
+    def exact(dbh):
+        calls.append(len(dbh))
+        return 0.1 * dbh ** 2.4
+
+    table = BiomassLookupTable(exact)
+    assert table.usable
+    assert table.max_relative_error <= table.tolerance
+    n_build = len(calls)
+
+    dbh = np.array([1.0, 12.5, 80.0])
+    np.testing.assert_allclose(table(dbh), 0.1 * dbh ** 2.4, rtol=1e-9)
+    # 网格内的值不再调用精确函数
+    assert len(calls) == n_build
+
+
+def test_unvalidated_table_falls_back_to_exact():
+    def exact(dbh):
+        # 高频振荡，加密到上限也达不到容差
+        return 0.1 * dbh ** 2.4 * (1 + 0.2 * np.sin(2000 * np.log(dbh)))
+
+    table = BiomassLookupTable(exact, tolerance=1e-6)
+    assert not table.usable
+    assert table.max_relative_error > 1e-6
+
+    dbh = np.array([3.3, 47.0])
+    np.testing.assert_array_equal(table(dbh), exact(dbh))
+
+
+def test_grid_doubles_until_limit():
+    sizes = []
+
+    def exact(dbh):
+        sizes.append(len(dbh))
+        return 0.1 * dbh ** 2.4 * (1 + 0.2 * np.sin(2000 * np.log(dbh)))
+
+    BiomassLookupTable(exact, tolerance=1e-6)
+    # 每次建表计算 n 个网格点和 n-1 个中点
+    assert (sizes[-1] + 1) // 2 == MAX_GRID_POINTS
+    assert pytest.approx(sizes[1] / sizes[0], rel=0.01) == 2
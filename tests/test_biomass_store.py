@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""biomass_store 拟合参数缓存的测试"""
+
+import sqlite3
+import time
+
+import numpy as np
+import pytest
+
+from allodb_native import AllodbParams
+from biomass_store import BiomassStore
+
+COORDS = (-120.8833, 43.1667)
+PARAMS = AllodbParams(a=0.07, b=2.4, sigma=0.3)
+
+
+class CountingFit:
+    def __init__(self, result=PARAMS):
+        self.result = result
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.result
+
+
+def _no_compute(dbh):
+    raise AssertionError('拟合成功时不应调用 compute')
+
+
+def test_all_dbh_use_one_fit(tmp_path):
+    store = BiomassStore(str(tmp_path / 'store.sqlite'))
+    fit = CountingFit()
+    dbh = np.array([1.0, 10.0, 55.5])
+    first = store.get_biomass(dbh, 'r', 'Juniperus occidentalis', COORDS, fit, _no_compute)
+    second = store.get_biomass(dbh[::-1], 'r', 'Juniperus occidentalis', COORDS, fit, _no_compute)
+
+    expected = PARAMS.a * dbh ** PARAMS.b * np.exp(PARAMS.sigma ** 2 / 2)
+    np.testing.assert_allclose(first, expected)
+    np.testing.assert_allclose(second, expected[::-1])
+    assert fit.calls == 1
+    assert store.stats()['entries'] == 1
+
+
+def test_params_persist_across_instances(tmp_path):
+    path = str(tmp_path / 'store.sqlite')
+    BiomassStore(path).get_params('r', 'Quercus alba', COORDS, CountingFit())
+
+    fit = CountingFit(AllodbParams(a=9.0, b=1.0, sigma=0.0))
+    reopened = BiomassStore(path)
+    assert reopened.get_params('r', 'Quercus alba', COORDS, fit) == PARAMS
+    assert fit.calls == 0
+    assert reopened.stats()['entries'] == 1
+
+
+def test_failed_fit_is_not_cached(tmp_path):
+    store = BiomassStore(str(tmp_path / 'store.sqlite'))
+    fit = CountingFit(None)
+    fallback = store.get_biomass(np.array([10.0]), 'r', 'Nogenus', COORDS, fit, lambda d: d * 2)
+    assert fallback.tolist() == [20.0]
+    store.get_biomass(np.array([10.0]), 'r', 'Nogenus', COORDS, fit, lambda d: d * 2)
+    assert fit.calls == 2
+
+    nan_fit = CountingFit(AllodbParams(a=np.nan, b=2.0, sigma=0.1))
+    assert store.get_params('r', 'Nogenus', COORDS, nan_fit) is None
+    assert store.stats()['entries'] == 0
+
+
+def test_backend_is_part_of_the_key(tmp_path):
+    store = BiomassStore(str(tmp_path / 'store.sqlite'))
+    native = AllodbParams(a=0.08, b=2.3, sigma=0.2)
+    store.get_params('r', 'Quercus alba', COORDS, CountingFit())
+    assert store.get_params('native', 'Quercus alba', COORDS, CountingFit(native)) == native
+    assert store.get_params('r', 'Quercus alba', COORDS, CountingFit(native)) == PARAMS
+
+
+def test_first_writer_wins(tmp_path):
+    path = str(tmp_path / 'store.sqlite')
+    first = BiomassStore(path)
+    second = BiomassStore(path)
+    # 第二个进程在第一个写入之后才拟合完成: 以已经写入的参数为准
+    first.get_params('r', 'Quercus alba', COORDS, CountingFit())
+    other = AllodbParams(a=1.0, b=2.0, sigma=0.0)
+    assert second.get_params('r', 'Quercus alba', COORDS, lambda: other) == PARAMS
+
+
+def test_lru_eviction_uses_batched_touches(tmp_path):
+    path = str(tmp_path / 'store.sqlite')
+    store = BiomassStore(path, max_entries=2)
+    store.get_params('r', 'A', COORDS, CountingFit())
+    time.sleep(0.01)
+    store.get_params('r', 'B', COORDS, CountingFit())
+    time.sleep(0.01)
+    # 重新打开后读取 A，使其比 B 更近使用 (最近使用时间只在内存中累积)
+    reopened = BiomassStore(path, max_entries=2)
+    reopened.get_params('r', 'A', COORDS, CountingFit())
+    with sqlite3.connect(path) as conn:
+        stored = dict(conn.execute('SELECT taxa, last_used FROM allometry').fetchall())
+    assert stored['A'] < stored['B']
+
+    time.sleep(0.01)
+    reopened.get_params('r', 'C', COORDS, CountingFit())
+    assert reopened.stats()['entries'] == 2
+    with sqlite3.connect(path) as conn:
+        remaining = {row[0] for row in conn.execute('SELECT taxa FROM allometry')}
+    assert remaining == {'A', 'C'}
+
+
+def test_non_finite_dbh_go_to_compute(tmp_path):
+    store = BiomassStore(str(tmp_path / 'store.sqlite'))
+    result = store.get_biomass(np.array([np.nan, 10.0]), 'r', 'Quercus alba', COORDS,
+                               CountingFit(), lambda d: np.full(d.shape, -1.0))
+    assert result[0] == -1.0
+    assert result[1] == pytest.approx(PARAMS.a * 10 ** PARAMS.b * np.exp(PARAMS.sigma ** 2 / 2))
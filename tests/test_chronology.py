@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""chronology 的测试: biweight 年表与 dplR::chron 一致"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from chronology import compare_with_dplr, site_chronology, tukey_biweight_mean
+from conftest import FIXTURES, ROOT, r_fixture
+from tucson import read_tucson_frame
+
+# dplR::chron(read.tucson("ATFS13.rwl")) 的输出，由 tests/fixtures/make_dplr_fixtures.R 生成
+DPLR_CHRON = os.path.join(FIXTURES, 'ATFS13_chron_dplR.csv')
+
+
+def reference_tbrm(x, C=9):
+    """逐值循环移植 dplR 的 tbrm (C 代码): 只用有值的样本"""
+    x = np.sort(x[~np.isnan(x)])
+    if len(x) == 0:
+        return np.nan
+    median = np.median(x)
+    mad = np.median(np.abs(x - median))
+    div = C * mad + 1e-6
+    total = weight_sum = 0.0
+    for value in x:
+        u = (value - median) / div
+        if -1 <= u <= 1:
+            w = (1 - u * u) ** 2
+            total += w * value
+            weight_sum += w
+    return total / weight_sum
+
+
+@pytest.fixture(scope='module')
+def rwl():
+    return read_tucson_frame(os.path.join(ROOT, 'ATFS13.rwl'))
+
+
+def test_biweight_matches_reference_tbrm(rwl):
+    values = rwl.to_numpy()
+    std, depth = site_chronology(values)
+    expected = np.array([reference_tbrm(row) for row in values])
+    np.testing.assert_allclose(std, expected, rtol=1e-12)
+    np.testing.assert_array_equal(depth, (~np.isnan(values)).sum(axis=1))
+
+
+def test_draw_axis_matches_per_draw_chronologies(rwl):
+    values = rwl.to_numpy()
+    draws = np.stack([values, values * 2.0, values + 0.3])
+    std, depth = site_chronology(draws)
+    for k in range(len(draws)):
+        np.testing.assert_allclose(std[k], tukey_biweight_mean(draws[k]), rtol=1e-12)
+    assert depth.shape == (3, len(values))
+
+
+def test_outlier_is_downweighted():
+    values = np.array([[1.0, 1.1, 0.9, 1.05, 40.0]])
+    std, _ = site_chronology(values)
+    assert std[0] == pytest.approx(reference_tbrm(values[0]))
+    assert std[0] < 1.1
+
+
+@r_fixture(DPLR_CHRON)
+def test_compare_with_dplr_fixture(rwl):
+    reference = pd.read_csv(DPLR_CHRON)
+    np.testing.assert_array_equal(reference['Year'], rwl.index)
+    error, depth_match = compare_with_dplr(rwl, reference)
+    assert depth_match
+    assert error < 1e-10
+
+
+def test_compare_with_dplr_reports_differences(rwl):
+    values = rwl.to_numpy()
+    reference = pd.DataFrame({'std': [reference_tbrm(row) for row in values],
+                              'samp.depth': (~np.isnan(values)).sum(axis=1).astype(float)})
+    error, depth_match = compare_with_dplr(rwl, reference)
+    assert depth_match and error < 1e-12
+
+    reference.loc[10, 'std'] += 0.5
+    reference.loc[11, 'samp.depth'] += 1
+    error, depth_match = compare_with_dplr(rwl, reference)
+    assert not depth_match and error == pytest.approx(0.5)
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""correction_sweep 长表的测试: 每个参数点的均值与单独计算的 biweight 年表一致"""
+
+import numpy as np
+
+from chronology import site_chronology
+from correction_sweep import correction_grid, sweep_frame
+from diameter_engine import attach_biomass, biomass_requests, compute_site_diameters, compute_sweep_diameters
+
+
+def test_grid_drops_unused_rates():
+    points = correction_grid((-1, 1), (0.9, 1.1), (0, -1), (0.05,))
+    assert len(points) == 6
+    assert all(np.isnan(p[1]) for p in points if p[0] != 1)
+
+
+def test_sweep_frame_uses_biweight_per_point():
+    rng = np.random.default_rng(5)
+    widths = rng.lognormal(0.0, 0.4, size=(30, 8))
+    widths[:, 0] *= 20  # 离群样本
+    widths[:4, 5:] = np.nan
+    years = np.arange(1950, 1980)
+    points = correction_grid((-1, 0, 1), (1.05,), (-1, 0, 1), (0.05,))
+
+    result = compute_sweep_diameters(widths, points, 0.0, 'FASY', 'default')
+    raw, corrected = biomass_requests(result)
+    attach_biomass(result, 0.1 * raw ** 2.4, 0.1 * corrected ** 2.4)
+    frame = sweep_frame(years, result)
+    assert len(frame) == len(points) * len(years)
+
+    for k, point in enumerate(points):
+        single = compute_site_diameters(widths, 0.0, dbh_method=point[0], bark_method=point[2],
+                                        geometric_rates=np.nan_to_num(point[1], nan=1.0),
+                                        bark_rates=np.nan_to_num(point[3], nan=0.05),
+                                        species_code='FASY', region='default')
+        rows = frame.iloc[k * len(years):(k + 1) * len(years)]
+        expected, depth = site_chronology(single['diameterr_geo_bark'])
+        np.testing.assert_allclose(rows['mean_diaa'], expected, rtol=1e-12)
+        np.testing.assert_array_equal(rows['samp.depth'], depth)
+        expected_bio, _ = site_chronology(0.1 * single['diameterr_geo_bark'] ** 2.4)
+        np.testing.assert_allclose(rows['mean_bioo'], expected_bio, rtol=1e-10)
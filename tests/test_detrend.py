@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""detrend 的测试: 样条去趋势与 dplR::ffcsaps 一致"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import FIXTURES, ROOT, r_fixture
+from detrend import SPLINE_LENGTH_FRACTION, ZERO_WIDTH, detrend_spline, spline_parameter
+from tucson import read_tucson_frame
+
+# read.tucson("ATFS13.rwl") 用 dplR::ffcsaps 去趋势的输出，由 tests/fixtures/make_dplr_fixtures.R 生成
+DPLR_SPLINE = os.path.join(FIXTURES, 'ATFS13_spline_dplR.csv')
+
+
+def reference_curve(y, f=0.5, nyrs=None):
+    """按 dplR::ffcsaps 的公式用稠密矩阵求解一条序列的平滑样条"""
+    n = len(y)
+    if nyrs is None:
+        nyrs = np.floor(SPLINE_LENGTH_FRACTION * n)
+    p = spline_parameter(nyrs, f)
+    Q = np.zeros((n, n - 2))
+    for k in range(n - 2):
+        Q[k:k + 3, k] = (1.0, -2.0, 1.0)
+    R = 4 * np.eye(n - 2) + np.eye(n - 2, k=1) + np.eye(n - 2, k=-1)
+    u = np.linalg.solve(6 * (1 - p) * Q.T @ Q + p * R, Q.T @ y)
+    return y - 6 * (1 - p) * Q @ u
+
+
+@pytest.fixture(scope='module')
+def rwl():
+    return read_tucson_frame(os.path.join(ROOT, 'ATFS13.rwl'))
+
+
+def test_curves_match_dense_solve(rwl):
+    indices, curves = detrend_spline(rwl.to_numpy(), return_curves=True)
+    for j, name in enumerate(rwl.columns):
+        series = rwl[name].dropna()
+        rows = rwl.index.get_indexer(series.index)
+        y = np.where(series.to_numpy() == 0, ZERO_WIDTH, series.to_numpy())
+        expected = reference_curve(y)
+        assert np.isnan(indices[np.setdiff1d(np.arange(len(rwl)), rows), j]).all()
+        if np.any(expected <= 0):
+            # 曲线有非正值的序列不去趋势 (ATFS1319)
+            assert np.isnan(indices[:, j]).all()
+            continue
+        np.testing.assert_allclose(curves[rows, j], expected, rtol=1e-8)
+        np.testing.assert_allclose(indices[rows, j], y / expected, rtol=1e-8)
+
+
+def test_fixed_stiffness_and_linear_series():
+    # 直线的二阶差分为0，样条就是直线本身
+    line = 2.0 + 0.01 * np.arange(60)
+    indices = detrend_spline(line, nyrs=20)
+    np.testing.assert_allclose(indices[:, 0], 1.0, rtol=1e-10)
+
+    rng = np.random.default_rng(2)
+    y = rng.lognormal(0.0, 0.3, 80) + np.linspace(3, 1, 80)
+    _, curves = detrend_spline(y, nyrs=32, return_curves=True)
+    np.testing.assert_allclose(curves[:, 0], reference_curve(y, nyrs=32), rtol=1e-8)
+
+
+def test_internal_gap_is_rejected():
+    # 首尾的NaN只是序列的起止年份；中间的缺测与 dplR.detrend 相同不允许
+    y = np.r_[np.nan, 2.0 + 0.01 * np.arange(30), np.nan]
+    assert np.isfinite(detrend_spline(y)[1:-1, 0]).all()
+    widths = np.column_stack([y, y])
+    widths[10, 1] = np.nan
+    with pytest.raises(ValueError, match=r'\[1\]'):
+        detrend_spline(widths)
+
+
+@r_fixture(DPLR_SPLINE)
+def test_detrend_matches_dplr_fixture(rwl):
+    reference = pd.read_csv(DPLR_SPLINE).set_index('Year')
+    np.testing.assert_array_equal(reference.index, rwl.index)
+    indices = detrend_spline(rwl[reference.columns].to_numpy())
+    np.testing.assert_allclose(indices, reference.to_numpy(dtype=float), rtol=1e-6, equal_nan=True)
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+diameter_engine 与原逐年循环 (process_tree_column) 的对比测试
+
+reference_tree_column 是 03d8ff7 版 plot_all_allometry.process_tree_column 的直径、
+增量和年龄部分的逐行移植 (生物量由传入的函数计算)，在 ATFS13.rwl 的所有样本上
+对每种 dbh_method / bark_method 组合比较。
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bark_dict_species import bark_dict_species
+from conftest import ROOT
+from diameter_engine import attach_biomass, biomass_requests, compute_site_diameters
+from tucson import read_tucson_frame
+
+SPECIES = 'FASY'
+REGION = 'europe'
+
+
+def fake_biomass(dbh):
+    return 0.1 * np.asarray(dbh, dtype=float) ** 2.4
+
+
+def reference_tree_column(pdf_sub, first_valid_idx, offset, dbh_method, bark_method,
+                          user_geometric_rate, user_bark_rate):
+    """原 process_tree_column 的逐年循环 (offset 为加在第一个有效年份上的宽度偏差)"""
+    pdf_sub = pdf_sub.copy()
+    y_start = first_valid_idx
+    y_end = pdf_sub.last_valid_index()
+    names = ['diameter', 'diameterr', 'diameterr_geo', 'diameterr_geo_bark', 'biomass', 'biomasss',
+             'delta_dia', 'delta_diaa', 'delta_bio', 'delta_bioo', 'age']
+    out = {name: pd.Series(np.nan, index=pdf_sub.index) for name in names}
+    diameter, diameterr = out['diameter'], out['diameterr']
+    diameterr_geo, diameterr_geo_bark = out['diameterr_geo'], out['diameterr_geo_bark']
+    age = out['age']
+
+    if pdf_sub[y_start] == 0:
+        pdf_sub[y_start] = 1e-8
+    pdf_sub_corrected = pdf_sub.copy()
+    pdf_sub_corrected[y_start] = pdf_sub_corrected[y_start] + offset
+
+    def correct(k):
+        if dbh_method == -1:
+            diameterr_geo[k] = diameterr[k]
+        elif dbh_method == 0:
+            diameterr_geo[k] = diameterr[k] * 0.998 + 22.3
+        elif dbh_method == 1:
+            diameterr_geo[k] = diameterr[k] * user_geometric_rate
+        if bark_method == -1:
+            diameterr_geo_bark[k] = diameterr_geo[k] + diameterr_geo[k] * user_bark_rate
+        elif bark_method == 0:
+            diameterr_geo_bark[k] = diameterr_geo[k]
+        elif bark_method == 1:
+            diameterr_geo_bark[k] = diameterr_geo[k] + bark_dict_species(REGION, SPECIES, diameterr_geo[k])
+
+    age[y_start] = 1
+    diameter[y_start] = (2 * pdf_sub[y_start]) / 10
+    diameterr[y_start] = (2 * pdf_sub_corrected[y_start]) / 10
+    correct(y_start)
+    for k in range(y_start + 1, y_end + 1):
+        if pd.isna(pdf_sub[k]):
+            continue
+        if pdf_sub[k] == 0:
+            pdf_sub[k] = 1e-8
+            if pdf_sub_corrected[k] == 0:
+                pdf_sub_corrected[k] = 1e-8
+        if not pd.isna(age[k - 1]):
+            age[k] = age[k - 1] + 1
+        diameter[k] = diameter[k - 1] + (2 * pdf_sub[k]) / 10
+        diameterr[k] = diameterr[k - 1] + (2 * pdf_sub_corrected[k]) / 10
+        correct(k)
+
+    out['delta_dia'][y_start] = diameter[y_start]
+    out['delta_diaa'][y_start] = diameterr_geo_bark[y_start]
+    for k in range(y_start + 1, y_end + 1):
+        if not pd.isna(diameter[k]) and not pd.isna(diameter[k - 1]):
+            out['delta_dia'][k] = diameter[k] - diameter[k - 1]
+        if not pd.isna(diameterr_geo_bark[k]) and not pd.isna(diameterr_geo_bark[k - 1]):
+            out['delta_diaa'][k] = diameterr_geo_bark[k] - diameterr_geo_bark[k - 1]
+
+    for source, target, delta in (('diameter', 'biomass', 'delta_bio'),
+                                  ('diameterr_geo_bark', 'biomasss', 'delta_bioo')):
+        valid = ~out[source].isna()
+        out[target][valid] = fake_biomass(out[source][valid].values)
+        out[delta][y_start] = out[target][y_start]
+        shifted = out[target].shift(1)
+        mask = ~out[target].isna() & ~shifted.isna()
+        out[delta][mask] = out[target][mask] - shifted[mask]
+    return out
+
+
+@pytest.fixture(scope='module')
+def site_widths():
+    frame = read_tucson_frame(os.path.join(ROOT, 'ATFS13.rwl'))
+    # process_tree_column 按行号索引 (read_tree_widths 重置了索引)
+    return frame.reset_index(drop=True)
+
+
+RESULT_KEYS = {
+    'diameter': 'diameter', 'diameterr': 'diameterr', 'diameterr_geo': 'diameterr_geo',
+    'diameterr_geo_bark': 'diameterr_geo_bark', 'biomass': 'biomass', 'biomasss': 'biomasss',
+    'delta_dia': 'delta_dia', 'delta_diaa': 'delta_diaa', 'delta_bio': 'delta_bio',
+    'delta_bioo': 'delta_bioo', 'age': 'age',
+}
+
+
+@pytest.mark.parametrize('dbh_method', [-1, 0, 1])
+@pytest.mark.parametrize('bark_method', [-1, 0, 1])
+def test_matches_process_tree_column(site_widths, dbh_method, bark_method):
+    n_series = site_widths.shape[1]
+    offsets = np.linspace(-0.5, 1.5, n_series)
+    geometric_rates = np.linspace(0.9, 1.2, n_series)
+    bark_rates = np.linspace(0.02, 0.08, n_series)
+
+    result = compute_site_diameters(site_widths.to_numpy(dtype=float), offsets, dbh_method, bark_method,
+                                    geometric_rates, bark_rates, SPECIES, REGION)
+    raw, corrected = biomass_requests(result)
+    attach_biomass(result, fake_biomass(raw), fake_biomass(corrected))
+
+    for i, column in enumerate(site_widths.columns):
+        series = site_widths[column]
+        expected = reference_tree_column(series, series.first_valid_index(), offsets[i], dbh_method,
+                                         bark_method, geometric_rates[i], bark_rates[i])
+        for name, key in RESULT_KEYS.items():
+            np.testing.assert_allclose(result[key][:, i], expected[name].to_numpy(), rtol=1e-12, atol=0,
+                                       err_msg=f"{column} {name}")
+
+
+def test_draw_dimension_matches_single_draws(site_widths):
+    widths = site_widths.to_numpy(dtype=float)
+    draws = np.array([-0.3, 0.0, 0.7])
+    offsets = np.repeat(draws[:, np.newaxis], widths.shape[1], axis=1)
+    batched = compute_site_diameters(widths, offsets, 0, -1, 1.0, 0.05)
+    assert batched['n_draws'] == 3
+    for d, value in enumerate(draws):
+        single = compute_site_diameters(widths, value, 0, -1, 1.0, 0.05)
+        for key in ('diameterr', 'diameterr_geo_bark', 'delta_diaa', 'diameter', 'age'):
+            np.testing.assert_array_equal(batched[key][d], single[key], err_msg=key)
+
+
+def test_gap_ends_the_series():
+    widths = np.array([[np.nan], [0.0], [1.0], [np.nan], [2.0]])
+    result = compute_site_diameters(widths)
+    assert result['start'][0] == 1
+    np.testing.assert_allclose(result['diameter'][:, 0], [np.nan, 2e-9, 0.2 + 2e-9, np.nan, np.nan])
+    np.testing.assert_array_equal(result['age'][:, 0], [np.nan, 1, 2, np.nan, np.nan])
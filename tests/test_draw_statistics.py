@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""draw_statistics 的测试: 流式统计与一次性计算每个随机值的 biweight 年表一致"""
+
+import numpy as np
+import pytest
+
+from chronology import site_chronology
+from draw_statistics import DrawStatistics, summarize_draws
+
+
+@pytest.fixture
+def draws():
+    rng = np.random.default_rng(1)
+    values = rng.lognormal(0.0, 0.5, size=(23, 40, 12))
+    # 每个随机值中有一个离群样本，biweight 与算术平均明显不同
+    values[:, :, 0] *= 50
+    # 样本起止年份不同，部分年份没有样本
+    values[:, :5, 3:] = np.nan
+    values[:, -3:, :] = np.nan
+    return values
+
+
+def test_stream_matches_per_draw_chronologies(draws):
+    years = np.arange(1900, 1940)
+    stats = DrawStatistics(years, ['bio'])
+    for start in range(0, len(draws), 5):
+        stats.update('bio', draws[start:start + 5])
+    frame = stats.to_frame('bio')
+
+    chronologies, depths = site_chronology(draws)
+    valid = ~np.isnan(chronologies[0])
+    assert frame['n_draws'].iloc[0] == len(draws)
+    np.testing.assert_allclose(frame['mean_bio'][valid], chronologies.mean(axis=0)[valid], rtol=1e-12)
+    np.testing.assert_allclose(frame['sd_bio'][valid], chronologies.std(axis=0, ddof=1)[valid], rtol=1e-9)
+    np.testing.assert_allclose(frame['min_bio'][valid], chronologies.min(axis=0)[valid])
+    np.testing.assert_allclose(frame['max_bio'][valid], chronologies.max(axis=0)[valid])
+    np.testing.assert_array_equal(frame['samp.depth'], depths.mean(axis=0))
+    assert frame['mean_bio'][~valid].isna().all()
+
+
+def test_stream_is_robust_to_outlier_series(draws):
+    stats = DrawStatistics(np.arange(40), ['bio'])
+    stats.update('bio', draws)
+    arithmetic = np.nanmean(draws[:, :-3], axis=2).mean(axis=0)
+    frame = stats.to_frame('bio')
+    # 离群样本把算术平均拉高数倍，biweight 年表不受影响
+    assert np.max(frame['mean_bio'].to_numpy()[:-3] / arithmetic) < 0.5
+
+
+def test_summary_percentiles_are_taken_over_per_draw_chronologies(draws):
+    years = np.arange(1900, 1940)
+    frame = summarize_draws(years, draws, 'bio', percentiles=(2.5, 50, 97.5))
+
+    chronologies, depths = site_chronology(draws)
+    valid = ~np.isnan(chronologies[0])
+    np.testing.assert_allclose(frame['mean_bio'][valid], chronologies.mean(axis=0)[valid], rtol=1e-12)
+    np.testing.assert_allclose(frame['sd_bio'][valid], chronologies.std(axis=0, ddof=1)[valid], rtol=1e-9)
+    for q in (2.5, 50, 97.5):
+        np.testing.assert_allclose(frame[f'p{q:g}_bio'][valid],
+                                   np.percentile(chronologies, q, axis=0)[valid], rtol=1e-12)
+    np.testing.assert_array_equal(frame['samp.depth'], depths.mean(axis=0))
+    assert frame['n_draws'].iloc[0] == len(draws)
+    assert frame['mean_bio'][~valid].isna().all()
+
+    # 与流式模式的均值相同
+    stats = DrawStatistics(years, ['bio'])
+    stats.update('bio', draws)
+    np.testing.assert_allclose(frame['mean_bio'], stats.to_frame('bio')['mean_bio'], rtol=1e-12)
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""sampling 抽样方法的测试"""
+
+import pytest
+
+import sampling
+
+
+@pytest.fixture(autouse=True)
+def restore_sampling(monkeypatch):
+    monkeypatch.setattr(sampling, '_SAMPLING_METHOD', 'uniform')
+    monkeypatch.setattr(sampling, '_SAMPLING_SEED', None)
+
+
+def test_changing_method_keeps_seed():
+    sampling.set_sampling_method('uniform', 42)
+    sampling.set_sampling_method('lhs')
+    assert sampling.get_sampling_method() == ('lhs', 42)
+
+    sampling.set_sampling_method('sobol', 7)
+    assert sampling.get_sampling_method() == ('sobol', 7)
+
+
+def test_seeded_draws_are_reproducible():
+    sampling.set_sampling_method('lhs', 3)
+    first = sampling.sample_initial_widths(-0.5, 0.5, 50, rng=sampling.make_sampler_rng())
+    sampling.set_sampling_method('lhs')
+    second = sampling.sample_initial_widths(-0.5, 0.5, 50, rng=sampling.make_sampler_rng())
+    assert first == second
+    assert len(set(first)) == 50
+
+
+@pytest.mark.parametrize('method', sampling.SAMPLING_METHODS)
+def test_draws_are_distinct_and_in_range(method):
+    values = sampling.sample_initial_widths(0.0, 0.02, 21, method=method, rng=sampling.make_sampler_rng(0))
+    assert sorted(values) == [round(k / 1000, 3) for k in range(21)]
+
+
+def test_too_many_draws_and_unknown_method_are_rejected():
+    with pytest.raises(ValueError):
+        sampling.sample_initial_widths(0.0, 0.01, 12)
+    with pytest.raises(ValueError):
+        sampling.set_sampling_method('halton')
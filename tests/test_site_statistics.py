@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""site_statistics 的测试: 相关系数、滑动窗口统计和 EPS 截断年份"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import site_statistics
+from site_statistics import (apply_year_cutoff, eps_cutoff_year, interseries_correlation,
+                             pairwise_correlations, rbar, running_statistics)
+
+
+def build_up_site(n_years=300, n_series=20, late_noise=False, seed=0):
+    """共同信号 + 噪声；序列逐渐加入 (早期样本量少)"""
+    rng = np.random.default_rng(seed)
+    signal = rng.normal(size=n_years)
+    values = signal[:, np.newaxis] + rng.normal(scale=1.2, size=(n_years, n_series))
+    starts = np.linspace(0, 150, n_series).astype(int)
+    for j, start in enumerate(starts):
+        values[:start, j] = np.nan
+    if late_noise:
+        # 最后一个窗口中共同信号消失 (如近期受干扰)，EPS 低于阈值
+        values[-40:] = rng.normal(size=(40, n_series))
+    return np.arange(1700, 1700 + n_years), values
+
+
+def test_pairwise_and_interseries_match_pandas():
+    _, values = build_up_site(120, 8)
+    frame = pd.DataFrame(values)
+    corr, overlap = pairwise_correlations(values, min_overlap=10)
+    expected = frame.corr(min_periods=10).to_numpy()
+    off_diagonal = ~np.eye(8, dtype=bool)
+    np.testing.assert_allclose(corr[off_diagonal], expected[off_diagonal], rtol=1e-10)
+    np.testing.assert_array_equal(overlap, frame.notna().astype(int).T @ frame.notna().astype(int))
+    assert rbar(values, 10) == pytest.approx(np.nanmean(expected[np.triu_indices(8, 1)]))
+
+    interseries = interseries_correlation(values, min_overlap=10)
+    for j in range(8):
+        others = frame.drop(columns=j).mean(axis=1)
+        assert interseries[j] == pytest.approx(frame[j].corr(others, min_periods=10), rel=1e-10, nan_ok=True)
+
+
+def test_running_statistics_batches_do_not_change_results(monkeypatch):
+    years, values = build_up_site()
+    whole = running_statistics(years, values)
+    # 每批只放一个窗口
+    monkeypatch.setattr(site_statistics, '_MAX_BATCH_ELEMENTS', 1)
+    batched = running_statistics(years, values)
+    pd.testing.assert_frame_equal(whole, batched)
+
+    first = whole.iloc[3]
+    window = values[75:125]
+    assert first['start_year'] == 1775 and first['end_year'] == 1824
+    assert first['rbar'] == pytest.approx(rbar(window, 30))
+
+
+def test_cutoff_follows_replication_build_up():
+    years, values = build_up_site()
+    running = running_statistics(years, values)
+    cutoff = eps_cutoff_year(years, values)
+    passed = running['eps'] >= 0.85
+    assert not passed.iloc[0] and passed.iloc[-1]
+    row = running.index[running['mid_year'] == cutoff][0]
+    assert passed.iloc[row:].all() and not passed.iloc[row - 1]
+
+
+def test_late_failing_window_does_not_discard_cutoff():
+    years, values = build_up_site(late_noise=True)
+    running = running_statistics(years, values)
+    assert running['eps'].iloc[-1] < 0.85
+    cutoff = eps_cutoff_year(years, values)
+    assert cutoff is not None
+    # 与后期没有干扰时的截断年份相同
+    assert cutoff == eps_cutoff_year(*build_up_site())
+
+
+def test_no_passing_window_and_year_cutoff():
+    rng = np.random.default_rng(3)
+    assert eps_cutoff_year(np.arange(100), rng.normal(size=(100, 4))) is None
+
+    frame = pd.DataFrame({'Year': [1, 2, 3], 'mean_bio': [1.0, 2.0, 3.0], 'samp.depth': [1, 2, 3], 'n_draws': 5})
+    cut = apply_year_cutoff(frame, 2)
+    assert np.isnan(cut['mean_bio'][0]) and cut['samp.depth'][0] == 0 and cut['n_draws'][0] == 5
+    assert cut['mean_bio'][1:].tolist() == [2.0, 3.0]
+    assert apply_year_cutoff(frame, None) is frame
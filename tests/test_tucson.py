@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""tucson 读取 Tucson 格式文件的测试"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import FIXTURES, ROOT
+from tucson import read_tucson, read_tucson_frame
+
+# dplR::read.tucson 读取仓库中 ITRDB 文件的结果，由 tests/fixtures/make_tucson_fixtures.py
+# 从旧流程 (r['read.tucson']) 保存的输出还原
+READ_TUCSON_FIXTURES = {
+    'or092_read_tucson.csv': os.path.join('metadata', 'data', 'northamerica', 'usa', 'or092.rwl'),
+    'bol001_read_tucson.csv': os.path.join('metadata', 'data', 'southamerica', 'bol001.rwl'),
+}
+
+
+def decade_line(name, year, values, id_width=8, year_width=4):
+    """按 Tucson 固定列宽写一行: 序列名、年份、每个值6列"""
+    return f"{name:<{id_width}}{year:>{year_width}}" + ''.join(f"{v:>6}" for v in values)
+
+
+def write_rwl(tmp_path, lines, name='site.rwl'):
+    path = tmp_path / name
+    path.write_text('\n'.join(lines) + '\n')
+    return str(path)
+
+
+HEADER = [
+    'TST001 1 Test Site                                          PIAB               ',
+    'TST001 2 Somewhere    Norway Spruce     1000M  1000-01000    __    1990 1995    ',
+    'TST001 3 Nobody                                                                ',
+]
+
+
+def test_header_is_detected(tmp_path):
+    data = [decade_line('TST01A', 1990, [100, 120, 140, 160, 180, 200, 220, 240, 260, 280]),
+            decade_line('TST01A', 2000, [300, 999])]
+    with_header = read_tucson(write_rwl(tmp_path, HEADER + data, 'a.rwl'))
+    without_header = read_tucson(write_rwl(tmp_path, data, 'b.rwl'))
+    for years, names, values in (with_header, without_header):
+        assert names == ['TST01A']
+        np.testing.assert_array_equal(years, np.arange(1990, 2001))
+        np.testing.assert_allclose(values[:, 0], np.arange(1.0, 3.01, 0.2))
+    # 明确指定没有文件头时，头信息行按损坏的行跳过 (年份无法解析)
+    with pytest.warns(UserWarning):
+        years, _, _ = read_tucson(write_rwl(tmp_path, HEADER + data, 'c.rwl'), header=False)
+    assert years[0] == 1990
+
+
+def test_stop_marker_sets_precision(tmp_path):
+    lines = [decade_line('HUND01', 1950, [150, 0, 25, 999]),
+             decade_line('THOU01', 1951, [1500, 250, 0, -9999]),
+             decade_line('NONE01', 1950, [40, 60])]
+    years, names, values = read_tucson(write_rwl(tmp_path, lines))
+    np.testing.assert_array_equal(years, np.arange(1950, 1954))
+    assert names == ['HUND01', 'THOU01', 'NONE01']
+    np.testing.assert_allclose(values[:, 0], [1.5, 0.0, 0.25, np.nan])
+    np.testing.assert_allclose(values[:, 1], [np.nan, 1.5, 0.25, 0.0])
+    # 没有结束标记时按0.01mm处理
+    np.testing.assert_allclose(values[:, 2], [0.4, 0.6, np.nan, np.nan])
+
+
+def test_long_format_for_bce_years(tmp_path):
+    lines = [decade_line('LONG01', -1205, [10, 20, 30, 40, 50], id_width=7, year_width=5),
+             decade_line('LONG01', -1200, [60, 70, 999], id_width=7, year_width=5)]
+    years, names, values = read_tucson(write_rwl(tmp_path, lines))
+    assert names == ['LONG01']
+    np.testing.assert_array_equal(years, np.arange(-1205, -1198))
+    np.testing.assert_allclose(values[:, 0], np.arange(1, 8) / 10)
+
+
+def test_comment_and_corrupt_lines_are_skipped(tmp_path):
+    lines = ['# exported by hand',
+             decade_line('SKIP01', 1800, [100, 110, 120]),
+             '#### end of block',
+             'SKIP01  18x0   130   140',
+             decade_line('SKIP01', 1803, [130, 999])]
+    with pytest.warns(UserWarning, match='跳过'):
+        years, names, values = read_tucson(write_rwl(tmp_path, lines))
+    assert names == ['SKIP01']
+    np.testing.assert_allclose(values[:, 0], [1.0, 1.1, 1.2, 1.3])
+
+
+def test_negative_width_is_read_as_zero(tmp_path):
+    lines = [decade_line('NEG001', 1900, [1500, -646, 250, -9999])]
+    _, _, values = read_tucson(write_rwl(tmp_path, lines))
+    np.testing.assert_allclose(values[:, 0], [1.5, 0.0, 0.25])
+
+
+def test_file_without_ring_widths_raises(tmp_path):
+    # 只有文件头和说明文字 (如 metadata/data/northamerica/usa/ut528.rwl)
+    for path in (os.path.join(ROOT, 'metadata', 'data', 'northamerica', 'usa', 'ut528.rwl'),
+                 write_rwl(tmp_path, HEADER + ['', 'The data set will be re-posted to the ITRDB.'])):
+        with pytest.warns(UserWarning), pytest.raises(ValueError):
+            read_tucson(path)
+
+
+@pytest.mark.parametrize('fixture', sorted(READ_TUCSON_FIXTURES))
+def test_matches_dplr_read_tucson(fixture):
+    reference = pd.read_csv(os.path.join(FIXTURES, fixture), index_col='Year')
+    frame = read_tucson_frame(os.path.join(ROOT, READ_TUCSON_FIXTURES[fixture]))
+    np.testing.assert_array_equal(frame.index, reference.index)
+    assert list(frame.columns) == list(reference.columns)
+    np.testing.assert_allclose(frame.to_numpy(), reference.to_numpy(dtype=float), rtol=0, atol=1e-9)
+
+
+def test_bundled_site_frame():
+    frame = read_tucson_frame(os.path.join(ROOT, 'ATFS13.rwl'))
+    assert frame.shape == (254, 22)
+    assert frame.index[0] == 1762 and frame.index.is_monotonic_increasing
+    assert frame.notna().any().all()
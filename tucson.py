@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tucson (.rwl) 年轮宽度文件读取 (纯 Python/NumPy 实现)
+
+所有处理流程 (plot_allometry、plot_allometry_species、plot_all、plot_age_only、
+配置对话框中的 show_samples 和 select_csv) 都从 r['read.tucson'](文件) 和
+pandas2ri.rpy2py 转换开始，只为读取一个文本文件就要启动 R 会话。本模块按
+dplR::read.tucson 的规则直接解析:
+
+- 文件头: 第一行的第9-12列不是整数年份，或其后的6个数值字段不是数字时，
+  认为文件有3行头信息 (ITRDB 文件，如 metadata/data/africa/mar042.rwl)，跳过3行；
+- 数据行: 第1-8列为序列名，第9-12列为该行第一个值的年份，之后每6列一个值；
+  长格式 (dplR 的 long = TRUE) 为7列序列名和5列年份，用于公元前的年份
+  (如 '0180039-3707')，自动检测: 有数据行的第8列为负号时使用长格式；
+- 结束标记: 999 表示精度为0.01mm，-9999 表示精度为0.001mm，序列的值除以
+  100 或 1000 得到毫米；没有结束标记的序列按0.01mm处理；
+- 序列首尾的0保留 (dplR 的 edge.zeros = TRUE)；结束标记以外的负值按0处理，
+  与 read.tucson 的结果相同 (如 bol001.rwl 中 inp130b 1906 年的 -646，见 tests/test_tucson.py)；
+- 年份字段无法解析的行 (注释、损坏的行) 给出警告并跳过；
+- 年份为所有序列的最早年份到最晚年份，序列按第一次出现的顺序排列；
+- 没有年轮宽度数据的文件 (如只有文件头和说明文字的
+  metadata/data/northamerica/usa/ut528.rwl，与 dplR 相同) 抛出 ValueError。
+
+读取方式: 'native' (默认，本模块) 或 'r' (dplR::read.tucson)，
+用 set_rwl_reader 或环境变量 TR_SNP_RWL_READER 选择。
+"""
+
+import os
+import re
+import warnings
+
+import numpy as np
+import pandas as pd
+
+# 读取方式: 'native' 使用本模块，'r' 使用 dplR::read.tucson
+RWL_READERS = ('native', 'r')
+_RWL_READER = os.environ.get('TR_SNP_RWL_READER', 'native')
+
+# 结束标记 -> 精度的倒数
+STOP_MARKERS = {999: 100, -9999: 1000}
+DEFAULT_PRECISION_RECIPROCAL = 100
+HEADER_LINES = 3
+
+_ID_WIDTH = 8
+_YEAR_WIDTH = 4
+_VALUE_WIDTH = 6
+_VALUES_PER_LINE = 10
+
+
+def set_rwl_reader(reader):
+    """
+    选择 RWL 文件的读取方式
+
+    参数:
+    reader: 'native' (默认) 或 'r'
+    """
+    global _RWL_READER
+    if reader not in RWL_READERS:
+        raise ValueError(f"未知的RWL读取方式: {reader}，可选: {', '.join(RWL_READERS)}")
+    _RWL_READER = reader
+
+
+def get_rwl_reader():
+    """返回当前的 RWL 读取方式"""
+    return _RWL_READER
+
+
+def _parse_int(text):
+    text = text.strip()
+    if not text:
+        return None
+    try:
+        return int(text)
+    except ValueError:
+        return None
+
+
+def _is_long_line(line):
+    """第8列为负号、其后为数字: 长格式 (7列序列名 + 5列年份)"""
+    return len(line) > _ID_WIDTH and line[_ID_WIDTH - 1] == '-' and line[_ID_WIDTH].isdigit()
+
+
+def _is_data_line(line):
+    """与 dplR 相同的文件头检测: 年份字段为整数且其后6个字段为数字"""
+    year = _parse_int(line[_ID_WIDTH:_ID_WIDTH + _YEAR_WIDTH])
+    if year is None or not -1e4 <= year <= 1e4:
+        return False
+    start = _ID_WIDTH + _YEAR_WIDTH
+    for k in range(6):
+        field = line[start + k * _VALUE_WIDTH:start + (k + 1) * _VALUE_WIDTH]
+        if field.strip() and _parse_int(field) is None:
+            return False
+    return True
+
+
+def read_tucson(path, header=None, long=None):
+    """
+    读取 Tucson 格式的年轮宽度文件
+
+    参数:
+    path: 文件路径
+    header: 文件是否有3行头信息；None时自动检测
+    long: 是否为长格式 (7列序列名 + 5列年份)；None时自动检测
+
+    返回:
+    (years, series, values): 年份数组，序列名列表，(年份, 序列) 宽度数组 (mm，缺测为NaN)
+
+    文件中没有年轮宽度数据时抛出 ValueError
+    """
+    with open(path, 'rb') as f:
+        raw = f.read()
+    # 按字符 (不是字节) 计算列位置: 序列名中有 UTF-8 字符时列位置仍然正确
+    try:
+        text = raw.decode('utf-8')
+    except UnicodeDecodeError:
+        text = raw.decode('latin-1')
+    # 行结束符可能是 \r\n、\n 或 \r (旧的 Mac 文件)；\x1a 为 DOS 文件结束符
+    lines = [line.rstrip('\x1a') for line in re.split(r'\r\n|\r|\n', text)]
+    lines = [line for line in lines if line.strip() and not line.startswith('#')]
+    if not lines:
+        raise ValueError(f"{path} 中没有数据")
+    if header is None:
+        header = not _is_data_line(lines[0])
+    if header:
+        lines = lines[HEADER_LINES:]
+    if long is None:
+        long = any(_is_long_line(line) for line in lines)
+    id_width = _ID_WIDTH - 1 if long else _ID_WIDTH
+
+    # 每条序列: 年份列表、原始整数值列表、精度的倒数 (见到结束标记后不再读取)
+    series = {}
+    for number, line in enumerate(lines, HEADER_LINES + 1 if header else 1):
+        name = line[:id_width].strip()
+        year = _parse_int(line[id_width:_ID_WIDTH + _YEAR_WIDTH])
+        if year is None:
+            # 注释或损坏的行 (如 '#### end ...')
+            warnings.warn(f"{path} 第{number}行的年份无法解析，已跳过: {line!r}")
+            continue
+        entry = series.setdefault(name, {'years': [], 'values': [], 'prec': None})
+        if entry['prec'] is not None:
+            continue
+        start = _ID_WIDTH + _YEAR_WIDTH
+        for k in range(_VALUES_PER_LINE):
+            value = _parse_int(line[start + k * _VALUE_WIDTH:start + (k + 1) * _VALUE_WIDTH])
+            if value is None:
+                break
+            if value in STOP_MARKERS:
+                entry['prec'] = STOP_MARKERS[value]
+                break
+            entry['years'].append(year + k)
+            entry['values'].append(max(value, 0))
+
+    names = [name for name, entry in series.items() if entry['years']]
+    if not names:
+        raise ValueError(f"{path} 中没有年轮宽度数据")
+    first = min(min(series[name]['years']) for name in names)
+    last = max(max(series[name]['years']) for name in names)
+    years = np.arange(first, last + 1)
+    values = np.full((len(years), len(names)), np.nan)
+    for j, name in enumerate(names):
+        entry = series[name]
+        values[np.asarray(entry['years']) - first, j] = (
+            np.asarray(entry['values'], dtype=float) / (entry['prec'] or DEFAULT_PRECISION_RECIPROCAL))
+    return years, names, values
+
+
+def read_tucson_frame(path, header=None, long=None):
+    """
+    读取 Tucson 文件为 DataFrame (与 pandas2ri.rpy2py(read.tucson(文件)) 的列相同)
+
+    返回:
+    以年份为索引、每条序列一列的 DataFrame
+    """
+    years, names, values = read_tucson(path, header, long)
+    return pd.DataFrame(values, index=years, columns=names)
+
+
+def read_rwl(path):
+    """
+    按当前读取方式读取 RWL 文件
+
+    返回:
+    以年份 (int) 为索引、每条序列一列的 DataFrame
+    """
+    if _RWL_READER == 'native':
+        return read_tucson_frame(path)
+
+    import rpy2.robjects
+    from rpy2.robjects import r, pandas2ri
+    from rpy2.robjects.conversion import localconverter
+
+    TR_input = r['read.tucson'](path)
+    with localconverter(rpy2.robjects.default_converter + pandas2ri.converter):
+        frame = pandas2ri.rpy2py(TR_input)
+    frame.index = [int(float(year)) for year in frame.index]
+    return frame